@@ -0,0 +1,189 @@
+# benchmarks/backend.py
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from botocore.awsrequest import AWSResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 1000
+_PARAMS_KEY = "benchmark_params"
+
+
+def _page(items, params, token_key, page_size):
+    """Slice items for a paginated call; tokens are plain offsets."""
+    start = int(params.get(token_key) or 0)
+    limit = params.get("MaxResults") or params.get("MaxRecords") or params.get("PageSize") or page_size
+    end = start + limit
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+def _matches_filters(filters, values):
+    return all(values.get(f["Name"]) in f["Values"] for f in filters or [])
+
+
+class EstateBackend:
+    """
+    Serve a generated Estate to real botocore clients, moto-style, without network access.
+
+    Handlers hook botocore's before-call event (as Stubber does), so parameter validation,
+    paginators, retries accounting and the metrics hooks all run as they would against AWS.
+    Every call sleeps for the configured latency to model API round trips.
+    """
+
+    def __init__(self, estate, latency=0.0, page_size=DEFAULT_PAGE_SIZE):
+        self.estate = estate
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._handlers = {
+            ("ec2", "DescribeAvailabilityZones"): self._describe_availability_zones,
+            ("ec2", "DescribeVolumes"): self._describe_volumes,
+            ("ec2", "DescribeInstances"): self._describe_instances,
+            ("cloudwatch", "GetMetricData"): self._get_metric_data,
+            ("elbv2", "DescribeLoadBalancers"): self._describe_elbv2,
+            ("elbv2", "DescribeTags"): self._describe_elbv2_tags,
+            ("elbv2", "DescribeListeners"): self._describe_listeners,
+            ("elbv2", "DescribeTargetGroups"): self._describe_target_groups,
+            ("elbv2", "DescribeTargetHealth"): self._describe_target_health,
+            ("elb", "DescribeLoadBalancers"): self._describe_classic,
+            ("elb", "DescribeTags"): self._describe_classic_tags,
+            ("rds", "DescribeDBClusters"): self._describe_db_clusters,
+            ("rds", "DescribeDBInstances"): self._describe_db_instances,
+            ("rds", "ListTagsForResource"): self._list_rds_tags,
+            ("s3", "PutObject"): lambda params: {"ETag": '"benchmark"'},
+            ("sns", "Publish"): lambda params: {"MessageId": str(uuid.uuid4())},
+        }
+
+    def install(self, session):
+        """Route every client later created from session (boto3 or botocore) to this backend."""
+        events = getattr(session, "events", None) or session.get_component("event_emitter")
+        events.register_first("before-parameter-build.*.*", self._capture_params)
+        events.register_first("before-call.*.*", self._respond)
+
+    def _capture_params(self, params, context, **kwargs):
+        context[_PARAMS_KEY] = dict(params)
+
+    def _respond(self, model, context, **kwargs):
+        service = model.service_model.service_name
+        handler = self._handlers.get((service, model.name))
+        if handler is None:
+            raise NotImplementedError(f"Benchmark backend does not serve {service}.{model.name}")
+
+        with self._lock:
+            self.calls[f"{service}.{model.name}"] = self.calls.get(f"{service}.{model.name}", 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = handler(context.get(_PARAMS_KEY, {}))
+        parsed["ResponseMetadata"] = {"HTTPStatusCode": 200, "RetryAttempts": 0}
+        return AWSResponse(None, 200, {}, None), parsed
+
+    # EC2
+
+    def _describe_availability_zones(self, params):
+        zones = {v["AvailabilityZone"] for v in self.estate.volumes}
+        zones.update(i["Placement"]["AvailabilityZone"] for i in self.estate.instances)
+        return {"AvailabilityZones": [{"ZoneName": zone, "State": "available"} for zone in sorted(zones)]}
+
+    def _describe_volumes(self, params):
+        volumes = [
+            v for v in self.estate.volumes
+            if _matches_filters(params.get("Filters"), {"status": v["State"], "availability-zone": v["AvailabilityZone"]})
+        ]
+        page, token = _page(volumes, params, "NextToken", self.page_size)
+        return {"Volumes": page, **({"NextToken": token} if token else {})}
+
+    def _describe_instances(self, params):
+        instances = [
+            i for i in self.estate.instances
+            if _matches_filters(
+                params.get("Filters"),
+                {"instance-state-name": i["State"]["Name"], "availability-zone": i["Placement"]["AvailabilityZone"]},
+            )
+        ]
+        page, token = _page(instances, params, "NextToken", self.page_size)
+        # Real responses group instances into reservations of varying size
+        reservations = [{"Instances": page[n:n + 5]} for n in range(0, len(page), 5)]
+        return {"Reservations": reservations, **({"NextToken": token} if token else {})}
+
+    # CloudWatch
+
+    def _series(self, namespace, dimensions):
+        value = dimensions[0]["Value"] if dimensions else None
+        if namespace == "AWS/EC2":
+            return self.estate.cpu.get(value, [])
+        return self.estate.lb_traffic.get(value, [])
+
+    def _get_metric_data(self, params):
+        # A series holds one value per day, ending yesterday (UTC); serve the days the range overlaps
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start, end = params["StartTime"], params["EndTime"]
+        results = []
+        for query in params["MetricDataQueries"]:
+            metric = query["MetricStat"]["Metric"]
+            values = self._series(metric["Namespace"], metric.get("Dimensions"))
+            days = [today - timedelta(days=len(values) - n) for n in range(len(values))]
+            served = [(day, v) for day, v in zip(days, values) if day < end and day + timedelta(days=1) > start]
+            if query["MetricStat"].get("Period") == 3600:
+                # Hourly queries see each day's value in every hour of that day
+                hours = ((day + timedelta(hours=h), v) for day, v in served for h in range(24))
+                served = [(hour, v) for hour, v in hours if start <= hour < end]
+            results.append({
+                "Id": query["Id"],
+                "Timestamps": [day for day, _ in served],
+                "Values": [v for _, v in served],
+                "StatusCode": "Complete",
+            })
+        return {"MetricDataResults": results}
+
+    # Load balancers
+
+    def _describe_elbv2(self, params):
+        page, token = _page(self.estate.load_balancers, params, "Marker", self.page_size)
+        return {"LoadBalancers": page, **({"NextMarker": token} if token else {})}
+
+    def _describe_elbv2_tags(self, params):
+        return {"TagDescriptions": [
+            {"ResourceArn": arn, "Tags": self.estate.lb_tags.get(arn, [])} for arn in params["ResourceArns"]
+        ]}
+
+    def _describe_listeners(self, params):
+        page, token = _page(self.estate.listeners.get(params["LoadBalancerArn"], []), params, "Marker", self.page_size)
+        return {"Listeners": page, **({"NextMarker": token} if token else {})}
+
+    def _describe_target_groups(self, params):
+        groups = self.estate.target_groups
+        if params.get("LoadBalancerArn"):
+            groups = [g for g in groups if params["LoadBalancerArn"] in g["LoadBalancerArns"]]
+        page, token = _page(groups, params, "Marker", self.page_size)
+        return {"TargetGroups": page, **({"NextMarker": token} if token else {})}
+
+    def _describe_target_health(self, params):
+        return {"TargetHealthDescriptions": self.estate.target_health.get(params["TargetGroupArn"], [])}
+
+    def _describe_classic(self, params):
+        page, token = _page(self.estate.classic_load_balancers, params, "Marker", self.page_size)
+        return {"LoadBalancerDescriptions": page, **({"NextMarker": token} if token else {})}
+
+    def _describe_classic_tags(self, params):
+        return {"TagDescriptions": [
+            {"LoadBalancerName": name, "Tags": self.estate.classic_tags.get(name, [])}
+            for name in params["LoadBalancerNames"]
+        ]}
+
+    # RDS
+
+    def _describe_db_clusters(self, params):
+        page, token = _page(self.estate.db_clusters, params, "Marker", self.page_size)
+        return {"DBClusters": page, **({"Marker": token} if token else {})}
+
+    def _describe_db_instances(self, params):
+        page, token = _page(self.estate.db_instances, params, "Marker", self.page_size)
+        return {"DBInstances": page, **({"Marker": token} if token else {})}
+
+    def _list_rds_tags(self, params):
+        return {"TagList": self.estate.rds_tags.get(params["ResourceName"], [])}
@@ -0,0 +1,217 @@
+# benchmarks/estate.py
+import random
+from datetime import datetime, timedelta, timezone
+
+# Share of the estate per resource family
+MIX = {"volumes": 0.35, "instances": 0.40, "load_balancers": 0.10, "rds": 0.15}
+
+# Probability that each required tag is present (matches what a typical estate looks like)
+TAG_PRESENCE = {"owner": 0.7, "env": 0.8, "cost-center": 0.5}
+OWNERS = ["platform", "data", "payments", "search", "ml", "web"]
+ENVS = ["prod", "staging", "dev", "sandbox"]
+
+VOLUME_TYPES = ["gp3", "gp2", "io1", "st1", "sc1"]
+INSTANCE_TYPES = ["t3.micro", "t3.small", "t3.medium", "m5.large", "m5.xlarge", "c5.large", "r5.large"]
+DB_CLASSES = ["db.t3.medium", "db.r5.large", "db.m5.large"]
+ENGINES = ["postgres", "mysql", "aurora-postgresql"]
+
+# Fractions of each family that the scanners should flag
+UNATTACHED_VOLUMES = 0.30
+RUNNING_INSTANCES = 0.80
+IDLE_INSTANCES = 0.25
+NO_METRIC_INSTANCES = 0.02
+UNUSED_LOAD_BALANCERS = 0.30
+STOPPED_RDS = 0.20
+CLASSIC_LOAD_BALANCERS = 0.25
+NETWORK_LOAD_BALANCERS = 0.25
+
+ACCOUNT_ID = "123456789012"
+
+
+def _tags(rng, name):
+    tags = [{"Key": "Name", "Value": name}]
+    if rng.random() < TAG_PRESENCE["owner"]:
+        tags.append({"Key": "owner", "Value": rng.choice(OWNERS)})
+    if rng.random() < TAG_PRESENCE["env"]:
+        tags.append({"Key": "env", "Value": rng.choice(ENVS)})
+    if rng.random() < TAG_PRESENCE["cost-center"]:
+        tags.append({"Key": "cost-center", "Value": str(rng.randint(1000, 9999))})
+    return tags
+
+
+def _split(total):
+    counts = {family: int(total * share) for family, share in MIX.items()}
+    counts["volumes"] += total - sum(counts.values())
+    return counts
+
+
+class Estate:
+    """A generated AWS estate in describe-API response shapes, plus its metric series."""
+
+    def __init__(self, region):
+        self.region = region
+        self.volumes = []
+        self.instances = []
+        self.cpu = {}  # instance id -> daily average CPU datapoints
+        self.load_balancers = []  # ELBv2 LoadBalancers entries
+        self.classic_load_balancers = []  # Classic LoadBalancerDescriptions entries
+        self.lb_tags = {}  # ELBv2 ARN -> Tags
+        self.classic_tags = {}  # Classic load balancer name -> Tags
+        self.listeners = {}  # ELBv2 ARN -> Listeners
+        self.target_groups = []  # ELBv2 TargetGroups entries
+        self.target_health = {}  # target group ARN -> TargetHealthDescriptions
+        self.lb_traffic = {}  # CloudWatch dimension value -> daily sums (empty when unused)
+        self.db_clusters = []
+        self.db_instances = []
+        self.rds_tags = {}  # ARN -> TagList
+
+    @property
+    def size(self):
+        return (
+            len(self.volumes) + len(self.instances) + len(self.load_balancers)
+            + len(self.classic_load_balancers) + len(self.db_clusters) + len(self.db_instances)
+        )
+
+    def expected(self):
+        """Counts the scanners should report for this estate."""
+        return {
+            "EBS": sum(1 for v in self.volumes if v["State"] == "available"),
+            "EC2": sum(
+                1 for i in self.instances
+                if i["State"]["Name"] == "running" and self.cpu[i["InstanceId"]]
+                and sum(self.cpu[i["InstanceId"]]) / len(self.cpu[i["InstanceId"]]) < 2
+            ),
+            "ELB": sum(1 for values in self.lb_traffic.values() if not values),
+            "RDS": sum(1 for c in self.db_clusters if c["Status"] == "stopped")
+            + sum(1 for i in self.db_instances if i["DBInstanceStatus"] == "stopped"),
+        }
+
+
+def _add_listeners_and_targets(estate, arn, name, n, unused):
+    """
+    Give an ALB/NLB its listener and target group. Unused load balancers cycle through
+    having no listener, a target group without targets, and a normal setup with no traffic,
+    so the structural prefilters and the metric check each have work. Derived from n rather
+    than the random stream so estates from earlier seeds keep their contents.
+    """
+    shape = n % 3 if unused else 2
+    if shape == 0:
+        estate.listeners[arn] = []
+        return
+    estate.listeners[arn] = [{"ListenerArn": arn.replace(":loadbalancer/", ":listener/") + "/1", "Port": 443}]
+    group_arn = arn.split(":loadbalancer/")[0] + f":targetgroup/{name}/{n:016x}"
+    estate.target_groups.append({"TargetGroupArn": group_arn, "LoadBalancerArns": [arn]})
+    estate.target_health[group_arn] = [] if shape == 1 else [
+        {"Target": {"Id": f"10.0.{n // 250 % 256}.{n % 250 + 1}", "Port": 443}, "TargetHealth": {"State": "healthy"}}
+    ]
+
+
+def generate_estate(total, seed=0, region="us-east-1", days=7):
+    """
+    Generate a deterministic estate of about total resources for region.
+    The same (total, seed) always yields the same estate.
+    """
+    rng = random.Random(seed)
+    counts = _split(total)
+    azs = [f"{region}{suffix}" for suffix in "abc"]
+    launched = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    estate = Estate(region)
+
+    for n in range(counts["volumes"]):
+        volume_id = f"vol-{n:017x}"
+        estate.volumes.append({
+            "VolumeId": volume_id,
+            "Size": rng.choice([8, 20, 50, 100, 500, 1000]),
+            "VolumeType": rng.choice(VOLUME_TYPES),
+            "State": "available" if rng.random() < UNATTACHED_VOLUMES else "in-use",
+            "AvailabilityZone": rng.choice(azs),
+            "CreateTime": launched,
+            "Tags": _tags(rng, volume_id),
+        })
+
+    for n in range(counts["instances"]):
+        instance_id = f"i-{n:017x}"
+        running = rng.random() < RUNNING_INSTANCES
+        estate.instances.append({
+            "InstanceId": instance_id,
+            "InstanceType": rng.choice(INSTANCE_TYPES),
+            "State": {"Name": "running" if running else "stopped"},
+            "Placement": {"AvailabilityZone": rng.choice(azs)},
+            "LaunchTime": launched + timedelta(days=rng.randint(0, 300)),
+            "Tags": _tags(rng, instance_id),
+        })
+        roll = rng.random()
+        if roll < NO_METRIC_INSTANCES:
+            estate.cpu[instance_id] = []
+        elif roll < NO_METRIC_INSTANCES + IDLE_INSTANCES:
+            estate.cpu[instance_id] = [round(rng.uniform(0.1, 1.9), 2) for _ in range(days)]
+        else:
+            estate.cpu[instance_id] = [round(rng.uniform(5, 90), 2) for _ in range(days)]
+
+    for n in range(counts["load_balancers"]):
+        name = f"lb-{n:06d}"
+        unused = rng.random() < UNUSED_LOAD_BALANCERS
+        roll = rng.random()
+        az = rng.choice(azs)
+        if roll < CLASSIC_LOAD_BALANCERS:
+            members = []
+            if not unused and estate.instances:
+                members = [{"InstanceId": rng.choice(estate.instances)["InstanceId"]}]
+            estate.classic_load_balancers.append({
+                "LoadBalancerName": name,
+                "Scheme": "internet-facing",
+                "AvailabilityZones": [az],
+                "Instances": members,
+                "CreatedTime": launched,
+            })
+            # Drawn from a per-name generator so the shared stream, and every later resource, is unchanged
+            estate.classic_tags[name] = _tags(random.Random(f"{seed}:{name}"), name)
+            dimension = name
+        else:
+            lb_type = "network" if roll < CLASSIC_LOAD_BALANCERS + NETWORK_LOAD_BALANCERS else "application"
+            prefix = "net" if lb_type == "network" else "app"
+            suffix = f"{prefix}/{name}/{n:016x}"
+            arn = f"arn:aws:elasticloadbalancing:{region}:{ACCOUNT_ID}:loadbalancer/{suffix}"
+            estate.load_balancers.append({
+                "LoadBalancerArn": arn,
+                "LoadBalancerName": name,
+                "Type": lb_type,
+                "Scheme": "internet-facing",
+                "AvailabilityZones": [{"ZoneName": az}],
+                "CreatedTime": launched,
+            })
+            estate.lb_tags[arn] = _tags(rng, name)
+            _add_listeners_and_targets(estate, arn, name, n, unused)
+            dimension = suffix
+        estate.lb_traffic[dimension] = [] if unused else [float(rng.randint(1, 10000)) for _ in range(days)]
+
+    for n in range(counts["rds"]):
+        stopped = rng.random() < STOPPED_RDS
+        engine = rng.choice(ENGINES)
+        if engine.startswith("aurora"):
+            identifier = f"cluster-{n:06d}"
+            arn = f"arn:aws:rds:{region}:{ACCOUNT_ID}:cluster:{identifier}"
+            record = {
+                "DBClusterIdentifier": identifier,
+                "DBClusterArn": arn,
+                "Status": "stopped" if stopped else "available",
+                "Engine": engine,
+                "AvailabilityZones": rng.sample(azs, 2),
+            }
+            estate.db_clusters.append(record)
+        else:
+            identifier = f"db-{n:06d}"
+            arn = f"arn:aws:rds:{region}:{ACCOUNT_ID}:db:{identifier}"
+            record = {
+                "DBInstanceIdentifier": identifier,
+                "DBInstanceArn": arn,
+                "DBInstanceStatus": "stopped" if stopped else "available",
+                "DBInstanceClass": rng.choice(DB_CLASSES),
+                "Engine": engine,
+                "AvailabilityZone": rng.choice(azs),
+            }
+            estate.db_instances.append(record)
+        # describe_db_* return tags inline, as the real API does
+        record["TagList"] = estate.rds_tags[arn] = _tags(rng, identifier)
+
+    return estate
@@ -0,0 +1,213 @@
+# benchmarks/run.py
+"""
+Benchmark the full handler pipeline against seeded synthetic estates.
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --latency-ms 5
+    python -m benchmarks.run --sizes 1000 --compare benchmarks/results/baseline.json
+    python -m benchmarks.run --sizes 10000 --record benchmarks/results/estate-10k.jsonl.gz
+    python -m benchmarks.run --sizes 10000 --replay benchmarks/results/estate-10k.jsonl.gz --latency-scale 0
+
+Each size runs in a fresh interpreter so peak RSS is measured per estate size.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import boto3
+
+from benchmarks.backend import EstateBackend
+from benchmarks.estate import generate_estate
+from utils.cassette import Recorder, Replayer
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_SEED = 42
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+BENCHMARK_ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "PRICING_MODE": "static",
+    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:123456789012:benchmark",
+    "REPORT_BUCKET": "benchmark-reports",
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def install_backend(backend, region="us-east-1", cassette=None):
+    """
+    Point the shared client factory at a fresh session served by backend. A cassette Recorder
+    captures the backend's responses; a Replayer can stand in for the backend altogether.
+    """
+    from utils import aws_helpers
+
+    session = boto3.session.Session(
+        aws_access_key_id="benchmark", aws_secret_access_key="benchmark", region_name=region,
+    )
+    if backend is not None:
+        backend.install(session)
+    if cassette is not None:
+        cassette.install(session)
+    with aws_helpers._CLIENTS_LOCK:
+        aws_helpers._SESSION = session
+        aws_helpers._CLIENTS.clear()
+    return session
+
+
+def run_once(size, seed=DEFAULT_SEED, latency=0.0, event=None, context=None,
+             record=None, replay=None, latency_scale=1.0):
+    """
+    Run the handler once against a generated estate and return its measurements.
+    record writes every response to a cassette; replay serves a recorded cassette instead
+    of the synthetic backend, with recorded latency multiplied by latency_scale.
+    """
+    os.environ.update(BENCHMARK_ENV)
+    import lambda_handler
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    estate = generate_estate(size, seed=seed)
+    generated = time.perf_counter() - started
+
+    if replay:
+        backend, cassette = None, Replayer(replay, latency_scale=latency_scale)
+    else:
+        backend = EstateBackend(estate, latency=latency)
+        cassette = Recorder(record) if record else None
+    install_backend(backend, cassette=cassette)
+
+    started = time.perf_counter()
+    # The EMF line goes to stdout; keep it out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = lambda_handler.handler(event or {}, context)
+    wall_time = time.perf_counter() - started
+    if cassette is not None:
+        cassette.flush()
+
+    return {
+        "size": estate.size,
+        "wall_time": round(wall_time, 3),
+        "generate_time": round(generated, 3),
+        "throughput": round(estate.size / wall_time, 1) if wall_time else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "status": result["status"],
+        "found": result["resources"],
+        "expected": estate.expected(),
+        "api_calls": dict(sorted((backend or cassette).calls.items())),
+        "stages": result["metrics"]["stages"],
+    }
+
+
+def _run_isolated(size, args):
+    """Run one size in a child interpreter and return its measurements."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as handle:
+        output = handle.name
+    try:
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--worker", output,
+            "--sizes", str(size), "--seed", str(args.seed), "--latency-ms", str(args.latency_ms),
+            "--latency-scale", str(args.latency_scale),
+        ]
+        if args.record:
+            command += ["--record", args.record]
+        if args.replay:
+            command += ["--replay", args.replay]
+        env = {**os.environ, "PIPELINE_MODE": args.pipeline}
+        subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+        with open(output, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    finally:
+        os.remove(output)
+
+
+def compare(current, baseline):
+    """Print wall time and API call deltas between two result files."""
+    previous = {run["size"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        before = previous.get(run["size"])
+        if before is None:
+            continue
+        change = (run["wall_time"] - before["wall_time"]) / before["wall_time"] * 100 if before["wall_time"] else 0
+        calls = sum(run["api_calls"].values()) - sum(before["api_calls"].values())
+        print(
+            f"{run['size']:>8} resources: {before['wall_time']:.2f}s -> {run['wall_time']:.2f}s "
+            f"({change:+.1f}%), API calls {calls:+d}, peak RSS "
+            f"{before['peak_rss_mb']} -> {run['peak_rss_mb']} MB"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the handler against synthetic estates.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected latency per API call")
+    parser.add_argument("--pipeline", choices=["list", "streaming"], default=os.getenv("PIPELINE_MODE", "list"))
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--record", help="Record every AWS response of the run to this cassette")
+    parser.add_argument("--replay", help="Serve AWS responses from this cassette instead of the backend")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for replayed latency")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if (args.record or args.replay) and len(args.sizes) > 1:
+        parser.error("--record and --replay take a single --sizes value")
+
+    if args.worker:
+        measurement = run_once(
+            args.sizes[0], seed=args.seed, latency=args.latency_ms / 1000,
+            record=args.record, replay=args.replay, latency_scale=args.latency_scale,
+        )
+        with open(args.worker, "w", encoding="utf-8") as handle:
+            json.dump(measurement, handle)
+        return 0
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "latency_ms": args.latency_ms,
+        "pipeline": args.pipeline,
+        "replay": args.replay,
+        "runs": [],
+    }
+    for size in args.sizes:
+        run = _run_isolated(size, args)
+        results["runs"].append(run)
+        print(
+            f"{run['size']:>8} resources: {run['wall_time']:.2f}s, {run['throughput']:.0f} resources/s, "
+            f"peak RSS {run['peak_rss_mb']} MB, {sum(run['api_calls'].values())} API calls"
+        )
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"benchmark-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            compare(results, json.load(handle))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# benchmarks/startup.py
+"""
+Benchmark Lambda cold start: handler module import and first-invocation latency.
+
+    python -m benchmarks.startup --repeat 10
+    python -m benchmarks.startup --size 1000 --output benchmarks/results/startup.json
+
+Each repeat runs in a fresh interpreter. Only the standard library is imported at module
+level here so the import measurement starts from a clean interpreter.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+DEFAULT_REPEAT = 5
+DEFAULT_SIZE = 100
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Modules the handler should not load until an invocation needs them
+DEFERRED_MODULES = ["boto3", "botocore", "jinja2", "scanner.ec2_scanner", "reporting.report_builder"]
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def measure_cold_start(size=DEFAULT_SIZE):
+    """
+    Import the handler, then run it twice against a small synthetic estate, in this interpreter.
+    Call once per fresh interpreter, with the benchmark environment already set.
+    """
+    started = time.perf_counter()
+    import lambda_handler
+
+    import_ms = _elapsed_ms(started)
+    loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+
+    import contextlib
+    import io
+    import logging
+
+    from benchmarks.estate import generate_estate
+
+    logging.getLogger().setLevel(logging.WARNING)
+    estate = generate_estate(size)
+    # The backend needs a boto3 session before the handler runs, so boto3 is imported here;
+    # session_ms plus first_invocation_ms is what a cold invocation pays after the import
+    started = time.perf_counter()
+    from benchmarks.backend import EstateBackend
+    from benchmarks.run import install_backend
+
+    install_backend(EstateBackend(estate))
+    session_ms = _elapsed_ms(started)
+
+    invocations = []
+    for _ in range(2):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            lambda_handler.handler({}, None)
+        invocations.append(_elapsed_ms(started))
+
+    return {
+        "import_ms": import_ms,
+        "session_ms": session_ms,
+        "first_invocation_ms": invocations[0],
+        "warm_invocation_ms": invocations[1],
+        "loaded_at_import": loaded,
+    }
+
+
+def _run_isolated(size):
+    """Measure one cold start in a child interpreter."""
+    from benchmarks.run import BENCHMARK_ENV
+
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as handle:
+        output = handle.name
+    try:
+        command = [sys.executable, "-m", "benchmarks.startup", "--worker", output, "--size", str(size)]
+        subprocess.run(command, check=True, env={**os.environ, **BENCHMARK_ENV}, stdout=subprocess.DEVNULL)
+        with open(output, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    finally:
+        os.remove(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark handler import time and first invocation.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Fresh interpreters to measure")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Synthetic estate size per invocation")
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/startup-<timestamp>.json)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        measurement = measure_cold_start(args.size)
+        with open(args.worker, "w", encoding="utf-8") as handle:
+            json.dump(measurement, handle)
+        return 0
+
+    runs = [_run_isolated(args.size) for _ in range(args.repeat)]
+    keys = ["import_ms", "session_ms", "first_invocation_ms", "warm_invocation_ms"]
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size": args.size,
+        "median": {key: statistics.median(run[key] for run in runs) for key in keys},
+        "runs": runs,
+    }
+    median = results["median"]
+    print(
+        f"import {median['import_ms']:.0f} ms, boto3 session {median['session_ms']:.0f} ms, "
+        f"first invocation {median['first_invocation_ms']:.0f} ms, "
+        f"warm invocation {median['warm_invocation_ms']:.0f} ms (median of {len(runs)})"
+    )
+    if runs[0]["loaded_at_import"]:
+        print(f"Loaded at import: {', '.join(runs[0]['loaded_at_import'])}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"startup-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
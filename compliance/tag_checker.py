@@ -19,6 +19,22 @@ def _get_required_tags():
     return DEFAULT_REQUIRED_TAGS
 
 
+def _find_violation(r, required_tags):
+    """Return the violation record for one resource, or None if it is compliant."""
+    tags = r.get("tags", {})
+
+    missing = [t for t in required_tags if t not in tags]
+
+    if missing:
+        return {
+            "resource_id": r.get("id"),
+            "type": r.get("type"),
+            "missing_tags": missing,
+            "tags": tags
+        }
+    return None
+
+
 def check_tag_compliance(resources):
     """Check resources for required tag compliance."""
     required_tags = _get_required_tags()
@@ -28,17 +44,20 @@ def check_tag_compliance(resources):
     logger.info(f"Required tags: {required_tags}")
 
     for r in resources:
-        tags = r.get("tags", {})
-
-        missing = [t for t in required_tags if t not in tags]
-
-        if missing:
-            violations.append({
-                "resource_id": r.get("id"),
-                "type": r.get("type"),
-                "missing_tags": missing,
-                "tags": tags
-            })
+        violation = _find_violation(r, required_tags)
+        if violation:
+            violations.append(violation)
 
     logger.info(f"Found {len(violations)} tag compliance violations")
     return violations
+
+
+def iter_tag_violations(resources):
+    """Yield tag compliance violations as resources stream through."""
+    required_tags = _get_required_tags()
+    logger.info(f"Streaming tag compliance check, required tags: {required_tags}")
+
+    for r in resources:
+        violation = _find_violation(r, required_tags)
+        if violation:
+            yield violation
@@ -1,15 +1,20 @@
 import json
 import os
-import boto3
 import logging
+import threading
 import time
-from utils.aws_helpers import BOTO3_CONFIG
+from concurrent.futures import ThreadPoolExecutor
+from utils.aws_helpers import get_client
+from utils.metrics import propagate, stage
+from utils.storage import open_store
 
 logger = logging.getLogger(__name__)
 
 HOURS_PER_MONTH = 730
 CACHE_TTL = 3600  # 1 hour cache TTL
 MAX_CACHE_SIZE = 1000  # Maximum cache entries
+PRICE_CACHE_KEY = "pricing/price_cache.json"  # Object key in the persistent cache tier
+DEFAULT_PRICING_CONCURRENCY = 8  # Parallel Pricing API lookups during prefetch
 
 PRICING_REGION_MAP = {
     "us-east-1": "US East (N. Virginia)",
@@ -40,7 +45,9 @@ EBS_VOLUME_TYPE_MAP = {
 }
 
 _PRICE_CACHE = {}
-_pricing_client = None
+_CACHE_STATS = {"hits": 0, "misses": 0, "stored": 0}
+# Guards the cache and its stats during concurrent prefetch
+_CACHE_LOCK = threading.RLock()
 
 # Very small pricing snapshot (can extend later)
 DEFAULT_PRICING = {
@@ -67,29 +74,113 @@ def _load_pricing():
     return DEFAULT_PRICING
 
 def _get_pricing_client():
-    """Lazy initialization of Pricing API client."""
-    global _pricing_client
-    if _pricing_client is None:
-        _pricing_client = boto3.client("pricing", region_name="us-east-1", config=BOTO3_CONFIG)
-    return _pricing_client
+    """Get the Pricing API client (only served from us-east-1) from the shared factory."""
+    return get_client("pricing", "us-east-1")
 
 
 def _clean_cache():
     """Remove expired cache entries and enforce size limit."""
     global _PRICE_CACHE
     now = time.time()
-    
-    # Remove expired entries
-    expired = [k for k, v in _PRICE_CACHE.items() if now - v.get("timestamp", 0) > CACHE_TTL]
-    for k in expired:
-        del _PRICE_CACHE[k]
-    
-    # Enforce size limit (remove oldest entries)
-    if len(_PRICE_CACHE) > MAX_CACHE_SIZE:
-        sorted_items = sorted(_PRICE_CACHE.items(), key=lambda x: x[1].get("timestamp", 0))
-        for k, _ in sorted_items[:len(_PRICE_CACHE) - MAX_CACHE_SIZE]:
+
+    with _CACHE_LOCK:
+        # Remove expired entries
+        expired = [k for k, v in _PRICE_CACHE.items() if now - v.get("timestamp", 0) > CACHE_TTL]
+        for k in expired:
             del _PRICE_CACHE[k]
 
+        # Enforce size limit (remove oldest entries)
+        if len(_PRICE_CACHE) > MAX_CACHE_SIZE:
+            sorted_items = sorted(_PRICE_CACHE.items(), key=lambda x: x[1].get("timestamp", 0))
+            for k, _ in sorted_items[:len(_PRICE_CACHE) - MAX_CACHE_SIZE]:
+                del _PRICE_CACHE[k]
+
+
+def _cache_get(key):
+    """Return an unexpired cached price (or None), counting hits and misses."""
+    with _CACHE_LOCK:
+        cached = _PRICE_CACHE.get(key)
+        if cached and time.time() - cached.get("timestamp", 0) < CACHE_TTL:
+            _CACHE_STATS["hits"] += 1
+            return cached.get("price")
+        _CACHE_STATS["misses"] += 1
+        return None
+
+
+def _cache_put(key, price):
+    """Cache a successful price lookup."""
+    with _CACHE_LOCK:
+        _PRICE_CACHE[key] = {"price": price, "timestamp": time.time()}
+        _CACHE_STATS["stored"] += 1
+
+
+def _get_price_cache_store():
+    """Persistent cache tier from PRICE_CACHE_LOCATION (local dir or s3://bucket/prefix)."""
+    location = os.environ.get("PRICE_CACHE_LOCATION")
+    return open_store(location) if location else None
+
+
+def get_cache_stats():
+    """Return hit/miss/stored counts for the current run."""
+    return dict(_CACHE_STATS)
+
+
+def load_price_cache():
+    """
+    Bulk-load unexpired entries from the persistent tier into the in-memory cache.
+    Resets the run's cache stats. Returns the number of entries loaded.
+    """
+    for k in _CACHE_STATS:
+        _CACHE_STATS[k] = 0
+
+    store = _get_price_cache_store()
+    if store is None:
+        return 0
+
+    try:
+        body = store.get(PRICE_CACHE_KEY)
+        data = json.loads(body) if body else {}
+    except Exception as e:
+        logger.warning(f"Error loading persistent price cache from {store}: {e}")
+        return 0
+
+    now = time.time()
+    loaded = 0
+    for entry in data.get("entries", []):
+        key = tuple(entry["key"])
+        timestamp = entry.get("timestamp", 0)
+        if now - timestamp >= CACHE_TTL:
+            continue
+        current = _PRICE_CACHE.get(key)
+        if current is None or current.get("timestamp", 0) < timestamp:
+            _PRICE_CACHE[key] = {"price": entry["price"], "timestamp": timestamp}
+            loaded += 1
+
+    _clean_cache()
+    logger.info(f"Loaded {loaded} pricing cache entries from {store}")
+    return loaded
+
+
+def save_price_cache():
+    """Write the in-memory cache back to the persistent tier if this run added entries."""
+    store = _get_price_cache_store()
+    if store is None or not _CACHE_STATS["stored"]:
+        return False
+
+    _clean_cache()
+    entries = [
+        {"key": list(k), "price": v["price"], "timestamp": v["timestamp"]}
+        for k, v in _PRICE_CACHE.items()
+    ]
+    try:
+        store.put(PRICE_CACHE_KEY, json.dumps({"version": 1, "entries": entries}).encode("utf-8"))
+    except Exception as e:
+        logger.warning(f"Error saving persistent price cache to {store}: {e}")
+        return False
+
+    logger.info(f"Saved {len(entries)} pricing cache entries to {store}")
+    return True
+
 
 def _safe_price(fn, *args):
     """Circuit breaker for pricing API calls with logging."""
@@ -120,12 +211,10 @@ def _get_ec2_hourly_price(instance_type, region):
     """Get EC2 hourly price from Pricing API with TTL cache."""
     key = ("EC2", instance_type, region)
     
-    # Check cache
-    if key in _PRICE_CACHE:
-        cached = _PRICE_CACHE[key]
-        if time.time() - cached.get("timestamp", 0) < CACHE_TTL:
-            return cached.get("price")
-    
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
     _clean_cache()
 
     location = _get_location(region)
@@ -152,7 +241,7 @@ def _get_ec2_hourly_price(instance_type, region):
         
         # Only cache successful lookups
         if price is not None:
-            _PRICE_CACHE[key] = {"price": price, "timestamp": time.time()}
+            _cache_put(key, price)
         
         return price
     except Exception as e:
@@ -163,12 +252,10 @@ def _get_ebs_gb_month_price(volume_type, region):
     """Get EBS per-GB-month price from Pricing API with TTL cache."""
     key = ("EBS", volume_type, region)
     
-    # Check cache
-    if key in _PRICE_CACHE:
-        cached = _PRICE_CACHE[key]
-        if time.time() - cached.get("timestamp", 0) < CACHE_TTL:
-            return cached.get("price")
-    
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
     _clean_cache()
 
     location = _get_location(region)
@@ -193,7 +280,7 @@ def _get_ebs_gb_month_price(volume_type, region):
         
         # Only cache successful lookups
         if price is not None:
-            _PRICE_CACHE[key] = {"price": price, "timestamp": time.time()}
+            _cache_put(key, price)
         
         return price
     except Exception as e:
@@ -205,12 +292,10 @@ def _get_alb_hourly_price(region):
     """Get ALB hourly price from Pricing API with TTL cache."""
     key = ("ELB", region)
     
-    # Check cache
-    if key in _PRICE_CACHE:
-        cached = _PRICE_CACHE[key]
-        if time.time() - cached.get("timestamp", 0) < CACHE_TTL:
-            return cached.get("price")
-    
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
     _clean_cache()
 
     location = _get_location(region)
@@ -235,34 +320,173 @@ def _get_alb_hourly_price(region):
         
         # Only cache successful lookups
         if price is not None:
-            _PRICE_CACHE[key] = {"price": price, "timestamp": time.time()}
+            _cache_put(key, price)
         
         return price
     except Exception as e:
         logger.error(f"Error fetching ELB price for {region}: {e}")
         return None
 
-def estimate_monthly_waste(resources):
+def _get_pricing_concurrency():
+    """Get prefetch concurrency from env var with validation."""
+    try:
+        concurrency = int(os.getenv("PRICING_CONCURRENCY", str(DEFAULT_PRICING_CONCURRENCY)))
+        if concurrency < 1:
+            logger.warning(f"Invalid PRICING_CONCURRENCY {concurrency}, using default {DEFAULT_PRICING_CONCURRENCY}")
+            concurrency = DEFAULT_PRICING_CONCURRENCY
+    except ValueError:
+        logger.warning(f"Invalid PRICING_CONCURRENCY format, using default {DEFAULT_PRICING_CONCURRENCY}")
+        concurrency = DEFAULT_PRICING_CONCURRENCY
+    return concurrency
+
+
+def _price_request(r):
+    """Live-pricing lookup key for a resource, matching the cache key, or None if not priced live."""
+    resource_type = r.get("type")
+    if resource_type == "EBS":
+        return ("EBS", r.get("volume_type"), r.get("region"))
+    if resource_type == "EC2":
+        return ("EC2", r.get("instance_type"), r.get("region"))
+    if resource_type == "ELB":
+        return ("ELB", r.get("region"))
+    return None
+
+
+def _fetch_price(request):
+    """Resolve one lookup key through the matching Pricing API getter."""
+    fetchers = {
+        "EBS": _get_ebs_gb_month_price,
+        "EC2": _get_ec2_hourly_price,
+        "ELB": _get_alb_hourly_price,
+    }
+    service, *args = request
+    return _safe_price(fetchers[service], *args)
+
+
+def prefetch_prices(resources):
     """
-    Estimate monthly waste cost for resources.
-    Returns new list with cost annotations, does not mutate input.
+    Resolve live prices for every distinct lookup key before estimation.
+    Requests are coalesced so each key is fetched once, on a bounded thread pool.
+    Returns {lookup_key: price or None}.
+    """
+    requests = list(dict.fromkeys(
+        key for key in (_price_request(r) for r in resources) if key is not None
+    ))
+    if not requests:
+        return {}
+
+    concurrency = min(_get_pricing_concurrency(), len(requests))
+    logger.info(f"Prefetching prices for {len(requests)} unique keys (concurrency={concurrency})")
+    # Own stage so prefetch wall time and key count are reported as separate metrics
+    with stage("price_prefetch") as record:
+        record.add_items(len(requests))
+        if concurrency == 1:
+            prices = {key: _fetch_price(key) for key in requests}
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                prices = dict(zip(requests, pool.map(propagate(_fetch_price), requests)))
+
+    logger.info(f"Prefetched prices in {record.duration:.2f}s")
+    return prices
+
+
+def _open_price_index():
+    """Open the offline index at PRICING_INDEX_PATH, or return None if it is missing."""
+    path = os.environ.get("PRICING_INDEX_PATH")
+    if not path or not os.path.exists(path):
+        logger.warning(f"Pricing index {path!r} not found, using static pricing")
+        return None
+
+    from cost_engine.price_index import PriceIndex
+    return PriceIndex(path)
+
+
+def _index_price(index, key):
+    """Look up a price request key in the offline index."""
+    if key[0] == "ELB":
+        return index.lookup("ELB", "application", key[1])
+    return index.lookup(*key)
+
+
+def lookup_offline_prices(resources):
+    """
+    Resolve prices from the offline index at PRICING_INDEX_PATH with zero network calls.
+    Returns {lookup_key: price or None}, matching prefetch_prices.
     """
+    index = _open_price_index()
+    if index is None:
+        return {}
+
+    requests = dict.fromkeys(
+        key for key in (_price_request(r) for r in resources) if key is not None
+    )
+    with index:
+        prices = {key: _index_price(index, key) for key in requests}
+
+    found = sum(1 for p in prices.values() if p is not None)
+    logger.info(f"Resolved {found}/{len(prices)} unique price keys from offline index {index.path}")
+    return prices
+
+
+def _get_pricing_mode():
+    """Get pricing mode from env var with validation."""
     pricing_mode = os.environ.get("PRICING_MODE", "static").lower()
-    
-    # Validate pricing mode
-    if pricing_mode not in ["static", "live"]:
+    if pricing_mode not in ["static", "live", "offline"]:
         logger.warning(f"Invalid PRICING_MODE '{pricing_mode}', using 'static'")
         pricing_mode = "static"
-    
+    return pricing_mode
+
+
+def _resource_key(r):
+    # Names like ELB ids are only unique within one account and region
+    return (r.get("account_id"), r.get("type"), r.get("region"), r.get("id"))
+
+
+def _resource_cost(r, pricing, live_price):
+    """Monthly cost of one resource from its resolved price, falling back to the static snapshot."""
+    resource_type = r.get("type", "UNKNOWN")
+
+    if resource_type == "EBS":
+        if live_price is not None:
+            return r["size_gb"] * live_price
+        return r["size_gb"] * pricing["EBS"]
+
+    if resource_type == "EC2":
+        if live_price is not None:
+            return live_price * HOURS_PER_MONTH
+        return pricing["EC2"].get(r["instance_type"], 50)
+
+    if resource_type == "ELB":
+        if live_price is not None:
+            return live_price * HOURS_PER_MONTH
+        return pricing["ELB"]
+
+    if resource_type in ["RDS", "RDS_CLUSTER", "RDS_INSTANCE"]:
+        # RDS pricing is still static (need instance class details for live pricing)
+        return pricing["RDS"]
+
+    logger.warning(f"Unknown resource type: {resource_type}")
+    return 0
+
+
+def estimate_monthly_waste(resources):
+    """
+    Estimate monthly waste cost for resources.
+    Returns new list with cost annotations, does not mutate input.
+    """
+    pricing_mode = _get_pricing_mode()
     pricing = _load_pricing()
     report = []
     total = 0
+
+    if pricing_mode == "live":
+        load_price_cache()
     
-    # Deduplicate resources by (type, id)
+    # Deduplicate resources by (account, type, region, id)
     seen = set()
     unique_resources = []
     for r in resources:
-        key = (r.get("type"), r.get("id"))
+        key = _resource_key(r)
         if key not in seen:
             seen.add(key)
             unique_resources.append(r)
@@ -271,56 +495,102 @@ def estimate_monthly_waste(resources):
     
     logger.info(f"Estimating costs for {len(unique_resources)} unique resources (pricing_mode={pricing_mode})")
 
+    # Resolve all prices up front so the loop below is pure in-memory computation
+    if pricing_mode == "live":
+        prices = prefetch_prices(unique_resources)
+    elif pricing_mode == "offline":
+        prices = lookup_offline_prices(unique_resources)
+    else:
+        prices = {}
+
     for r in unique_resources:
-        cost = 0
-        resource_type = r.get("type", "UNKNOWN")
-
-        if resource_type == "EBS":
-            if pricing_mode == "live":
-                price_per_gb = _safe_price(
-                    _get_ebs_gb_month_price, r.get("volume_type"), r.get("region")
-                )
-                if price_per_gb is not None:
-                    cost = r["size_gb"] * price_per_gb
-                else:
-                    cost = r["size_gb"] * pricing["EBS"]
-            else:
-                cost = r["size_gb"] * pricing["EBS"]
-
-        elif resource_type == "EC2":
-            if pricing_mode == "live":
-                hourly = _safe_price(
-                    _get_ec2_hourly_price, r.get("instance_type"), r.get("region")
-                )
-                if hourly is not None:
-                    cost = hourly * HOURS_PER_MONTH
-                else:
-                    cost = pricing["EC2"].get(r["instance_type"], 50)
-            else:
-                cost = pricing["EC2"].get(r["instance_type"], 50)
-
-        elif resource_type == "ELB":
-            if pricing_mode == "live":
-                hourly = _safe_price(_get_alb_hourly_price, r.get("region"))
-                if hourly is not None:
-                    cost = hourly * HOURS_PER_MONTH
-                else:
-                    cost = pricing["ELB"]
-            else:
-                cost = pricing["ELB"]
-
-        elif resource_type in ["RDS", "RDS_CLUSTER", "RDS_INSTANCE"]:
-            # RDS pricing is still static (need instance class details for live pricing)
-            cost = pricing["RDS"]
-        
-        else:
-            logger.warning(f"Unknown resource type: {resource_type}")
-            cost = 0
+        cost = _resource_cost(r, pricing, prices.get(_price_request(r)))
 
         # Create new dict with cost annotation (avoid mutation)
         annotated = {**r, "monthly_cost": round(cost, 2)}
         total += cost
         report.append(annotated)
 
+    if pricing_mode == "live":
+        save_price_cache()
+        stats = get_cache_stats()
+        logger.info(f"Pricing cache: {stats['hits']} hits, {stats['misses']} misses")
+
     logger.info(f"Total estimated monthly waste: ${round(total, 2)}")
     return report, round(total, 2)
+
+
+def iter_monthly_waste(resources, totals=None):
+    """
+    Streaming counterpart of estimate_monthly_waste: yield annotated resources one at a time.
+    Each lookup key is priced the first time it is seen instead of prefetched, so only the
+    dedupe keys and resolved prices are held in memory. The optional totals dict is kept
+    up to date with the unique resource count and the rounded running total.
+    """
+    pricing_mode = _get_pricing_mode()
+    pricing = _load_pricing()
+    totals = totals if totals is not None else {}
+    totals.update(resources=0, total=0)
+
+    if pricing_mode == "live":
+        load_price_cache()
+    index = _open_price_index() if pricing_mode == "offline" else None
+
+    logger.info(f"Streaming cost estimation (pricing_mode={pricing_mode})")
+    seen = set()
+    prices = {}
+    total = 0
+    try:
+        for r in resources:
+            key = _resource_key(r)
+            if key in seen:
+                logger.warning(f"Duplicate resource detected: {key}")
+                continue
+            seen.add(key)
+
+            request = _price_request(r)
+            if request is not None and request not in prices:
+                if pricing_mode == "live":
+                    prices[request] = _fetch_price(request)
+                elif index is not None:
+                    prices[request] = _index_price(index, request)
+
+            cost = _resource_cost(r, pricing, prices.get(request))
+            total += cost
+            totals["resources"] += 1
+            totals["total"] = round(total, 2)
+            yield {**r, "monthly_cost": round(cost, 2)}
+    finally:
+        if index is not None:
+            index.close()
+        if pricing_mode == "live":
+            save_price_cache()
+            stats = get_cache_stats()
+            logger.info(f"Pricing cache: {stats['hits']} hits, {stats['misses']} misses")
+
+    logger.info(f"Total estimated monthly waste: ${round(total, 2)}")
+
+
+def iter_annotated_waste(resources, totals=None):
+    """
+    Deduplicate resources already annotated with monthly_cost (e.g. merged from shards)
+    and keep the optional totals dict up to date, as iter_monthly_waste does, without
+    pricing them again.
+    """
+    totals = totals if totals is not None else {}
+    totals.update(resources=0, total=0)
+    seen = set()
+    total = 0
+    for r in resources:
+        key = _resource_key(r)
+        if key in seen:
+            logger.warning(f"Duplicate resource detected: {key}")
+            continue
+        seen.add(key)
+
+        total += r.get("monthly_cost", 0)
+        totals["resources"] += 1
+        totals["total"] = round(total, 2)
+        yield r
+
+    logger.info(f"Total merged monthly waste: ${round(total, 2)}")
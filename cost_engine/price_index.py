@@ -0,0 +1,335 @@
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from cost_engine.estimator import PRICING_REGION_MAP
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # Characters read per refill when streaming offer files
+INSERT_BATCH_SIZE = 5000
+
+# Offer attributes identifying the price we want per service; all must match
+EC2_FILTERS = {
+    "productFamily": "Compute Instance",
+    "operatingSystem": "Linux",
+    "tenancy": "Shared",
+    "preInstalledSw": "NA",
+    "capacitystatus": "Used",
+    "licenseModel": "No License required",
+}
+RDS_FILTERS = {
+    "productFamily": "Database Instance",
+    "deploymentOption": "Single-AZ",
+}
+EXPECTED_UNITS = {"EC2": "Hrs", "EBS": "GB-Mo", "ELB": "Hrs", "RDS": "Hrs"}
+LOCATION_TO_REGION = {location: code for code, location in PRICING_REGION_MAP.items()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    service TEXT NOT NULL,
+    item TEXT NOT NULL,
+    region TEXT NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (service, item, region)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TEMP TABLE sku_items (sku TEXT PRIMARY KEY, service TEXT, item TEXT, region TEXT);
+CREATE TEMP TABLE sku_prices (sku TEXT PRIMARY KEY, unit TEXT, price REAL);
+"""
+
+
+def _normalize(name):
+    """Normalize attribute names so JSON ("instanceType") and CSV ("Instance Type") headers match."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _region_code(attrs):
+    """Region code from regionCode, falling back to reverse-mapping the location name."""
+    return attrs.get("regioncode") or LOCATION_TO_REGION.get(attrs.get("location"))
+
+
+def _matches(attrs, filters):
+    return all(attrs.get(_normalize(k)) == v for k, v in filters.items())
+
+
+def classify_product(attrs):
+    """
+    Map normalized product attributes to an index key (service, item, region).
+    Returns None for products the estimator never prices.
+    """
+    region = _region_code(attrs)
+    if not region:
+        return None
+
+    family = attrs.get("productfamily")
+    if _matches(attrs, EC2_FILTERS) and attrs.get("operation") == "RunInstances":
+        return ("EC2", attrs.get("instancetype"), region)
+    if family == "Storage" and attrs.get("volumeapiname"):
+        return ("EBS", attrs["volumeapiname"], region)
+    if attrs.get("operation") == "LoadBalancing:Application" and \
+            attrs.get("usagetype", "").endswith("LoadBalancerUsage"):
+        return ("ELB", "application", region)
+    if _matches(attrs, RDS_FILTERS) and attrs.get("instancetype"):
+        return ("RDS", f"{attrs['instancetype']}|{attrs.get('databaseengine', '')}", region)
+    return None
+
+
+def select_price(dimensions):
+    """
+    Pick the first-tier USD price for a list of (unit, begin_range, usd) dimensions.
+    Free-tier and usage-tier dimensions starting above zero are ignored.
+    """
+    best = None
+    for unit, begin_range, usd in dimensions:
+        if usd in (None, "") or str(begin_range or "0") not in ("0", "0.0"):
+            continue
+        price = float(usd)
+        if best is None or (best[1] == 0 and price > 0):
+            best = (unit, price)
+    return best
+
+
+class _JsonStream:
+    """Minimal pull parser that walks a large JSON document one object member at a time."""
+
+    def __init__(self, handle, chunk_size=CHUNK_SIZE):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} in offer file")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number ending at the buffer edge may be truncated
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yield the keys of the next object; the caller must consume each value."""
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            char = self._peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "}":
+                self.pos += 1
+                return
+            else:
+                raise ValueError(f"Malformed object at offset {self.pos} in offer file")
+
+
+def iter_json_offer(handle, chunk_size=CHUNK_SIZE):
+    """
+    Stream a JSON offer file, yielding ("product", sku, attrs) and ("term", sku, dimensions).
+    Only one product or one SKU's terms is held in memory at a time.
+    """
+    stream = _JsonStream(handle, chunk_size)
+    for key in stream.members():
+        if key == "products":
+            for sku in stream.members():
+                product = stream.value()
+                attrs = {_normalize(k): v for k, v in product.get("attributes", {}).items()}
+                attrs["productfamily"] = product.get("productFamily", attrs.get("productfamily"))
+                yield "product", sku, attrs
+        elif key == "terms":
+            for term_type in stream.members():
+                for sku in stream.members():
+                    # Decode one SKU at a time so Reserved terms never materialise in full
+                    offers = stream.value()
+                    if term_type != "OnDemand":
+                        continue
+                    dimensions = [
+                        (d.get("unit"), d.get("beginRange"), d.get("pricePerUnit", {}).get("USD"))
+                        for offer in offers.values()
+                        for d in offer.get("priceDimensions", {}).values()
+                    ]
+                    yield "term", sku, dimensions
+        else:
+            stream.value()
+
+
+def iter_csv_offer(handle):
+    """
+    Stream a CSV offer file, yielding the same events as iter_json_offer.
+    CSV offer files start with metadata lines before the header row.
+    """
+    reader = csv.reader(handle)
+    header = None
+    for row in reader:
+        if row and row[0] == "SKU":
+            header = [_normalize(h) for h in row]
+            break
+    if header is None:
+        raise ValueError("CSV offer file has no SKU header row")
+
+    records = (dict(zip(header, row)) for row in reader)
+    on_demand = (
+        r for r in records
+        if r.get("sku") and r.get("termtype") == "OnDemand" and r.get("currency") == "USD"
+    )
+    # One row per price dimension; a SKU's rows are contiguous in the offer file
+    for sku, rows in itertools.groupby(on_demand, key=lambda r: r["sku"]):
+        rows = list(rows)
+        yield "product", sku, rows[0]
+        yield "term", sku, [(r.get("unit"), r.get("startingrange"), r.get("priceperunit")) for r in rows]
+
+
+def _open_offer(path, chunk_size=CHUNK_SIZE):
+    handle = open(path, "r", encoding="utf-8", newline="")
+    if path.lower().endswith(".csv"):
+        return handle, iter_csv_offer(handle)
+    return handle, iter_json_offer(handle, chunk_size)
+
+
+def build_index(offer_paths, output_path, chunk_size=CHUNK_SIZE):
+    """
+    Build the SQLite pricing index from offer files (JSON or CSV) without
+    loading them into memory. The index is written atomically to output_path.
+    Returns the number of priced items.
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".sqlite.tmp")
+    os.close(fd)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        for path in offer_paths:
+            logger.info(f"Ingesting offer file {path}")
+            handle, events = _open_offer(path, chunk_size)
+            items, terms = [], []
+            with handle:
+                for kind, sku, payload in events:
+                    if kind == "product":
+                        key = classify_product(payload)
+                        if key and key[1]:
+                            items.append((sku, *key))
+                    else:
+                        selected = select_price(payload)
+                        if selected:
+                            terms.append((sku, *selected))
+                    if len(items) >= INSERT_BATCH_SIZE or len(terms) >= INSERT_BATCH_SIZE:
+                        _flush(conn, items, terms)
+                _flush(conn, items, terms)
+
+            # SKUs are only unique per offer file, so join and reset per file
+            conn.execute("""
+                INSERT OR REPLACE INTO prices (service, item, region, price)
+                SELECT i.service, i.item, i.region, p.price
+                FROM sku_items i JOIN sku_prices p ON p.sku = i.sku
+                WHERE p.unit = CASE i.service
+                    WHEN 'EC2' THEN ? WHEN 'EBS' THEN ? WHEN 'ELB' THEN ? WHEN 'RDS' THEN ? END
+            """, [EXPECTED_UNITS[service] for service in ("EC2", "EBS", "ELB", "RDS")])
+            conn.execute("DELETE FROM sku_items")
+            conn.execute("DELETE FROM sku_prices")
+
+        conn.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES ('sources', ?)",
+            (json.dumps([os.path.basename(p) for p in offer_paths]),),
+        )
+        conn.commit()
+        count = conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        conn.execute("VACUUM")
+    except Exception:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+
+    os.replace(tmp_path, output_path)
+    logger.info(f"Built pricing index {output_path} with {count} prices")
+    return count
+
+
+def _flush(conn, items, terms):
+    conn.executemany("INSERT OR REPLACE INTO sku_items VALUES (?, ?, ?, ?)", items)
+    conn.executemany("INSERT OR REPLACE INTO sku_prices VALUES (?, ?, ?)", terms)
+    items.clear()
+    terms.clear()
+
+
+class PriceIndex:
+    """Read-only lookups against a built pricing index (primary-key B-tree, O(log n))."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, service, item, region):
+        """Return the indexed USD price, or None if the index has no entry."""
+        row = self._conn.execute(
+            "SELECT price FROM prices WHERE service = ? AND item = ? AND region = ?",
+            (service, item, region),
+        ).fetchone()
+        return row[0] if row else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the offline pricing index from AWS offer files.")
+    parser.add_argument("offers", nargs="+", help="AmazonEC2/AWSELB/AmazonRDS offer files (.json or .csv)")
+    parser.add_argument("--output", required=True, help="Path of the SQLite index to write")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    count = build_index(args.offers, args.output)
+    print(f"Indexed {count} prices into {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
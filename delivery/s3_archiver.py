@@ -1,25 +1,18 @@
-import boto3
 import datetime
 import os
 import logging
-from utils.aws_helpers import BOTO3_CONFIG
+from utils.aws_helpers import get_client
 
 logger = logging.getLogger(__name__)
 
-_s3_client = None
-
 
 def _get_s3_client():
-    """Lazy initialization of S3 client."""
-    global _s3_client
-    if _s3_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _s3_client = boto3.client("s3", region_name=region, config=BOTO3_CONFIG)
-    return _s3_client
+    """Get the S3 client from the shared factory."""
+    return get_client("s3")
 
 
 def archive_report(report):
-    """Archive report to S3."""
+    """Archive report to S3. The report may be a string or a binary file object."""
     bucket = os.environ.get("REPORT_BUCKET")
     if not bucket:
         logger.error("REPORT_BUCKET environment variable is not set")
@@ -1,20 +1,26 @@
-import boto3
 import os
 import logging
-from utils.aws_helpers import BOTO3_CONFIG
+from utils.aws_helpers import get_client
 
 logger = logging.getLogger(__name__)
 
-_sns_client = None
+MAX_MESSAGE_BYTES = 262144  # SNS message size limit (256 KB)
+TRUNCATION_NOTE = "\n\n*Report truncated to fit the SNS message limit; see the S3 archive for the full report.*"
 
 
 def _get_sns_client():
-    """Lazy initialization of SNS client."""
-    global _sns_client
-    if _sns_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _sns_client = boto3.client("sns", region_name=region, config=BOTO3_CONFIG)
-    return _sns_client
+    """Get the SNS client from the shared factory."""
+    return get_client("sns")
+
+
+def _truncate_message(report):
+    """Trim the report to the SNS size limit on a UTF-8 character boundary."""
+    encoded = report.encode("utf-8")
+    if len(encoded) <= MAX_MESSAGE_BYTES:
+        return report
+    budget = MAX_MESSAGE_BYTES - len(TRUNCATION_NOTE.encode("utf-8"))
+    logger.warning(f"Report is {len(encoded)} bytes, truncating to the SNS message limit")
+    return encoded[:budget].decode("utf-8", errors="ignore") + TRUNCATION_NOTE
 
 
 def send_report(report):
@@ -30,6 +36,6 @@ def send_report(report):
     sns.publish(
         TopicArn=topic_arn,
         Subject="AWS Waste Hunter – Weekly Cost Optimization Report",
-        Message=report,
+        Message=_truncate_message(report),
     )
     logger.info("Report sent successfully via SNS")
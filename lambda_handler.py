@@ -1,66 +1,517 @@
 # lambda_handler.py
+import io
+import json
 import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from datetime import datetime, timezone
 from utils.logging_config import setup_logging
 
 # Initialize logging first
 logger = setup_logging()
 
-from scanner.ebs_scanner import scan_unattached_ebs
-from scanner.ec2_scanner import scan_idle_ec2
-from scanner.elb_scanner import scan_unused_elb
-from scanner.rds_scanner import scan_stopped_rds
+from utils.aws_helpers import (
+    assume_role_credentials,
+    configure_client_pool,
+    discover_regions,
+    get_client,
+    get_client_stats,
+    reset_client_stats,
+)
+from utils.cassette import flush_active
+from utils.checkpoint import Checkpoint, Cursor, Deadline, DeadlineReached, resume
+from utils.lazy import lazy
+from utils.metrics import emit_emf, stage, stage_iter, start_run
+from utils.shards import iter_shard, shard_key, shard_prefix, write_shard
+from utils.storage import open_store
 
-from cost_engine.estimator import estimate_monthly_waste
-from compliance.tag_checker import check_tag_compliance
-from reporting.report_builder import build_report
-from delivery.sns_sender import send_report
-from delivery.s3_archiver import archive_report
+# Pipeline stages are imported on first use: a cold start that only plans shards, merges
+# them or fails config validation never pays for the scanners or the jinja2 templates
+scan_unattached_ebs, iter_unattached_ebs = lazy("scanner.ebs_scanner", "scan_unattached_ebs", "iter_unattached_ebs")
+scan_idle_ec2, iter_idle_ec2 = lazy("scanner.ec2_scanner", "scan_idle_ec2", "iter_idle_ec2")
+scan_unused_elb, iter_unused_elb = lazy("scanner.elb_scanner", "scan_unused_elb", "iter_unused_elb")
+scan_stopped_rds, iter_stopped_rds = lazy("scanner.rds_scanner", "scan_stopped_rds", "iter_stopped_rds")
 
+estimate_monthly_waste, iter_annotated_waste, iter_monthly_waste = lazy(
+    "cost_engine.estimator", "estimate_monthly_waste", "iter_annotated_waste", "iter_monthly_waste"
+)
+check_tag_compliance, iter_tag_violations = lazy("compliance.tag_checker", "check_tag_compliance", "iter_tag_violations")
+ReportWriter, build_report = lazy("reporting.report_builder", "ReportWriter", "build_report")
+send_report = lazy("delivery.sns_sender", "send_report")
+archive_report = lazy("delivery.s3_archiver", "archive_report")
 
-def _safe_scan(name, func, errors):
-    """Execute scanner with error handling."""
+DEFAULT_SCAN_CONCURRENCY = 4
+DEFAULT_SCAN_ROLE_NAME = "WasteHunterScanRole"
+STREAM_QUEUE_SIZE = 1000  # Records buffered per work item in streaming mode
+DEFAULT_TIME_RESERVE_MS = 60000  # Kept back from the Lambda timeout for checkpointing and reporting
+DEFAULT_CHECKPOINT_MAX_AGE_HOURS = 24
+DEFAULT_RUN_ID = "latest"
+DEFAULT_CONTINUATION_MODE = "invoke"
+
+# Scanner names, resolved against module globals at call time. In streaming mode
+# the matching iter_* generator is used instead of the scan_* list function.
+SCANNERS = [
+    "scan_unattached_ebs",
+    "scan_idle_ec2",
+    "scan_unused_elb",
+    "scan_stopped_rds",
+]
+
+_END_OF_ITEM = object()
+
+
+def _get_scan_concurrency():
+    """Get scanner concurrency from env var with validation."""
+    try:
+        concurrency = int(os.getenv("SCAN_CONCURRENCY", str(DEFAULT_SCAN_CONCURRENCY)))
+        if concurrency < 1:
+            logger.warning(f"Invalid SCAN_CONCURRENCY {concurrency}, using default {DEFAULT_SCAN_CONCURRENCY}")
+            concurrency = DEFAULT_SCAN_CONCURRENCY
+    except ValueError:
+        logger.warning(f"Invalid SCAN_CONCURRENCY format, using default {DEFAULT_SCAN_CONCURRENCY}")
+        concurrency = DEFAULT_SCAN_CONCURRENCY
+    return concurrency
+
+
+def _get_pipeline_mode():
+    """Get pipeline mode from env var: "list" (default) or "streaming"."""
+    mode = os.getenv("PIPELINE_MODE", "list").lower()
+    if mode not in ("list", "streaming"):
+        logger.warning(f"Invalid PIPELINE_MODE '{mode}', using 'list'")
+        mode = "list"
+    return mode
+
+
+def _get_time_reserve_ms():
+    """Get the time kept back from the deadline from env var with validation."""
+    try:
+        reserve = int(os.getenv("TIME_RESERVE_MS", str(DEFAULT_TIME_RESERVE_MS)))
+        if reserve < 0:
+            logger.warning(f"Invalid TIME_RESERVE_MS {reserve}, using default {DEFAULT_TIME_RESERVE_MS}")
+            reserve = DEFAULT_TIME_RESERVE_MS
+    except ValueError:
+        logger.warning(f"Invalid TIME_RESERVE_MS format, using default {DEFAULT_TIME_RESERVE_MS}")
+        reserve = DEFAULT_TIME_RESERVE_MS
+    return reserve
+
+
+def _get_checkpoint_max_age():
+    """Get the checkpoint max age in hours from env var with validation."""
+    try:
+        hours = float(os.getenv("CHECKPOINT_MAX_AGE_HOURS", str(DEFAULT_CHECKPOINT_MAX_AGE_HOURS)))
+    except ValueError:
+        logger.warning(f"Invalid CHECKPOINT_MAX_AGE_HOURS format, using default {DEFAULT_CHECKPOINT_MAX_AGE_HOURS}")
+        hours = DEFAULT_CHECKPOINT_MAX_AGE_HOURS
+    return hours
+
+
+def _get_continuation_mode():
+    """
+    Get how a checkpointed run continues after the deadline from CONTINUATION_MODE:
+    "invoke" (default) re-invokes the function, "external" leaves it to the caller (e.g. a
+    Step Functions loop) and "none" reports what was found instead of checkpointing.
+    """
+    mode = os.getenv("CONTINUATION_MODE", DEFAULT_CONTINUATION_MODE).lower()
+    if mode not in ("invoke", "external", "none"):
+        logger.warning(f"Invalid CONTINUATION_MODE '{mode}', using '{DEFAULT_CONTINUATION_MODE}'")
+        mode = DEFAULT_CONTINUATION_MODE
+    return mode
+
+
+def _open_checkpoint(event):
+    """
+    Open the checkpoint for event["run_id"] (default "latest") in CHECKPOINT_LOCATION,
+    a local directory or s3://bucket/prefix.
+    """
+    run_id = (event or {}).get("run_id") or DEFAULT_RUN_ID
+    store = open_store(os.environ["CHECKPOINT_LOCATION"])
+    return Checkpoint.load(store, run_id, _get_checkpoint_max_age())
+
+
+def _get_shard_store():
+    """Store for sharded partial results from SHARD_RESULTS_LOCATION (local dir or s3://bucket/prefix)."""
+    location = os.getenv("SHARD_RESULTS_LOCATION")
+    if not location:
+        raise ValueError("SHARD_RESULTS_LOCATION is required for sharded runs")
+    return open_store(location)
+
+
+def _discover_regions():
+    """Discover enabled regions using the EC2 client for the home region."""
+    return discover_regions(get_client("ec2"))
+
+
+def _get_scan_regions(event, errors):
+    """
+    Resolve regions to scan from event["regions"] or the SCAN_REGIONS env var.
+    Returns None for the default single-region scan. "all" discovers enabled regions.
+    """
+    regions = (event or {}).get("regions") or os.getenv("SCAN_REGIONS", "")
+    if isinstance(regions, str):
+        regions = [r.strip() for r in regions.split(",") if r.strip()]
+    if not regions:
+        return None
+
+    if [r.lower() for r in regions] == ["all"]:
+        try:
+            regions = _discover_regions()
+            logger.info(f"Discovered {len(regions)} enabled regions")
+        except Exception as exc:
+            logger.error(f"Error discovering regions: {exc}", exc_info=True)
+            errors.append({"stage": "discover_regions", "error": str(exc), "type": type(exc).__name__})
+            return None
+
+    # Preserve order, drop duplicates
+    return list(dict.fromkeys(regions))
+
+
+def _get_scan_accounts(event):
+    """
+    Resolve member accounts and role name from the event or SCAN_ACCOUNTS/SCAN_ROLE_NAME.
+    Returns (None, None) to scan only the account the Lambda runs in.
+    """
+    event = event or {}
+    accounts = event.get("accounts") or os.getenv("SCAN_ACCOUNTS", "")
+    if isinstance(accounts, str):
+        accounts = [a.strip() for a in accounts.split(",") if a.strip()]
+    if not accounts:
+        return None, None
+
+    role_name = event.get("role_name") or os.getenv("SCAN_ROLE_NAME", DEFAULT_SCAN_ROLE_NAME)
+    return list(dict.fromkeys(str(a) for a in accounts)), role_name
+
+
+def _iter_work_item(func, region=None, account_id=None, role_name=None):
+    """
+    Run a scanner for one (account, region) work item, yielding its records.
+    Records inherit the scanned region when they lack one and are tagged with the account.
+    """
+    kwargs = {"region": region}
+    if account_id:
+        kwargs["credentials"] = assume_role_credentials(account_id, role_name)
+
+    for r in func(**kwargs):
+        if region and not r.get("region"):
+            r = {**r, "region": region}
+        if account_id:
+            r = {**r, "account_id": account_id}
+        yield r
+
+
+def _bind_work_item(func, region=None, account_id=None, role_name=None, streaming=False):
+    """Bind a scanner to one (account, region) work item."""
+    def scan():
+        records = _iter_work_item(func, region, account_id, role_name)
+        return records if streaming else list(records)
+    return scan
+
+
+def _scanner_func(name, streaming=False):
+    if streaming:
+        name = name.replace("scan_", "iter_", 1)
+    return globals()[name]
+
+
+def _build_work_items(regions, accounts, role_name, streaming=False):
+    """Build (name, scan) work items for every account x region x scanner."""
+    if regions is None and accounts is None:
+        return [(name, _scanner_func(name, streaming)) for name in SCANNERS]
+
+    items = []
+    for account_id in accounts or [None]:
+        for region in regions or [None]:
+            scope = "/".join(p for p in (account_id, region) if p)
+            for name in SCANNERS:
+                scan = _bind_work_item(_scanner_func(name, streaming), region, account_id, role_name, streaming)
+                items.append((f"{name}[{scope}]", scan))
+    return items
+
+
+def _budget_error(name):
+    return {"stage": name, "error": "Time budget exhausted", "type": "DeadlineReached"}
+
+
+def _within_budget(deadline, stop=None):
+    """
+    Make this thread's listings end at the next page with DeadlineReached once deadline
+    passes or stop is set. Nothing is recorded for resuming, so listings are not split into
+    chunks; without a deadline it is a no-op.
+    """
+    if deadline is None:
+        return nullcontext()
+    return resume(Cursor(deadline, stop=stop, resumable=False))
+
+
+def _safe_scan(name, func, errors, durations=None, deadline=None):
+    """
+    Execute scanner with error handling. With a deadline, a scanner stopped by it keeps the
+    records found so far and the stop is recorded as an error.
+    """
+    started = time.perf_counter()
+    result = []
     try:
+        if deadline is not None and deadline.expired():
+            raise DeadlineReached(f"Time budget exhausted before {name}")
         logger.info(f"Starting {name}")
-        result = func()
+        with stage(name) as record, _within_budget(deadline):
+            for resource in func():
+                result.append(resource)
+                record.add_items()
         logger.info(f"Completed {name}, found {len(result)} resources")
         return result
+    except DeadlineReached:
+        logger.warning(f"Stopping {name} after {len(result)} resources, time budget exhausted")
+        errors.append(_budget_error(name))
+        return result
     except Exception as exc:
         logger.error(f"Error in {name}: {exc}", exc_info=True)
         errors.append({"stage": name, "error": str(exc), "type": type(exc).__name__})
         return []
+    finally:
+        if durations is not None:
+            durations[name] = round(time.perf_counter() - started, 3)
+
+
+def _run_scanners(scanners, errors, durations, deadline=None):
+    """
+    Run scanners on a bounded thread pool, each stopping at deadline when given.
+    Results are concatenated in scanner order regardless of completion order.
+    """
+    concurrency = min(_get_scan_concurrency(), len(scanners)) or 1
+    logger.info(f"Running {len(scanners)} scanners with concurrency {concurrency}")
+
+    if concurrency == 1:
+        results = [_safe_scan(name, func, errors, durations, deadline) for name, func in scanners]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(_safe_scan, name, func, errors, durations, deadline)
+                for name, func in scanners
+            ]
+            results = [f.result() for f in futures]
+
+    resources = []
+    for result in results:
+        resources += result
+    return resources
+
+
+def _scan_within_budget(name, func, checkpoint, deadline, errors, durations, stop):
+    """
+    Run one work item under the time budget, resuming from its checkpointed cursor.
+    Finished and failed items are marked complete; items stopped at the deadline, or by stop
+    at a page boundary, are paused with their page tokens and the records found before them.
+    """
+    if deadline.expired() or stop.is_set():
+        return
+    cursor = checkpoint.cursor(name, deadline, stop)
+    started = time.perf_counter()
+    try:
+        logger.info(f"Starting {name}")
+        with stage(name) as record, resume(cursor):
+            for resource in func():
+                cursor.records.append(resource)
+                record.add_items()
+        checkpoint.complete(name, cursor.records)
+        logger.info(f"Completed {name}, found {len(cursor.records)} resources")
+    except DeadlineReached:
+        logger.info(f"Pausing {name} after {len(cursor.records)} resources, time budget exhausted")
+        checkpoint.pause(name, cursor)
+    except Exception as exc:
+        logger.error(f"Error in {name}: {exc}", exc_info=True)
+        errors.append({"stage": name, "error": str(exc), "type": type(exc).__name__})
+        checkpoint.complete(name, [])
+    finally:
+        durations[name] = round(durations.get(name, 0) + time.perf_counter() - started, 3)
+
+
+def _seconds_until(deadline, reserve_left_ms):
+    """Seconds until only reserve_left_ms of the Lambda timeout is left, or None without a deadline."""
+    remaining = deadline.remaining_ms()
+    if remaining is None:
+        return None
+    return max(remaining + deadline.reserve_ms - reserve_left_ms, 0) / 1000
+
+
+def _run_scanners_within_budget(scanners, checkpoint, deadline, errors, durations):
+    """
+    Run the work items not yet complete in checkpoint until the deadline. Items still
+    running when half the reserve is spent are told to stop at their next page or metric
+    batch and joined until a quarter of it is left. Items stuck in a single call past that
+    are not waited for, so the checkpoint is still saved in time; their last saved position
+    is resumed next time. Returns True once every work item is complete.
+    """
+    pending = [(name, func) for name, func in scanners if name not in checkpoint.completed]
+    if not pending:
+        return True
+
+    concurrency = min(_get_scan_concurrency(), len(pending))
+    logger.info(f"Running {len(pending)} of {len(scanners)} work items with concurrency {concurrency}")
+
+    stop = threading.Event()
+    running = ()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = [
+            pool.submit(_scan_within_budget, name, func, checkpoint, deadline, errors, durations, stop)
+            for name, func in pending
+        ]
+        _, running = wait(futures, timeout=_seconds_until(deadline, deadline.reserve_ms / 2))
+        if running:
+            logger.warning(f"Stopping {len(running)} work items still running at the deadline")
+            stop.set()
+            _, running = wait(running, timeout=_seconds_until(deadline, deadline.reserve_ms / 4))
+        if running:
+            logger.error(f"Not waiting for {len(running)} work items that did not stop in time")
+    finally:
+        stop.set()
+        pool.shutdown(wait=not running, cancel_futures=True)
+
+    return all(name in checkpoint.completed for name, _ in scanners)
+
+
+def _save_checkpoint(checkpoint, errors, durations):
+    """Persist scan progress. Returns False, recording an error, if it could not be saved."""
+    checkpoint.errors = list(errors)
+    checkpoint.durations = dict(durations)
+    try:
+        checkpoint.save()
+        return True
+    except Exception as exc:
+        logger.error(f"Error saving checkpoint: {exc}", exc_info=True)
+        errors.append({"stage": "checkpoint", "error": str(exc), "type": type(exc).__name__})
+        return False
+
+
+def _continue_run(event, context, run_id, errors):
+    """Invoke this function again asynchronously when CONTINUATION_MODE=invoke."""
+    if _get_continuation_mode() != "invoke":
+        return
+    try:
+        get_client("lambda").invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType="Event",
+            Payload=json.dumps({**(event or {}), "run_id": run_id}).encode("utf-8"),
+        )
+        logger.info(f"Invoked continuation of run {run_id}")
+    except Exception as exc:
+        logger.error(f"Error invoking continuation: {exc}", exc_info=True)
+        errors.append({"stage": "continuation", "error": str(exc), "type": type(exc).__name__})
+
+
+def _put_record(out, record, stop):
+    """Put a record on a bounded queue, giving up once the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            out.put(record, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _stream_work_item(name, func, out, stop, errors, durations, deadline=None):
+    """
+    Feed one work item's records into its queue with the same error isolation as _safe_scan.
+    Listings end at the next page once the consumer stops, or at the deadline when given.
+    """
+    if stop.is_set():
+        return
+    started = time.perf_counter()
+    found = 0
+    try:
+        if deadline is not None and deadline.expired():
+            raise DeadlineReached(f"Time budget exhausted before {name}")
+        logger.info(f"Starting {name}")
+        with stage(name) as metrics, _within_budget(deadline, stop):
+            for record in func():
+                if not _put_record(out, record, stop):
+                    return
+                found += 1
+                metrics.add_items()
+        logger.info(f"Completed {name}, found {found} resources")
+    except DeadlineReached:
+        # A stop set by the consumer is not a budget error
+        if not stop.is_set():
+            logger.warning(f"Stopping {name} after {found} resources, time budget exhausted")
+            errors.append(_budget_error(name))
+    except Exception as exc:
+        logger.error(f"Error in {name}: {exc}", exc_info=True)
+        errors.append({"stage": name, "error": str(exc), "type": type(exc).__name__})
+    finally:
+        durations[name] = round(time.perf_counter() - started, 3)
+        _put_record(out, _END_OF_ITEM, stop)
+
+
+def _stream_work_items(scanners, errors, durations, counts, deadline=None):
+    """
+    Run work items on a bounded thread pool and yield their records as they arrive.
+    Each item feeds its own bounded queue, drained in item order, so output order matches
+    _run_scanners. Records a scanner yielded before failing are kept.
+    """
+    concurrency = min(_get_scan_concurrency(), len(scanners)) or 1
+    logger.info(f"Streaming {len(scanners)} scanners with concurrency {concurrency}")
+
+    queues = [queue.Queue(maxsize=STREAM_QUEUE_SIZE) for _ in scanners]
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for (name, func), out in zip(scanners, queues):
+            pool.submit(_stream_work_item, name, func, out, stop, errors, durations, deadline)
+        for out in queues:
+            while True:
+                record = out.get()
+                if record is _END_OF_ITEM:
+                    break
+                counts["resources"] += 1
+                yield record
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _guard_stage(stage, items, errors):
+    """Pass items through, recording a stage error and stopping if the stream raises."""
+    try:
+        yield from items
+    except Exception as e:
+        logger.error(f"Error in {stage}: {e}", exc_info=True)
+        errors.append({"stage": stage, "error": str(e), "type": type(e).__name__})
 
 
 def _safe_deliver(name, func, report, errors):
     """Execute delivery with error handling."""
     try:
         logger.info(f"Starting {name}")
-        func(report)
+        with stage(name) as record:
+            func(report)
+            record.add_items()
         logger.info(f"Completed {name}")
     except Exception as exc:
         logger.error(f"Error in {name}: {exc}", exc_info=True)
         errors.append({"stage": name, "error": str(exc), "type": type(exc).__name__})
 
 
-def handler(event, context):
-    """Main Lambda handler for AWS Waste Hunter."""
-    logger.info("AWS Waste Hunter started")
-    logger.info(f"Event: {event}")
-    
-    resources = []
-    scan_errors = []
-    delivery_errors = []
-
-    # Run all scanners
-    resources += _safe_scan("scan_unattached_ebs", scan_unattached_ebs, scan_errors)
-    resources += _safe_scan("scan_idle_ec2", scan_idle_ec2, scan_errors)
-    resources += _safe_scan("scan_unused_elb", scan_unused_elb, scan_errors)
-    resources += _safe_scan("scan_stopped_rds", scan_stopped_rds, scan_errors)
+def _run_list_pipeline(scanners, scan_errors, delivery_errors, scan_durations, resources=None, deadline=None):
+    """
+    Run every stage over fully materialised lists. Returns (resource count, total).
+    resources, when given, are the already scanned records and scanners are not run.
+    """
+    if resources is None:
+        resources = _run_scanners(scanners, scan_errors, scan_durations, deadline)
 
     logger.info(f"Total resources found: {len(resources)}")
 
     # Estimate costs
     try:
-        estimated, total = estimate_monthly_waste(resources)
+        with stage("cost_estimation") as record:
+            estimated, total = estimate_monthly_waste(resources)
+            record.add_items(len(estimated))
         logger.info(f"Cost estimation complete, total waste: ${total}")
     except Exception as e:
         logger.error(f"Error estimating costs: {e}", exc_info=True)
@@ -69,7 +520,9 @@ def handler(event, context):
 
     # Check compliance
     try:
-        violations = check_tag_compliance(estimated)
+        with stage("tag_compliance") as record:
+            violations = check_tag_compliance(estimated)
+            record.add_items(len(violations))
         logger.info(f"Found {len(violations)} tag compliance violations")
     except Exception as e:
         logger.error(f"Error checking compliance: {e}", exc_info=True)
@@ -78,7 +531,9 @@ def handler(event, context):
 
     # Build report
     try:
-        report = build_report(estimated, total, violations, scan_errors, delivery_errors)
+        with stage("build_report") as record:
+            report = build_report(estimated, total, violations, scan_errors, delivery_errors)
+            record.add_items(len(estimated))
     except Exception as e:
         logger.error(f"Error building report: {e}", exc_info=True)
         report = f"Error building report: {e}"
@@ -86,14 +541,334 @@ def handler(event, context):
     # Deliver report
     _safe_deliver("send_report", send_report, report, delivery_errors)
     _safe_deliver("archive_report", archive_report, report, delivery_errors)
+    return len(resources), total
+
+
+def _run_streaming_pipeline(scanners, scan_errors, delivery_errors, scan_durations, resources=None, deadline=None):
+    """
+    Stream records through estimation, compliance and report rendering one at a time.
+    The report is spooled to a temporary file, archived from it and sent (truncated to
+    the SNS limit if needed), so no stage holds the full resource list. Returns
+    (resource count, total). resources, when given, replace the scanners as the source.
+    """
+    counts = {"resources": 0}
+    totals = {"resources": 0, "total": 0}
+    if resources is None:
+        records = _stream_work_items(scanners, scan_errors, scan_durations, counts, deadline)
+    else:
+        counts["resources"] = len(resources)
+        records = iter(resources)
+    estimated = _guard_stage(
+        "cost_estimation", stage_iter("cost_estimation", iter_monthly_waste(records, totals)), scan_errors
+    )
+    _report_stream(estimated, totals, scan_errors, delivery_errors)
+    logger.info(f"Streamed {counts['resources']} resources, total waste: ${totals['total']}")
+    return counts["resources"], totals["total"]
+
+
+def _report_stream(estimated, totals, scan_errors, delivery_errors):
+    """
+    Check compliance on and render a stream of estimated resources, then deliver the report.
+    totals is read once the stream is exhausted.
+    """
+    from delivery.sns_sender import MAX_MESSAGE_BYTES
+
+    with ReportWriter() as writer, tempfile.TemporaryFile() as report_file:
+        tee = stage_iter("build_report", writer.tee_resources(estimated))
+        try:
+            for violation in stage_iter("tag_compliance", iter_tag_violations(tee)):
+                writer.add_violation(violation)
+        except Exception as e:
+            logger.error(f"Error checking compliance: {e}", exc_info=True)
+            scan_errors.append({"stage": "tag_compliance", "error": str(e), "type": type(e).__name__})
+            # Keep the remaining resources in the report
+            for _ in tee:
+                pass
+
+        total = totals["total"]
+        logger.info(f"Reporting {writer.resource_count} resources, {writer.violation_count} tag compliance violations")
+
+        # Build report
+        try:
+            with stage("build_report"):
+                text = io.TextIOWrapper(report_file, encoding="utf-8", newline="")
+                writer.write(text, total, scan_errors, delivery_errors)
+                text.flush()
+                text.detach()
+        except Exception as e:
+            logger.error(f"Error building report: {e}", exc_info=True)
+            report_file.seek(0)
+            report_file.truncate()
+            report_file.write(f"Error building report: {e}".encode("utf-8"))
+
+        # Deliver report
+        report_file.seek(0)
+        message = report_file.read(MAX_MESSAGE_BYTES + 1).decode("utf-8", errors="ignore")
+        _safe_deliver("send_report", send_report, message, delivery_errors)
+        report_file.seek(0)
+        _safe_deliver("archive_report", archive_report, report_file, delivery_errors)
+
+
+def _finish(result):
+    """Emit the run's metrics and flush recordings before returning result."""
+    # One EMF line per run: CloudWatch Logs turns it into metrics without PutMetricData calls
+    try:
+        emit_emf(result["metrics"])
+    except Exception as e:
+        logger.error(f"Error emitting metrics: {e}", exc_info=True)
+
+    # Close the recorded cassette segment so the file is complete even if the container is frozen
+    flush_active()
+
+    logger.info(f"AWS Waste Hunter completed: {result}")
+    return result
+
+
+def handler(event, context):
+    """Main Lambda handler for AWS Waste Hunter."""
+    logger.info("AWS Waste Hunter started")
+    logger.info(f"Event: {event}")
+    
+    scan_errors = []
+    delivery_errors = []
+    scan_durations = {}
+
+    run_metrics = start_run()
+    reset_client_stats()
+    configure_client_pool(_get_scan_concurrency())
+
+    # One shard of a fanned-out run: scan it and write its partial results
+    if (event or {}).get("shard"):
+        return _finish(_run_shard(event, run_metrics))
+
+    # Run all scanners, fanned out per account and region when configured
+    regions = _get_scan_regions(event, scan_errors)
+    accounts, role_name = _get_scan_accounts(event)
+    if regions:
+        logger.info(f"Scanning {len(regions)} regions: {regions}")
+    if accounts:
+        logger.info(f"Scanning {len(accounts)} accounts via role {role_name}")
+
+    streaming = _get_pipeline_mode() == "streaming"
+    deadline = Deadline(context, _get_time_reserve_ms())
+    checkpoint = None
+    resources = None
+    if os.getenv("CHECKPOINT_LOCATION"):
+        # Scan under the time budget, resuming any checkpointed progress of this run
+        checkpoint = _open_checkpoint(event)
+        scan_errors.extend(checkpoint.errors)
+        scan_durations.update(checkpoint.durations)
+        scanners = _build_work_items(regions, accounts, role_name, streaming=True)
+        finished = _run_scanners_within_budget(scanners, checkpoint, deadline, scan_errors, scan_durations)
+        names = [name for name, _ in scanners]
+
+        # With no continuation coming, a saved checkpoint would only expire unreported
+        continues = _get_continuation_mode() != "none"
+        if not finished and continues and _save_checkpoint(checkpoint, scan_errors, scan_durations):
+            _continue_run(event, context, checkpoint.run_id, scan_errors)
+            result = {
+                "status": "incomplete",
+                "run_id": checkpoint.run_id,
+                "completed": sum(1 for name in names if name in checkpoint.completed),
+                "pending": sum(1 for name in names if name not in checkpoint.completed),
+                "resources": len(checkpoint.records(names)),
+                "scan_errors": len(scan_errors),
+                "scan_durations": scan_durations,
+                "continuation": {**(event or {}), "run_id": checkpoint.run_id},
+                "clients": get_client_stats(),
+                "metrics": run_metrics.as_dict(),
+            }
+            return _finish(result)
+
+        # Without a continuation, or when the checkpoint could not be saved, report what
+        # was found before the deadline
+        for name in names:
+            if name not in checkpoint.completed:
+                scan_errors.append(_budget_error(name))
+        resources = checkpoint.records(names)
+        deadline = None
+    elif deadline.remaining_ms() is None:
+        deadline = None
+
+    if resources is None:
+        # Under a deadline, list mode also iterates the scanners so stopped ones keep their records
+        scanners = _build_work_items(regions, accounts, role_name, streaming or deadline is not None)
+
+    if streaming:
+        resource_count, total = _run_streaming_pipeline(
+            scanners, scan_errors, delivery_errors, scan_durations, resources, deadline
+        )
+    else:
+        resource_count, total = _run_list_pipeline(
+            scanners, scan_errors, delivery_errors, scan_durations, resources, deadline
+        )
+
+    if checkpoint is not None:
+        try:
+            checkpoint.delete()
+        except Exception as e:
+            logger.error(f"Error deleting checkpoint: {e}", exc_info=True)
 
     result = {
         "status": "ok" if not scan_errors and not delivery_errors else "partial",
-        "resources": len(resources),
+        "resources": resource_count,
         "monthly_waste": total,
         "scan_errors": len(scan_errors),
         "delivery_errors": len(delivery_errors),
+        "scan_durations": scan_durations,
+        "clients": get_client_stats(),
+        "metrics": run_metrics.as_dict(),
     }
-    
-    logger.info(f"AWS Waste Hunter completed: {result}")
-    return result
+    return _finish(result)
+
+
+def _shard_work_item(event):
+    """Bind the scanner named by event["shard"] to its account and region."""
+    shard = event["shard"]
+    scanner = shard.get("scanner")
+    if scanner not in SCANNERS:
+        raise ValueError(f"Unknown scanner in shard: {scanner}")
+    region, account_id = shard.get("region"), shard.get("account_id")
+    role_name = None
+    if account_id:
+        role_name = event.get("role_name") or os.getenv("SCAN_ROLE_NAME", DEFAULT_SCAN_ROLE_NAME)
+    scope = "/".join(str(p) for p in (account_id, region) if p)
+    name = f"{scanner}[{scope}]" if scope else scanner
+    return name, _bind_work_item(_scanner_func(scanner), region, account_id, role_name)
+
+
+def _run_shard(event, run_metrics):
+    """Scan and estimate one shard, writing its annotated resources for the aggregator."""
+    scan_errors = []
+    scan_durations = {}
+    run_id = event.get("run_id") or DEFAULT_RUN_ID
+    try:
+        name, scan = _shard_work_item(event)
+        store = _get_shard_store()
+    except Exception as exc:
+        logger.error(f"Invalid shard event: {exc}", exc_info=True)
+        return {"status": "error", "error": str(exc), "metrics": run_metrics.as_dict()}
+
+    resources = _safe_scan(name, scan, scan_errors, scan_durations)
+    totals = {"resources": 0, "total": 0}
+    estimated = _guard_stage(
+        "cost_estimation", stage_iter("cost_estimation", iter_monthly_waste(resources, totals)), scan_errors
+    )
+
+    key = shard_key(run_id, name)
+    meta = {"shard": name, "errors": scan_errors, "durations": scan_durations}
+    try:
+        with stage("write_shard") as record:
+            record.add_items(write_shard(store, key, estimated, meta))
+    except Exception as exc:
+        logger.error(f"Error writing shard {key}: {exc}", exc_info=True)
+        return {"status": "error", "shard": name, "error": str(exc), "metrics": run_metrics.as_dict()}
+
+    return {
+        "status": "ok" if not scan_errors else "partial",
+        "run_id": run_id,
+        "shard": name,
+        "key": key,
+        "resources": totals["resources"],
+        "monthly_waste": totals["total"],
+        "scan_errors": len(scan_errors),
+        "scan_durations": scan_durations,
+        "metrics": run_metrics.as_dict(),
+    }
+
+
+def plan_handler(event, context):
+    """
+    Expand the configured accounts, regions and scanners into one shard event per work
+    item, for a Step Functions Map state or any other driver to fan out to handler.
+    """
+    event = event or {}
+    errors = []
+    run_id = event.get("run_id") or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    regions = _get_scan_regions(event, errors)
+    accounts, role_name = _get_scan_accounts(event)
+
+    shards = []
+    for account_id in accounts or [None]:
+        for region in regions or [None]:
+            for scanner in SCANNERS:
+                shard = {"scanner": scanner}
+                if account_id:
+                    shard["account_id"] = account_id
+                if region:
+                    shard["region"] = region
+                shards.append({"run_id": run_id, "shard": shard, **({"role_name": role_name} if role_name else {})})
+
+    logger.info(f"Planned {len(shards)} shards for run {run_id}")
+    return {"run_id": run_id, "shards": shards, "errors": errors}
+
+
+def _iter_shards(store, keys, errors):
+    """Stream records from each shard in turn, collecting the errors each shard recorded."""
+    for key in keys:
+        meta = {}
+        try:
+            yield from iter_shard(store, key, meta)
+        except Exception as exc:
+            logger.error(f"Error reading shard {key}: {exc}", exc_info=True)
+            errors.append({"stage": f"merge_shards[{key}]", "error": str(exc), "type": type(exc).__name__})
+            continue
+        errors.extend(meta.get("errors", []))
+
+
+def aggregate_handler(event, context):
+    """
+    Merge the partial results of a sharded run and deliver one report. Shards are read
+    one record at a time, so memory does not grow with the number of shards. event["shards"]
+    may list the shard handler results (e.g. a Map state's output); otherwise every shard
+    written under event["run_id"] is merged.
+    """
+    event = event or {}
+    logger.info("AWS Waste Hunter aggregation started")
+    scan_errors = []
+    delivery_errors = []
+    run_metrics = start_run()
+    reset_client_stats()
+    run_id = event.get("run_id") or DEFAULT_RUN_ID
+
+    try:
+        store = _get_shard_store()
+    except Exception as exc:
+        logger.error(f"Error opening shard store: {exc}", exc_info=True)
+        scan_errors.append({"stage": "merge_shards", "error": str(exc), "type": type(exc).__name__})
+        store = None
+
+    keys = []
+    if event.get("shards"):
+        keys = [shard["key"] for shard in event["shards"] if shard.get("key")]
+        # Shards that failed before writing their results have no key
+        for shard in event["shards"]:
+            if not shard.get("key"):
+                error = shard.get("error", "No results written")
+                scan_errors.append({"stage": shard.get("shard", "shard"), "error": error, "type": "ShardFailed"})
+    elif store is not None:
+        keys = list(store.iter_keys(shard_prefix(run_id)))
+        # Nothing to merge usually means a wrong run_id or location, not a clean estate
+        if not keys:
+            scan_errors.append({
+                "stage": "merge_shards",
+                "error": f"No shards found for run {run_id} in {store}",
+                "type": "NoShards",
+            })
+
+    totals = {"resources": 0, "total": 0}
+    records = stage_iter("merge_shards", _iter_shards(store, keys, scan_errors))
+    merged = _guard_stage("merge_shards", iter_annotated_waste(records, totals), scan_errors)
+    _report_stream(merged, totals, scan_errors, delivery_errors)
+
+    result = {
+        "status": "ok" if not scan_errors and not delivery_errors else "partial",
+        "run_id": run_id,
+        "resources": totals["resources"],
+        "monthly_waste": totals["total"],
+        "scan_errors": len(scan_errors),
+        "delivery_errors": len(delivery_errors),
+        "clients": get_client_stats(),
+        "metrics": run_metrics.as_dict(),
+    }
+    return _finish(result)
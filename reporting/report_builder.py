@@ -1,45 +1,54 @@
-from jinja2 import Template
+import io
 import logging
+import shutil
+import tempfile
+from jinja2 import Environment
 
 logger = logging.getLogger(__name__)
 
+SPOOL_SIZE = 1 << 20  # Rendered sections stay in memory up to 1 MiB, then spill to disk
 
-def build_report(resources, total_cost, violations, scan_errors=None, delivery_errors=None):
-    """Build formatted Markdown report from scan results."""
-    scan_errors = scan_errors or []
-    delivery_errors = delivery_errors or []
-    
-    logger.info(f"Building report with {len(resources)} resources, {len(violations)} violations")
-    
-    template = Template("""
+# The report is rendered in sections so resources and violations can be streamed in
+# one at a time; the summary counts are only known once both streams are exhausted.
+_env = Environment(keep_trailing_newline=True)
+
+HEADER_TEMPLATE = _env.from_string("""
 # AWS Waste Hunter — Weekly Cost Optimization Report
 
 ## Summary
 **Total Monthly Waste:** ${{ total_cost }}
-**Resources Found:** {{ resources|length }}
-**Tag Violations:** {{ violations|length }}
+**Resources Found:** {{ resource_count }}
+**Tag Violations:** {{ violation_count }}
 **Scan Errors:** {{ scan_errors|length }}
 **Delivery Errors:** {{ delivery_errors|length }}
 
 ## Wasted Resources
-{% for r in resources %}
+""")
+
+RESOURCE_TEMPLATE = _env.from_string("""
 - **{{ r.type }}{% if r.lb_type %} ({{ r.lb_type }}){% endif %} {{ r.id }}**{% if r.avg_cpu %} - CPU: {{ r.avg_cpu }}%{% endif %}{% if r.instance_type %} - {{ r.instance_type }}{% endif %}{% if r.instance_class %} - {{ r.instance_class }}{% endif %}
-  - Location: {{ r.az }}{% if r.region %} ({{ r.region }}){% endif %}
+  - Location: {{ r.az }}{% if r.region %} ({{ r.region }}){% endif %}{% if r.account_id %} - Account: {{ r.account_id }}{% endif %}
   - Cost: ${{ r.monthly_cost }}/month
-{% endfor %}
-{% if resources|length == 0 %}
+""")
+
+VIOLATIONS_HEADER_TEMPLATE = _env.from_string("""
+{% if resource_count == 0 %}
 - None detected
 {% endif %}
 
 ## Tagging Violations
-{% for v in violations %}
+""")
+
+VIOLATION_TEMPLATE = _env.from_string("""
 - **{{ v.type }} {{ v.resource_id }}** 
   - Missing tags: {{ v.missing_tags|join(', ') }}
   {% if v.tags %}
   - Existing tags: {{ v.tags.keys()|list|join(', ') }}
   {% endif %}
-{% endfor %}
-{% if violations|length == 0 %}
+""")
+
+FOOTER_TEMPLATE = _env.from_string("""
+{% if violation_count == 0 %}
 - None detected
 {% endif %}
 
@@ -71,17 +80,82 @@ def build_report(resources, total_cost, violations, scan_errors=None, delivery_e
 - **Errors:** Review scan/delivery errors above and check IAM permissions
 
 ---
-*Report generated by AWS Waste Hunter*
-""")
+*Report generated by AWS Waste Hunter*""")
 
-    try:
-        return template.render(
-            resources=resources,
+
+class ReportWriter:
+    """
+    Render the report incrementally. Resource and violation entries are rendered as
+    they arrive and spooled to temporary files, so memory stays bounded for large estates.
+    """
+
+    def __init__(self, spool_size=SPOOL_SIZE):
+        self._resources = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+", encoding="utf-8")
+        self._violations = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+", encoding="utf-8")
+        self.resource_count = 0
+        self.violation_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._resources.close()
+        self._violations.close()
+
+    def add_resource(self, resource):
+        self._resources.write(RESOURCE_TEMPLATE.render(r=resource))
+        self.resource_count += 1
+
+    def add_violation(self, violation):
+        self._violations.write(VIOLATION_TEMPLATE.render(v=violation))
+        self.violation_count += 1
+
+    def tee_resources(self, resources):
+        """Add each resource to the report while passing it through to the next stage."""
+        for resource in resources:
+            self.add_resource(resource)
+            yield resource
+
+    def write(self, out, total_cost, scan_errors=None, delivery_errors=None):
+        """Write the complete report to the text stream out."""
+        counts = {"resource_count": self.resource_count, "violation_count": self.violation_count}
+        out.write(HEADER_TEMPLATE.render(
             total_cost=total_cost,
-            violations=violations,
-            scan_errors=scan_errors,
-            delivery_errors=delivery_errors,
-        )
+            scan_errors=scan_errors or [],
+            delivery_errors=delivery_errors or [],
+            **counts,
+        ))
+        self._resources.seek(0)
+        shutil.copyfileobj(self._resources, out)
+        out.write(VIOLATIONS_HEADER_TEMPLATE.render(**counts))
+        self._violations.seek(0)
+        shutil.copyfileobj(self._violations, out)
+        out.write(FOOTER_TEMPLATE.render(
+            scan_errors=scan_errors or [],
+            delivery_errors=delivery_errors or [],
+            **counts,
+        ))
+
+
+def build_report(resources, total_cost, violations, scan_errors=None, delivery_errors=None):
+    """Build formatted Markdown report from scan results."""
+    scan_errors = scan_errors or []
+    delivery_errors = delivery_errors or []
+
+    logger.info(f"Building report with {len(resources)} resources, {len(violations)} violations")
+
+    try:
+        with ReportWriter() as writer:
+            for r in resources:
+                writer.add_resource(r)
+            for v in violations:
+                writer.add_violation(v)
+            out = io.StringIO()
+            writer.write(out, total_cost, scan_errors, delivery_errors)
+            return out.getvalue()
     except Exception as e:
         logger.error(f"Error rendering report template: {e}", exc_info=True)
         raise
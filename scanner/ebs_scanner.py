@@ -1,38 +1,34 @@
 # scanner/ebs_scanner.py
-import boto3
 import logging
-import os
-from utils.aws_helpers import BOTO3_CONFIG, get_region_from_az
+from utils.aws_helpers import ec2_listing_pages, get_region_from_az, get_client
+from utils.checkpoint import DeadlineReached
 
 logger = logging.getLogger(__name__)
 
-_ec2_client = None
 
+def _get_ec2_client(region=None, credentials=None):
+    """Get the EC2 client for the region/credentials from the shared factory."""
+    return get_client("ec2", region, credentials)
 
-def _get_ec2_client():
-    """Lazy initialization of EC2 client."""
-    global _ec2_client
-    if _ec2_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _ec2_client = boto3.client("ec2", region_name=region, config=BOTO3_CONFIG)
-    return _ec2_client
 
-
-def scan_unattached_ebs():
-    """Scan for unattached EBS volumes."""
-    ec2 = _get_ec2_client()
-    volumes = []
+def iter_unattached_ebs(region=None, credentials=None):
+    """Yield unattached EBS volumes page by page."""
+    ec2 = _get_ec2_client(region, credentials)
+    found = 0
     logger.info("Starting EBS volume scan")
     
+    seen = set()
     try:
-        paginator = ec2.get_paginator("describe_volumes")
-
-        for page in paginator.paginate(
-            Filters=[{"Name": "status", "Values": ["available"]}]
+        for page in ec2_listing_pages(
+            ec2, "volumes", "describe_volumes", [{"Name": "status", "Values": ["available"]}]
         ):
             for v in page["Volumes"]:
+                if v["VolumeId"] in seen:
+                    continue
+                seen.add(v["VolumeId"])
                 az = v.get("AvailabilityZone", "")
-                volumes.append({
+                found += 1
+                yield {
                     "type": "EBS",
                     "id": v["VolumeId"],
                     "size_gb": v["Size"],
@@ -40,11 +36,16 @@ def scan_unattached_ebs():
                     "az": az,
                     "region": get_region_from_az(az),
                     "tags": {t["Key"]: t["Value"] for t in v.get("Tags", [])}
-                })
+                }
         
-        logger.info(f"Found {len(volumes)} unattached EBS volumes")
+        logger.info(f"Found {found} unattached EBS volumes")
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error scanning EBS volumes: {e}", exc_info=True)
         raise
 
-    return volumes
+
+def scan_unattached_ebs(region=None, credentials=None):
+    """Scan for unattached EBS volumes in the given (or default) region and account."""
+    return list(iter_unattached_ebs(region, credentials))
@@ -1,16 +1,54 @@
 # scanner/ec2_scanner.py
-import boto3
 import os
 import logging
+import re
+from array import array
+from collections import Counter
 from datetime import datetime, timedelta, timezone
-from utils.aws_helpers import BOTO3_CONFIG, get_region_from_az
+from utils.aws_helpers import (
+    METRIC_DATA_BATCH_SIZE,
+    METRIC_DATA_MAX_DATAPOINTS,
+    chunk_list,
+    default_region,
+    ec2_listing_pages,
+    get_region_from_az,
+    get_client,
+    get_metric_data_batched,
+)
+from utils.checkpoint import DeadlineReached
+from utils.metrics import count_skipped
+from utils.metric_history import (
+    MAX_LOOKBACK_DAYS,
+    DailyHistory,
+    day_start,
+    history_key,
+    mean,
+    percentile,
+    to_days,
+)
+from utils.storage import open_store
 
 logger = logging.getLogger(__name__)
 
-_ec2_client = None
-_cloudwatch_client = None
-
 CPU_THRESHOLD = None
+DEFAULT_LOOKBACK_DAYS = 7
+DEFAULT_IDLE_PERCENTILE = 95.0
+IDLE_MODES = ("average", "percentile")
+DEFAULT_EXEMPT_TAG = "waste-hunter:exempt"
+FALSE_TAG_VALUES = ("", "0", "false", "no", "off")
+# StateTransitionReason of a stopped-and-started instance, e.g. "User initiated (2026-10-16 08:12:45 GMT)"
+TRANSITION_TIME = re.compile(r"\((\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) GMT\)")
+
+# Metrics an instance can be scored on: CloudWatch metric, daily statistic, default idle
+# threshold on the mean daily value. cpu is always scored; CPU_THRESHOLD sets its threshold.
+IDLE_METRICS = {
+    "cpu": ("CPUUtilization", "Average", 2.0),  # percent
+    "network_in": ("NetworkIn", "Sum", 5e6),  # bytes per day
+    "network_out": ("NetworkOut", "Sum", 5e6),  # bytes per day
+    "ebs_read_ops": ("EBSReadOps", "Sum", 1000.0),  # operations per day
+    "ebs_write_ops": ("EBSWriteOps", "Sum", 1000.0),  # operations per day
+}
+NAN = float("nan")
 
 
 def _get_cpu_threshold():
@@ -28,90 +66,466 @@ def _get_cpu_threshold():
     return CPU_THRESHOLD
 
 
-def _get_ec2_client():
-    """Lazy initialization of EC2 client."""
-    global _ec2_client
-    if _ec2_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _ec2_client = boto3.client("ec2", region_name=region, config=BOTO3_CONFIG)
-    return _ec2_client
+def _get_idle_metrics():
+    """Get the metrics to score (IDLE_METRICS, comma-separated names; cpu is always included)."""
+    names = ["cpu"]
+    for name in os.getenv("IDLE_METRICS", "cpu").split(","):
+        name = name.strip().lower()
+        if not name or name in names:
+            continue
+        if name not in IDLE_METRICS:
+            logger.warning(f"Unknown idle metric {name}, ignoring (known: {', '.join(IDLE_METRICS)})")
+            continue
+        names.append(name)
+    return names
+
+
+def _get_metric_thresholds(names):
+    """Idle threshold per metric: CPU_THRESHOLD for cpu, IDLE_THRESHOLD_<NAME> for the others."""
+    thresholds = {}
+    for name in names:
+        if name == "cpu":
+            thresholds[name] = _get_cpu_threshold()
+            continue
+        default = IDLE_METRICS[name][2]
+        env_name = f"IDLE_THRESHOLD_{name.upper()}"
+        try:
+            value = float(os.getenv(env_name, str(default)))
+            if value < 0:
+                logger.warning(f"Invalid {env_name} {value}, using default {default}")
+                value = default
+        except ValueError:
+            logger.warning(f"Invalid {env_name} format, using default {default}")
+            value = default
+        thresholds[name] = value
+    return thresholds
+
+
+def _get_idle_mode():
+    """
+    Get how CPU idleness is judged (IDLE_MODE): 'average' compares the mean of daily averages
+    with CPU_THRESHOLD; 'percentile' compares a percentile of hourly averages, so an instance
+    that is busy for a few hours a day is not reported as idle.
+    """
+    mode = os.getenv("IDLE_MODE", "average").strip().lower()
+    if mode not in IDLE_MODES:
+        logger.warning(f"Invalid IDLE_MODE {mode}, using default average")
+        mode = "average"
+    return mode
+
+
+def _get_idle_percentile():
+    """Get the hourly CPU percentile compared with CPU_THRESHOLD (IDLE_PERCENTILE, 1-100) with validation."""
+    default = DEFAULT_IDLE_PERCENTILE
+    try:
+        value = float(os.getenv("IDLE_PERCENTILE", str(default)))
+        if value < 1 or value > 100:
+            logger.warning(f"Invalid IDLE_PERCENTILE {value}, using default {default:g}")
+            value = default
+    except ValueError:
+        logger.warning(f"Invalid IDLE_PERCENTILE format, using default {default:g}")
+        value = default
+    return value
+
+
+def _get_exempt_tag():
+    """Tag key that exempts an instance from idle checks (IDLE_EXEMPT_TAG; empty disables)."""
+    return os.getenv("IDLE_EXEMPT_TAG", DEFAULT_EXEMPT_TAG).strip()
+
+
+def _get_lookback_days():
+    """Get the metric averaging window in days (CPU_LOOKBACK_DAYS, 1-90) with validation."""
+    try:
+        days = int(os.getenv("CPU_LOOKBACK_DAYS", str(DEFAULT_LOOKBACK_DAYS)))
+        if days < 1 or days > MAX_LOOKBACK_DAYS:
+            logger.warning(f"Invalid CPU_LOOKBACK_DAYS {days}, using default {DEFAULT_LOOKBACK_DAYS}")
+            days = DEFAULT_LOOKBACK_DAYS
+    except ValueError:
+        logger.warning(f"Invalid CPU_LOOKBACK_DAYS format, using default {DEFAULT_LOOKBACK_DAYS}")
+        days = DEFAULT_LOOKBACK_DAYS
+    return days
+
+
+def _get_history_store():
+    """Store for daily metric history (METRIC_HISTORY_LOCATION), or None to query the full window every run."""
+    location = os.getenv("METRIC_HISTORY_LOCATION")
+    return open_store(location) if location else None
+
+
+def _get_ec2_client(region=None, credentials=None):
+    """Get the EC2 client for the region/credentials from the shared factory."""
+    return get_client("ec2", region, credentials)
+
+
+def _get_cloudwatch_client(region=None, credentials=None):
+    """Get the CloudWatch client for the region/credentials from the shared factory."""
+    return get_client("cloudwatch", region, credentials)
+
+
+def _project_page(page):
+    """
+    Reduce a describe_instances page to (owner account id, instances), keeping only the
+    fields the scan reports, so raw reservations (block devices, network interfaces, ...)
+    are released as soon as the page is read.
+    """
+    reservations = page.get("Reservations", [])
+    owner_id = reservations[0].get("OwnerId") if reservations else None
+    instances = [
+        {
+            "id": i["InstanceId"],
+            "instance_type": i["InstanceType"],
+            "az": i["Placement"].get("AvailabilityZone", ""),
+            "tags": {t["Key"]: t["Value"] for t in i.get("Tags", [])},
+            "launch_time": i.get("LaunchTime"),
+            "state_reason": i.get("StateTransitionReason", ""),
+        }
+        for r in reservations
+        for i in r["Instances"]
+    ]
+    return owner_id, instances
+
+
+def _skip_reason(instance, window_start, exempt_tag):
+    """
+    Why instance needs no metric evaluation, or None when it does: it carries the exemption
+    tag, or it was launched or last started inside the lookback window, so its metrics
+    cover only part of the window.
+    """
+    if exempt_tag and instance["tags"].get(exempt_tag, "").strip().lower() not in FALSE_TAG_VALUES:
+        return "exempt"
+    launch_time = instance["launch_time"]
+    if launch_time is not None and launch_time > window_start:
+        return "recently_launched"
+    match = TRANSITION_TIME.search(instance["state_reason"] or "")
+    if match:
+        started = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        if started > window_start:
+            return "recently_started"
+    return None
+
+
+def _metric_query(query_id, instance_id, name, period=86400):
+    """Build a MetricDataQuery of one idle metric for one instance, daily unless period is given."""
+    metric_name, stat, _ = IDLE_METRICS[name]
+    return {
+        "Id": query_id,
+        "MetricStat": {
+            "Metric": {
+                "Namespace": "AWS/EC2",
+                "MetricName": metric_name,
+                "Dimensions": [{"Name": "InstanceId", "Value": instance_id}],
+            },
+            "Period": period,
+            "Stat": stat,
+        },
+        "ReturnData": True,
+    }
+
 
+def _fetch_window(cloudwatch, instance_ids, names, start, end):
+    """
+    Query every metric for every instance over start..end in one batched pass.
+    Returns {name: {instance_id: values or None if the query failed}}.
+    """
+    queries = [
+        _metric_query(f"{name}{idx}", iid, name) for name in names for idx, iid in enumerate(instance_ids)
+    ]
+    values = get_metric_data_batched(cloudwatch, queries, start, end)
+    return {name: {iid: values.get(f"{name}{idx}") for idx, iid in enumerate(instance_ids)} for name in names}
 
-def _get_cloudwatch_client():
-    """Lazy initialization of CloudWatch client."""
-    global _cloudwatch_client
-    if _cloudwatch_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _cloudwatch_client = boto3.client("cloudwatch", region_name=region, config=BOTO3_CONFIG)
-    return _cloudwatch_client
 
+def _column_means(daily, instance_ids):
+    """One array per metric of each instance's mean daily value; NaN without datapoints or on error."""
+    columns = {}
+    for name, series in daily.items():
+        column = array("d")
+        for iid in instance_ids:
+            avg = mean(series[iid]) if series[iid] is not None else None
+            column.append(NAN if avg is None else avg)
+        columns[name] = column
+    return columns
 
-def scan_idle_ec2():
-    """Scan for idle EC2 instances based on CPU utilization."""
-    ec2 = _get_ec2_client()
-    cloudwatch = _get_cloudwatch_client()
-    threshold = _get_cpu_threshold()
+
+def _idle_mask(columns, thresholds):
+    """
+    Flag instances whose mean is below the threshold on every scored metric, evaluated one
+    metric column at a time. A metric without datapoints (NaN) does not prevent idleness.
+    """
+    mask = None
+    for name, column in columns.items():
+        limit = thresholds[name]
+        below = [not (value >= limit) for value in column]
+        mask = below if mask is None else [m and b for m, b in zip(mask, below)]
+    return mask or []
+
+
+def _hourly_cpu(cloudwatch, instance_ids, end, hours):
+    """
+    Fetch hourly average CPU for instance_ids over the hours before end into a dense
+    instances × hours float32 matrix (row-major, NaN where an hour has no datapoint).
+    Returns (matrix, ids of instances whose query failed).
+
+    Batches are sized so a GetMetricData call stays within its datapoint limit, and each
+    batch's datapoints are placed in the matrix before the next batch is fetched, so memory
+    is the matrix itself: 10k instances × 168 hours is under 7 MB.
+    """
+    start = end - timedelta(hours=hours)
+    batch_size = max(1, min(METRIC_DATA_BATCH_SIZE, METRIC_DATA_MAX_DATAPOINTS // hours))
+    matrix = array("f", [NAN]) * (len(instance_ids) * hours)
+    failed = set()
+
+    for chunk in chunk_list(list(enumerate(instance_ids)), batch_size):
+        queries = [_metric_query(f"cpu{idx}", iid, "cpu", period=3600) for idx, iid in chunk]
+        points = get_metric_data_batched(cloudwatch, queries, start, end, batch_size=batch_size, timestamps=True)
+        for idx, iid in chunk:
+            fetched = points.get(f"cpu{idx}")
+            if fetched is None:
+                failed.add(iid)
+                continue
+            row = idx * hours
+            for timestamp, value in fetched:
+                offset = int((timestamp - start).total_seconds() // 3600)
+                if 0 <= offset < hours:
+                    matrix[row + offset] = value
+    return matrix, failed
+
+
+def _hourly_stats(matrix, hours, q):
+    """
+    Per-row statistics of an instances × hours matrix: columns 'mean', 'p50', 'p<q>' and 'max',
+    one value per instance, NaN for rows without datapoints.
+    """
+    label = f"p{q:g}"
+    stats = {name: array("d") for name in ("mean", "p50", label, "max")}
+    for row in range(len(matrix) // hours):
+        ordered = sorted(v for v in matrix[row * hours:(row + 1) * hours] if v == v)
+        if not ordered:
+            for column in stats.values():
+                column.append(NAN)
+            continue
+        stats["mean"].append(sum(ordered) / len(ordered))
+        stats["p50"].append(percentile(ordered, 50))
+        stats[label].append(percentile(ordered, q))
+        stats["max"].append(ordered[-1])
+    return stats
+
+
+class _MetricHistory:
+    """
+    Daily metric values for one scan, backed by the stored history: only days missing from
+    the store are queried, and the updated window is written back when the scan ends.
+    """
+
+    def __init__(self, store, region, lookback, today, names):
+        self.store = store
+        self.region = region
+        self.names = names
+        self.last = today - timedelta(days=1)  # the last complete UTC day
+        self.first = today - timedelta(days=lookback)
+        self.keys = None
+        self.previous = {}
+        self.current = {name: DailyHistory(self.first, lookback) for name in names}
+        self.seen = set()
+
+    def _open(self, account_id):
+        if self.keys is None:
+            self.keys = {name: history_key(f"ec2-{name}", account_id, self.region) for name in self.names}
+            self.previous = {name: DailyHistory.load(self.store, key) for name, key in self.keys.items()}
+
+    def daily(self, cloudwatch, instance_ids, account_id):
+        """
+        Return {name: {instance_id: daily values over the window, or None if a query failed}}.
+        Missing day ranges for every metric are fetched together, one batched pass per range.
+        """
+        self._open(account_id)
+        daily = {name: {} for name in self.names}
+        by_range = {}
+        for name in self.names:
+            previous = self.previous[name]
+            known = [iid for iid in instance_ids if iid in previous]
+            for iid in known:
+                daily[name][iid] = previous.values(iid, self.first, self.last)
+            for day_range in previous.missing_ranges(self.first, self.last):
+                by_range.setdefault(day_range, []).extend((name, iid) for iid in known)
+            new = [iid for iid in instance_ids if iid not in previous]
+            by_range.setdefault((self.first, self.last), []).extend((name, iid) for iid in new)
+
+        for (first, last), wanted in by_range.items():
+            if not wanted:
+                continue
+            count = (last - first).days + 1
+            offset = (first - self.first).days
+            queries = [_metric_query(f"q{n}", iid, name) for n, (name, iid) in enumerate(wanted)]
+            points = get_metric_data_batched(
+                cloudwatch, queries, day_start(first), day_start(last + timedelta(days=1)), timestamps=True
+            )
+            for n, (name, iid) in enumerate(wanted):
+                fetched = points.get(f"q{n}")
+                series = daily[name]
+                if fetched is None or (iid in series and series[iid] is None):
+                    series[iid] = None
+                    continue
+                days = series.setdefault(iid, [NAN] * self.current[name].days)
+                days[offset:offset + count] = to_days(fetched, first, count)
+
+        self.seen.update(instance_ids)
+        for name, series in daily.items():
+            for iid, values in series.items():
+                if values is not None:
+                    self.current[name].set(iid, values)
+        return daily
+
+    def save(self, complete):
+        """
+        Write the window back. An interrupted scan keeps the series of instances it has not
+        reached yet, so the resumed scan does not query them again.
+        """
+        if self.keys is None:
+            return
+        for name, key in self.keys.items():
+            if not complete:
+                self.current[name].merge_unseen(self.previous[name], self.seen)
+            try:
+                self.current[name].save(self.store, key)
+            except Exception as e:
+                logger.warning(f"Error saving metric history {key}: {e}")
+
+
+def iter_idle_ec2(region=None, credentials=None):
+    """Yield idle EC2 instances once their metrics are evaluated."""
+    ec2 = _get_ec2_client(region, credentials)
+    cloudwatch = _get_cloudwatch_client(region, credentials)
+    names = _get_idle_metrics()
+    thresholds = _get_metric_thresholds(names)
+    threshold = thresholds["cpu"]
+    lookback = _get_lookback_days()
+    store = _get_history_store()
+    hourly = _get_idle_mode() == "percentile"
+    q = _get_idle_percentile() if hourly else None
+    hours = lookback * 24
+    exempt_tag = _get_exempt_tag()
+    # In percentile mode CPU comes from hourly datapoints; other metrics stay daily
+    daily_names = [name for name in names if name != "cpu"] if hourly else names
     
-    idle = []
+    found = 0
     no_metrics = []
     
     now = datetime.now(timezone.utc)
-    start = now - timedelta(days=7)
+    start = now - timedelta(days=lookback)
+    hour_end = now.replace(minute=0, second=0, microsecond=0)
+    history = None
+    if store and daily_names:
+        history = _MetricHistory(store, region or default_region(), lookback, now.date(), daily_names)
 
-    logger.info(f"Starting EC2 scan with CPU threshold {threshold}%")
+    logger.info(
+        f"Starting EC2 scan with CPU threshold {threshold}% over {lookback} days"
+        + (f" on the hourly p{q:g}" if hourly else "")
+        + (f", scoring {', '.join(names)}" if len(names) > 1 else "")
+    )
 
+    complete = False
     try:
-        paginator = ec2.get_paginator("describe_instances")
-        reservations = []
-
-        for page in paginator.paginate(
-            Filters=[{"Name": "instance-state-name", "Values": ["running"]}]
-        ):
-            reservations.extend(page.get("Reservations", []))
-
-        logger.info(f"Found {sum(len(r['Instances']) for r in reservations)} running instances")
-
-        for r in reservations:
-            for i in r["Instances"]:
-                iid = i["InstanceId"]
-
-                try:
-                    metrics = cloudwatch.get_metric_statistics(
-                        Namespace="AWS/EC2",
-                        MetricName="CPUUtilization",
-                        Dimensions=[{"Name": "InstanceId", "Value": iid}],
-                        StartTime=start,
-                        EndTime=now,
-                        Period=86400,
-                        Statistics=["Average"],
-                    )
-
-                    if not metrics["Datapoints"]:
-                        logger.debug(f"No metrics for instance {iid}, skipping")
-                        no_metrics.append(iid)
-                        continue
-
-                    avg = sum(d["Average"] for d in metrics["Datapoints"]) / len(
-                        metrics["Datapoints"]
-                    )
-                    if avg < threshold:
-                        az = i["Placement"].get("AvailabilityZone", "")
-                        idle.append({
-                            "type": "EC2",
-                            "id": iid,
-                            "avg_cpu": round(avg, 2),
-                            "instance_type": i["InstanceType"],
-                            "az": az,
-                            "region": get_region_from_az(az),
-                            "tags": {t["Key"]: t["Value"] for t in i.get("Tags", [])}
-                        })
-                except Exception as e:
-                    logger.warning(f"Error getting metrics for {iid}: {e}")
+        # Evaluate instances page by page, so a checkpoint never skips unreported pages. The
+        # next page is listed while this one's metrics are fetched, and only the projected
+        # fields of the current page are held.
+        pages = ec2_listing_pages(
+            ec2, "instances", "describe_instances",
+            [{"Name": "instance-state-name", "Values": ["running"]}], prefetch=True,
+        )
+        running = 0
+        seen = set()
+        skipped = Counter()
+        for account_id, instances in map(_project_page, pages):
+            instances = [i for i in instances if i["id"] not in seen]
+            seen.update(i["id"] for i in instances)
+            running += len(instances)
+
+            # Leave out instances whose metrics would not be meaningful before querying them
+            evaluated = []
+            page_skipped = Counter()
+            for i in instances:
+                reason = _skip_reason(i, start, exempt_tag)
+                if reason:
+                    page_skipped[reason] += 1
+                else:
+                    evaluated.append(i)
+            for reason, count in page_skipped.items():
+                count_skipped(reason, count)
+            skipped.update(page_skipped)
+            instances = evaluated
+            if not instances:
+                continue
+
+            instance_ids = [i["id"] for i in instances]
+            if not daily_names:
+                daily = {}
+            elif history is not None:
+                daily = history.daily(cloudwatch, instance_ids, account_id)
+            else:
+                daily = _fetch_window(cloudwatch, instance_ids, daily_names, start, now)
+            failed = {iid for series in daily.values() for iid, values in series.items() if values is None}
+
+            columns = _column_means(daily, instance_ids)
+            if hourly:
+                matrix, hourly_failed = _hourly_cpu(cloudwatch, instance_ids, hour_end, hours)
+                failed |= hourly_failed
+                stats = _hourly_stats(matrix, hours, q)
+                del matrix
+                columns["cpu"] = stats[f"p{q:g}"]
+            idle = _idle_mask(columns, thresholds)
+
+            for idx, i in enumerate(instances):
+                iid = i["id"]
+
+                if iid in failed:
+                    logger.warning(f"Error getting metrics for {iid}, skipping")
+                    continue
+
+                avg = stats["mean"][idx] if hourly else columns["cpu"][idx]
+                if avg != avg:
+                    logger.debug(f"No metrics for instance {iid}, skipping")
+                    no_metrics.append(iid)
                     continue
 
-        logger.info(f"Found {len(idle)} idle EC2 instances, {len(no_metrics)} with no metrics")
+                if idle[idx]:
+                    found += 1
+                    record = {
+                        "type": "EC2",
+                        "id": iid,
+                        "avg_cpu": round(avg, 2),
+                        "instance_type": i["instance_type"],
+                        "az": i["az"],
+                        "region": get_region_from_az(i["az"]),
+                        "tags": i["tags"]
+                    }
+                    if hourly:
+                        record["cpu_hourly"] = {name: round(stats[name][idx], 2) for name in stats if name != "mean"}
+                    if len(names) > 1:
+                        # Mean daily value per scored metric; None where CloudWatch had no datapoints
+                        record["idle_metrics"] = {
+                            name: None if columns[name][idx] != columns[name][idx] else round(columns[name][idx], 2)
+                            for name in names
+                        }
+                    yield record
+
+        complete = True
+        logger.info(f"Found {running} running instances")
+        if skipped:
+            logger.info(
+                f"Skipped {sum(skipped.values())} instances without metric evaluation: "
+                + ", ".join(f"{count} {reason}" for reason, count in sorted(skipped.items()))
+            )
+        logger.info(f"Found {found} idle EC2 instances, {len(no_metrics)} with no metrics")
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error scanning EC2 instances: {e}", exc_info=True)
         raise
+    finally:
+        if history is not None:
+            history.save(complete)
+
 
-    return idle
+def scan_idle_ec2(region=None, credentials=None):
+    """Scan for idle EC2 instances by CPU utilization in the given (or default) region and account."""
+    return list(iter_idle_ec2(region, credentials))
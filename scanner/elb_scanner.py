@@ -1,42 +1,37 @@
 # scanner/elb_scanner.py
-import boto3
-import os
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from utils.aws_helpers import BOTO3_CONFIG, get_region_from_az, safe_get_first, chunk_list
+from utils.aws_helpers import (
+    get_region_from_az,
+    get_client,
+    get_metric_data_batched,
+    safe_get_first,
+    chunk_list,
+)
+from utils.checkpoint import DeadlineReached, resumable_pages
+from utils.metrics import propagate
 
 logger = logging.getLogger(__name__)
 
-_elbv2_client = None
-_elb_client = None
-_cloudwatch_client = None
+PREFILTER_CONCURRENCY = 8  # Parallel describe_listeners/describe_target_health calls per page
+CLASSIC_TAG_CONCURRENCY = 4  # Parallel Classic describe_tags calls (20 names each) per page
 
 
-def _get_elbv2_client():
-    """Lazy initialization of ELBv2 client."""
-    global _elbv2_client
-    if _elbv2_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _elbv2_client = boto3.client("elbv2", region_name=region, config=BOTO3_CONFIG)
-    return _elbv2_client
+def _get_elbv2_client(region=None, credentials=None):
+    """Get the ELBv2 client for the region/credentials from the shared factory."""
+    return get_client("elbv2", region, credentials)
 
 
-def _get_elb_client():
-    """Lazy initialization of ELB (Classic) client."""
-    global _elb_client
-    if _elb_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _elb_client = boto3.client("elb", region_name=region, config=BOTO3_CONFIG)
-    return _elb_client
+def _get_elb_client(region=None, credentials=None):
+    """Get the ELB (Classic) client for the region/credentials from the shared factory."""
+    return get_client("elb", region, credentials)
 
 
-def _get_cloudwatch_client():
-    """Lazy initialization of CloudWatch client."""
-    global _cloudwatch_client
-    if _cloudwatch_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _cloudwatch_client = boto3.client("cloudwatch", region_name=region, config=BOTO3_CONFIG)
-    return _cloudwatch_client
+def _get_cloudwatch_client(region=None, credentials=None):
+    """Get the CloudWatch client for the region/credentials from the shared factory."""
+    return get_client("cloudwatch", region, credentials)
 
 
 def _get_lb_metric_dimension(lb_arn):
@@ -46,9 +41,9 @@ def _get_lb_metric_dimension(lb_arn):
     return lb_arn.split("/")[-1]
 
 
-def _get_batch_tags(arns):
+def _get_batch_tags(arns, region=None, credentials=None):
     """Batch fetch tags for multiple load balancers."""
-    elbv2 = _get_elbv2_client()
+    elbv2 = _get_elbv2_client(region, credentials)
     tag_map = {}
     
     # Process in chunks of 20 (AWS limit)
@@ -68,69 +63,169 @@ def _get_batch_tags(arns):
     return tag_map
 
 
-def _check_alb_nlb_usage(lb, lb_type, start, end):
-    """Check if ALB/NLB has received traffic."""
-    cloudwatch = _get_cloudwatch_client()
-    
-    namespace = "AWS/ApplicationELB" if lb_type == "application" else "AWS/NetworkELB"
-    metric_name = "RequestCount" if lb_type == "application" else "ProcessedBytes"
-    
-    metric_dimension = _get_lb_metric_dimension(lb["LoadBalancerArn"])
-    
+def _get_classic_tag_chunk(elb, names):
     try:
-        metrics = cloudwatch.get_metric_statistics(
-            Namespace=namespace,
-            MetricName=metric_name,
-            Dimensions=[{"Name": "LoadBalancer", "Value": metric_dimension}],
-            StartTime=start,
-            EndTime=end,
-            Period=86400,
-            Statistics=["Sum"],
-        )
-        
-        # Check for missing datapoints explicitly
-        if not metrics.get("Datapoints"):
-            logger.debug(f"No datapoints for {lb['LoadBalancerName']}, treating as unused")
-            return True
-        
-        total = sum(d["Sum"] for d in metrics["Datapoints"])
-        return total == 0
+        response = elb.describe_tags(LoadBalancerNames=names)
     except Exception as e:
-        logger.warning(f"Error checking metrics for {lb['LoadBalancerName']}: {e}")
-        return False
+        logger.warning(f"Error fetching Classic LB tags for chunk: {e}")
+        return {name: {} for name in names}
+    tag_map = {name: {} for name in names}
+    for tag_desc in response.get("TagDescriptions", []):
+        tag_map[tag_desc.get("LoadBalancerName")] = {t["Key"]: t["Value"] for t in tag_desc.get("Tags", [])}
+    return tag_map
 
 
-def _check_classic_lb_usage(lb_name, start, end):
-    """Check if Classic LB has received traffic."""
-    cloudwatch = _get_cloudwatch_client()
-    
+def _get_classic_batch_tags(names, region=None, credentials=None):
+    """
+    Fetch tags for Classic load balancers by name, 20 per describe_tags call (AWS limit),
+    with chunks issued concurrently. Names in a failed chunk map to empty tags.
+    """
+    elb = _get_elb_client(region, credentials)
+    chunks = list(chunk_list(names, 20))
+    if not chunks:
+        return {}
+
+    tag_map = {}
+    fetch = propagate(lambda chunk: _get_classic_tag_chunk(elb, chunk))
+    with ThreadPoolExecutor(max_workers=min(CLASSIC_TAG_CONCURRENCY, len(chunks))) as pool:
+        for chunk_tags in pool.map(fetch, chunks):
+            tag_map.update(chunk_tags)
+    return tag_map
+
+
+def _get_target_health_prefilter():
+    """
+    Whether to describe target health before the metric check (ELB_TARGET_HEALTH_PREFILTER).
+    Off by default: it costs a call per target group, where the metric check costs one per page.
+    """
+    return os.getenv("ELB_TARGET_HEALTH_PREFILTER", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _get_target_groups(elbv2):
+    """
+    Map load balancer ARN to the ARNs of its target groups, from one paginated listing of
+    every target group in the region. Returns None if the listing fails.
+    """
+    groups = {}
+    try:
+        for page in elbv2.get_paginator("describe_target_groups").paginate():
+            for group in page.get("TargetGroups", []):
+                for lb_arn in group.get("LoadBalancerArns", []):
+                    groups.setdefault(lb_arn, []).append(group["TargetGroupArn"])
+    except Exception as e:
+        logger.warning(f"Error listing target groups, checking every load balancer's metrics: {e}")
+        return None
+    return groups
+
+
+def _get_listeners(elbv2, lb_arn):
+    """Return the load balancer's listeners, or None if they could not be described."""
     try:
-        metrics = cloudwatch.get_metric_statistics(
-            Namespace="AWS/ELB",
-            MetricName="RequestCount",
-            Dimensions=[{"Name": "LoadBalancerName", "Value": lb_name}],
-            StartTime=start,
-            EndTime=end,
-            Period=86400,
-            Statistics=["Sum"],
-        )
-        
-        if not metrics.get("Datapoints"):
-            logger.debug(f"No datapoints for Classic LB {lb_name}, treating as unused")
-            return True
-        
-        total = sum(d["Sum"] for d in metrics["Datapoints"])
-        return total == 0
+        listeners = []
+        for page in elbv2.get_paginator("describe_listeners").paginate(LoadBalancerArn=lb_arn):
+            listeners.extend(page.get("Listeners", []))
+        return listeners
     except Exception as e:
-        logger.warning(f"Error checking metrics for Classic LB {lb_name}: {e}")
+        logger.warning(f"Error describing listeners for {lb_arn}: {e}")
+        return None
+
+
+def _get_target_health(elbv2, group_arn):
+    """Return the target group's health descriptions, or None if they could not be described."""
+    try:
+        return elbv2.describe_target_health(TargetGroupArn=group_arn).get("TargetHealthDescriptions", [])
+    except Exception as e:
+        logger.warning(f"Error describing target health for {group_arn}: {e}")
+        return None
+
+
+def _prefilter_elbv2(elbv2, lbs, target_groups, check_health=False):
+    """
+    Classify ALBs/NLBs that are unused by construction, without CloudWatch.
+
+    A load balancer that a target group is attached to has a listener forwarding to it, so
+    listeners are described only for those without target groups: none means "no_listeners".
+    With check_health, target groups are described too, and load balancers whose groups have
+    no registered targets at all are "no_registered_targets". Unhealthy targets still get traffic
+    (ALBs and NLBs fail open), so those are left to the metric check. Returns {lb_arn: reason};
+    anything not returned, including load balancers whose lookups failed, needs a metric check.
+    """
+    lb_arns = [lb["LoadBalancerArn"] for lb in lbs]
+    candidates = [arn for arn in lb_arns if not target_groups.get(arn)]
+    group_arns = list(dict.fromkeys(
+        group for arn in lb_arns for group in target_groups.get(arn, [])
+    )) if check_health else []
+    if not candidates and not group_arns:
+        return {}
+
+    workers = min(PREFILTER_CONCURRENCY, len(candidates) + len(group_arns))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        listener_futures = {arn: pool.submit(propagate(_get_listeners), elbv2, arn) for arn in candidates}
+        health_futures = {arn: pool.submit(propagate(_get_target_health), elbv2, arn) for arn in group_arns}
+        listeners = {arn: future.result() for arn, future in listener_futures.items()}
+        health = {arn: future.result() for arn, future in health_futures.items()}
+
+    reasons = {arn: "no_listeners" for arn, found in listeners.items() if found == []}
+    for arn in lb_arns:
+        groups = target_groups.get(arn)
+        # No target groups at all may mean fixed-response or redirect listeners; leave those to metrics
+        if not check_health or not groups or any(health[g] is None for g in groups):
+            continue
+        if not any(health[g] for g in groups):
+            reasons[arn] = "no_registered_targets"
+    return reasons
+
+
+def _usage_query(query_id, namespace, metric_name, dimension_name, dimension_value):
+    """GetMetricData query for a load balancer's daily traffic sums."""
+    return {
+        "Id": query_id,
+        "MetricStat": {
+            "Metric": {
+                "Namespace": namespace,
+                "MetricName": metric_name,
+                "Dimensions": [{"Name": dimension_name, "Value": dimension_value}],
+            },
+            "Period": 86400,
+            "Stat": "Sum",
+        },
+        "ReturnData": True,
+    }
+
+
+def _alb_nlb_usage_query(query_id, lb, lb_type):
+    """RequestCount for ALBs, ProcessedBytes for NLBs."""
+    namespace = "AWS/ApplicationELB" if lb_type == "application" else "AWS/NetworkELB"
+    metric_name = "RequestCount" if lb_type == "application" else "ProcessedBytes"
+    metric_dimension = _get_lb_metric_dimension(lb["LoadBalancerArn"])
+    return _usage_query(query_id, namespace, metric_name, "LoadBalancer", metric_dimension)
+
+
+def _classic_usage_query(query_id, lb_name):
+    return _usage_query(query_id, "AWS/ELB", "RequestCount", "LoadBalancerName", lb_name)
+
+
+def _is_unused(usage, query_id, lb_name):
+    """
+    Classify one load balancer from batched metric results: no datapoints or zero traffic
+    means unused; a query that errored is not flagged.
+    """
+    values = usage.get(query_id)
+    if values is None:
+        logger.warning(f"Error checking metrics for {lb_name}, not flagging")
         return False
+    if not values:
+        logger.debug(f"No datapoints for {lb_name}, treating as unused")
+        return True
+    return sum(values) == 0
 
 
-def scan_unused_elb():
-    """Scan for unused Application, Network, and Classic Load Balancers."""
-    elbv2 = _get_elbv2_client()
-    elb = _get_elb_client()
-    unused = []
+def iter_unused_elb(region=None, credentials=None):
+    """Yield unused ALB/NLB/Classic load balancers as they are classified."""
+    elbv2 = _get_elbv2_client(region, credentials)
+    elb = _get_elb_client(region, credentials)
+    cloudwatch = _get_cloudwatch_client(region, credentials)
+    found = 0
     
     now = datetime.now(timezone.utc)
     start = now - timedelta(days=7)
@@ -138,65 +233,112 @@ def scan_unused_elb():
     logger.info("Starting ELB scan (ALB/NLB/Classic)")
 
     try:
-        # Scan ALB and NLB
+        # Scan ALB and NLB page by page, so a checkpoint never skips unreported pages
         paginator = elbv2.get_paginator("describe_load_balancers")
-        lbs = []
-        for page in paginator.paginate():
-            lbs.extend(page.get("LoadBalancers", []))
-
-        logger.info(f"Found {len(lbs)} ALB/NLB load balancers")
-
-        # Batch fetch tags
-        lb_arns = [lb["LoadBalancerArn"] for lb in lbs]
-        tag_map = _get_batch_tags(lb_arns)
-
-        for lb in lbs:
-            lb_type = lb.get("Type", "application")
-            
-            if _check_alb_nlb_usage(lb, lb_type, start, now):
-                az_list = lb.get("AvailabilityZones", [])
-                first_az = safe_get_first(az_list, {})
-                az_name = first_az.get("ZoneName", "") if isinstance(first_az, dict) else ""
-                
-                unused.append({
-                    "type": "ELB",
-                    "id": lb["LoadBalancerName"],
-                    "lb_type": lb_type.upper(),
-                    "scheme": lb.get("Scheme", ""),
-                    "az": az_name,
-                    "region": get_region_from_az(az_name),
-                    "tags": tag_map.get(lb["LoadBalancerArn"], {})
-                })
+        lb_count = 0
+        prefiltered = 0
+        target_groups, listed = None, False
+        check_health = _get_target_health_prefilter()
+        for page in resumable_pages("elbv2", paginator):
+            lbs = page.get("LoadBalancers", [])
+            lb_count += len(lbs)
+            if not lbs:
+                continue
+
+            # Batch fetch tags
+            lb_arns = [lb["LoadBalancerArn"] for lb in lbs]
+            tag_map = _get_batch_tags(lb_arns, region, credentials)
+
+            # Structural checks first; only load balancers they cannot classify need metrics.
+            # Without the target group listing the candidates cannot be narrowed, so skip them.
+            if not listed:
+                target_groups, listed = _get_target_groups(elbv2), True
+            reasons = {}
+            if target_groups is not None:
+                reasons = _prefilter_elbv2(elbv2, lbs, target_groups, check_health)
+            prefiltered += len(reasons)
+
+            # One GetMetricData call per 500 load balancers instead of one call each
+            queries = [
+                _alb_nlb_usage_query(f"lb{idx}", lb, lb.get("Type", "application"))
+                for idx, lb in enumerate(lbs) if lb["LoadBalancerArn"] not in reasons
+            ]
+            usage = get_metric_data_batched(cloudwatch, queries, start, now) if queries else {}
+
+            for idx, lb in enumerate(lbs):
+                lb_type = lb.get("Type", "application")
+                reason = reasons.get(lb["LoadBalancerArn"])
+                if reason is None and _is_unused(usage, f"lb{idx}", lb["LoadBalancerName"]):
+                    reason = "no_traffic"
+
+                if reason:
+                    az_list = lb.get("AvailabilityZones", [])
+                    first_az = safe_get_first(az_list, {})
+                    az_name = first_az.get("ZoneName", "") if isinstance(first_az, dict) else ""
+                    
+                    found += 1
+                    yield {
+                        "type": "ELB",
+                        "id": lb["LoadBalancerName"],
+                        "lb_type": lb_type.upper(),
+                        "scheme": lb.get("Scheme", ""),
+                        "az": az_name,
+                        "region": get_region_from_az(az_name),
+                        "tags": tag_map.get(lb["LoadBalancerArn"], {}),
+                        "unused_reason": reason,
+                    }
+
+        logger.info(f"Found {lb_count} ALB/NLB load balancers, {prefiltered} classified without metrics")
 
         # Scan Classic Load Balancers
         classic_paginator = elb.get_paginator("describe_load_balancers")
-        classic_lbs = []
-        for page in classic_paginator.paginate():
-            classic_lbs.extend(page.get("LoadBalancerDescriptions", []))
-
-        logger.info(f"Found {len(classic_lbs)} Classic load balancers")
-
-        for lb in classic_lbs:
-            lb_name = lb["LoadBalancerName"]
-            
-            if _check_classic_lb_usage(lb_name, start, now):
-                az_list = lb.get("AvailabilityZones", [])
-                first_az = safe_get_first(az_list, "")
-                
-                # Classic LBs don't support describe_tags via ARN, skip tags
-                unused.append({
-                    "type": "ELB",
-                    "id": lb_name,
-                    "lb_type": "CLASSIC",
-                    "scheme": lb.get("Scheme", ""),
-                    "az": first_az,
-                    "region": get_region_from_az(first_az),
-                    "tags": {}
-                })
-
-        logger.info(f"Found {len(unused)} unused load balancers")
+        classic_count = 0
+        for page in resumable_pages("classic", classic_paginator):
+            classic_lbs = page.get("LoadBalancerDescriptions", [])
+            classic_count += len(classic_lbs)
+            if not classic_lbs:
+                continue
+
+            tag_map = _get_classic_batch_tags([lb["LoadBalancerName"] for lb in classic_lbs], region, credentials)
+
+            # A Classic LB with no registered instances cannot serve traffic
+            queries = [
+                _classic_usage_query(f"lb{idx}", lb["LoadBalancerName"])
+                for idx, lb in enumerate(classic_lbs) if lb.get("Instances") != []
+            ]
+            usage = get_metric_data_batched(cloudwatch, queries, start, now) if queries else {}
+
+            for idx, lb in enumerate(classic_lbs):
+                lb_name = lb["LoadBalancerName"]
+                reason = "no_instances" if lb.get("Instances") == [] else None
+                if reason is None and _is_unused(usage, f"lb{idx}", lb_name):
+                    reason = "no_traffic"
+
+                if reason:
+                    az_list = lb.get("AvailabilityZones", [])
+                    first_az = safe_get_first(az_list, "")
+                    
+                    found += 1
+                    yield {
+                        "type": "ELB",
+                        "id": lb_name,
+                        "lb_type": "CLASSIC",
+                        "scheme": lb.get("Scheme", ""),
+                        "az": first_az,
+                        "region": get_region_from_az(first_az),
+                        "tags": tag_map.get(lb_name, {}),
+                        "unused_reason": reason,
+                    }
+
+        logger.info(f"Found {classic_count} Classic load balancers")
+        logger.info(f"Found {found} unused load balancers")
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error scanning load balancers: {e}", exc_info=True)
         raise
 
-    return unused
+
+def scan_unused_elb(region=None, credentials=None):
+    """Scan for unused ALB/NLB/Classic load balancers in the given (or default) region and account."""
+    return list(iter_unused_elb(region, credentials))
@@ -1,93 +1,141 @@
 # scanner/rds_scanner.py
-import boto3
-import os
 import logging
-from utils.aws_helpers import BOTO3_CONFIG, get_region_from_az, safe_get_first, chunk_list
+import os
+from concurrent.futures import ThreadPoolExecutor
+from utils.aws_helpers import (
+    RateLimiter,
+    get_region_from_az,
+    get_client,
+    safe_get_first,
+    chunk_list,
+)
+from utils.checkpoint import DeadlineReached, resumable_pages
+from utils.metrics import propagate
 
 logger = logging.getLogger(__name__)
 
-_rds_client = None
+DEFAULT_TAG_CONCURRENCY = 4  # Parallel list_tags_for_resource calls for resources without inline tags
+DEFAULT_TAG_RATE = 10.0  # Fallback list_tags_for_resource calls per second, per scan
 
 
-def _get_rds_client():
-    """Lazy initialization of RDS client."""
-    global _rds_client
-    if _rds_client is None:
-        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
-        _rds_client = boto3.client("rds", region_name=region, config=BOTO3_CONFIG)
-    return _rds_client
+def _get_rds_client(region=None, credentials=None):
+    """Get the RDS client for the region/credentials from the shared factory."""
+    return get_client("rds", region, credentials)
 
 
-def _get_batch_tags(arns):
-    """Batch fetch tags for multiple RDS resources."""
-    rds = _get_rds_client()
+def _get_env_number(name, default, cast):
+    """Read a positive number from env var name, falling back to default when invalid."""
+    try:
+        value = cast(os.getenv(name, str(default)))
+        if value <= 0:
+            logger.warning(f"Invalid {name} {value}, using default {default}")
+            value = default
+    except ValueError:
+        logger.warning(f"Invalid {name} format, using default {default}")
+        value = default
+    return value
+
+
+def _fetch_tags(rds, arn, limiter):
+    limiter.wait()
+    try:
+        response = rds.list_tags_for_resource(ResourceName=arn)
+        return {t["Key"]: t["Value"] for t in response.get("TagList", [])}
+    except Exception as e:
+        logger.warning(f"Error fetching tags for {arn}: {e}")
+        return {}
+
+
+def _get_batch_tags(arns, region=None, credentials=None, limiter=None):
+    """
+    Fetch tags for RDS resources whose describe response carried no TagList.
+    Calls run concurrently (RDS_TAG_CONCURRENCY) and are spaced to RDS_TAG_RATE per second.
+    """
+    if not arns:
+        return {}
+    rds = _get_rds_client(region, credentials)
+    limiter = limiter or RateLimiter(_get_env_number("RDS_TAG_RATE", DEFAULT_TAG_RATE, float))
+    concurrency = min(_get_env_number("RDS_TAG_CONCURRENCY", DEFAULT_TAG_CONCURRENCY, int), len(arns))
+
+    fetch = propagate(lambda arn: _fetch_tags(rds, arn, limiter))
+    if concurrency == 1:
+        return {arn: fetch(arn) for arn in arns}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(zip(arns, pool.map(fetch, arns)))
+
+
+def _resource_tags(resources, arn_key, region, credentials, limiter):
+    """
+    Map ARN to tags for resources, using the TagList describe_db_* returns inline and
+    calling list_tags_for_resource only for resources where it is missing.
+    """
     tag_map = {}
-    
-    for arn in arns:
-        try:
-            response = rds.list_tags_for_resource(ResourceName=arn)
-            tags = response.get("TagList", [])
-            tag_map[arn] = {t["Key"]: t["Value"] for t in tags}
-        except Exception as e:
-            logger.warning(f"Error fetching tags for {arn}: {e}")
-            tag_map[arn] = {}
-    
+    missing = []
+    for resource in resources:
+        if "TagList" in resource:
+            tag_map[resource[arn_key]] = {t["Key"]: t["Value"] for t in resource["TagList"]}
+        else:
+            missing.append(resource[arn_key])
+    if missing:
+        logger.debug(f"Fetching tags for {len(missing)} RDS resources without inline tags")
+        tag_map.update(_get_batch_tags(missing, region, credentials, limiter))
     return tag_map
 
 
-def scan_stopped_rds():
-    """Scan for stopped RDS clusters and instances."""
-    rds = _get_rds_client()
-    wasted = []
+def iter_stopped_rds(region=None, credentials=None):
+    """Yield stopped RDS clusters and instances."""
+    rds = _get_rds_client(region, credentials)
+    limiter = RateLimiter(_get_env_number("RDS_TAG_RATE", DEFAULT_TAG_RATE, float))
+    found = 0
 
     logger.info("Starting RDS scan (clusters and instances)")
 
     try:
-        # Scan RDS Clusters
+        # Scan RDS Clusters page by page, so a checkpoint never skips unreported pages
         cluster_paginator = rds.get_paginator("describe_db_clusters")
-        clusters = []
-        for page in cluster_paginator.paginate():
-            clusters.extend(page.get("DBClusters", []))
+        clusters = 0
+        for page in resumable_pages("clusters", cluster_paginator):
+            page_clusters = page.get("DBClusters", [])
+            clusters += len(page_clusters)
+            stopped_clusters = [c for c in page_clusters if c.get("Status") == "stopped"]
+            if not stopped_clusters:
+                continue
 
-        logger.info(f"Found {len(clusters)} RDS clusters")
-
-        stopped_clusters = [c for c in clusters if c.get("Status") == "stopped"]
-        
-        if stopped_clusters:
-            cluster_arns = [c["DBClusterArn"] for c in stopped_clusters]
-            cluster_tag_map = _get_batch_tags(cluster_arns)
+            cluster_tag_map = _resource_tags(stopped_clusters, "DBClusterArn", region, credentials, limiter)
 
             for c in stopped_clusters:
                 az_list = c.get("AvailabilityZones", [])
                 first_az = safe_get_first(az_list, "")
                 
-                wasted.append({
+                found += 1
+                yield {
                     "type": "RDS_CLUSTER",
                     "id": c["DBClusterIdentifier"],
                     "engine": c.get("Engine", ""),
                     "az": first_az,
                     "region": get_region_from_az(first_az),
                     "tags": cluster_tag_map.get(c["DBClusterArn"], {})
-                })
+                }
+
+        logger.info(f"Found {clusters} RDS clusters")
 
         # Scan RDS Instances
         instance_paginator = rds.get_paginator("describe_db_instances")
-        instances = []
-        for page in instance_paginator.paginate():
-            instances.extend(page.get("DBInstances", []))
-
-        logger.info(f"Found {len(instances)} RDS instances")
+        instances = 0
+        for page in resumable_pages("instances", instance_paginator):
+            page_instances = page.get("DBInstances", [])
+            instances += len(page_instances)
+            stopped_instances = [i for i in page_instances if i.get("DBInstanceStatus") == "stopped"]
+            if not stopped_instances:
+                continue
 
-        stopped_instances = [i for i in instances if i.get("DBInstanceStatus") == "stopped"]
-        
-        if stopped_instances:
-            instance_arns = [i["DBInstanceArn"] for i in stopped_instances]
-            instance_tag_map = _get_batch_tags(instance_arns)
+            instance_tag_map = _resource_tags(stopped_instances, "DBInstanceArn", region, credentials, limiter)
 
             for i in stopped_instances:
                 az = i.get("AvailabilityZone", "")
                 
-                wasted.append({
+                found += 1
+                yield {
                     "type": "RDS_INSTANCE",
                     "id": i["DBInstanceIdentifier"],
                     "engine": i.get("Engine", ""),
@@ -95,11 +143,17 @@ def scan_stopped_rds():
                     "az": az,
                     "region": get_region_from_az(az),
                     "tags": instance_tag_map.get(i["DBInstanceArn"], {})
-                })
+                }
 
-        logger.info(f"Found {len(wasted)} stopped RDS resources")
+        logger.info(f"Found {instances} RDS instances")
+        logger.info(f"Found {found} stopped RDS resources")
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error scanning RDS resources: {e}", exc_info=True)
         raise
 
-    return wasted
+
+def scan_stopped_rds(region=None, credentials=None):
+    """Scan for stopped RDS clusters and instances in the given (or default) region and account."""
+    return list(iter_stopped_rds(region, credentials))
@@ -1,4 +1,12 @@
 import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import boto3
+from botocore.stub import Stubber
+import utils.aws_helpers as aws_helpers
 from utils.aws_helpers import get_region_from_az, safe_get_first, chunk_list
 
 
@@ -116,3 +124,180 @@ class TestChunkList:
         assert len(chunks) == 2
         assert len(chunks[0]) == 20
         assert len(chunks[1]) == 5
+
+
+class FakeClient:
+    def __init__(self):
+        self.meta = SimpleNamespace(events=SimpleNamespace(register=lambda event, handler: None))
+
+
+class FakeSession:
+    """Stand-in boto3 session recording the clients it creates."""
+
+    def __init__(self):
+        self.created = []
+
+    def client(self, service, region_name=None, config=None, **credentials):
+        self.created.append((service, region_name, credentials.get("aws_access_key_id"), config))
+        return FakeClient()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = FakeSession()
+    monkeypatch.setattr(aws_helpers, "_SESSION", fake)
+    monkeypatch.setattr(aws_helpers, "_CLIENTS", {})
+    monkeypatch.setattr(aws_helpers, "_max_pool_connections", None)
+    monkeypatch.delenv("MAX_POOL_CONNECTIONS", raising=False)
+    aws_helpers.reset_client_stats()
+    return fake
+
+
+class TestClientFactory:
+    """Test the shared client factory and region discovery."""
+
+    def test_clients_cached_per_region(self, session):
+        """Test one client is created per (service, region) and reuse is counted."""
+        first = aws_helpers.get_client("ec2", "us-east-1")
+        again = aws_helpers.get_client("ec2", "us-east-1")
+        other = aws_helpers.get_client("ec2", "eu-west-1")
+
+        assert first is again
+        assert first is not other
+        assert [c[:2] for c in session.created] == [("ec2", "us-east-1"), ("ec2", "eu-west-1")]
+        assert aws_helpers.get_client_stats() == {"created": 2, "reused": 1}
+
+    def test_default_region_from_environment(self, session, monkeypatch):
+        """Test clients without a region use the function's region."""
+        monkeypatch.setenv("AWS_REGION", "eu-central-1")
+
+        assert aws_helpers.get_client("sns") is aws_helpers.get_client("sns", "eu-central-1")
+        assert session.created[0][1] == "eu-central-1"
+
+    def test_concurrent_creation_is_serialised(self, session):
+        """Test threads racing for one key share a single client."""
+        barrier = threading.Barrier(8, timeout=5)
+
+        def get():
+            barrier.wait()
+            return aws_helpers.get_client("cloudwatch", "us-east-1")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: get(), range(8)))
+
+        assert len({id(c) for c in clients}) == 1
+        assert len(session.created) == 1
+        assert aws_helpers.get_client_stats() == {"created": 1, "reused": 7}
+
+    def test_pool_sized_from_scan_concurrency(self, session, monkeypatch):
+        """Test the connection pool follows scan concurrency, with an env override."""
+        assert aws_helpers.configure_client_pool(2) == aws_helpers.DEFAULT_MAX_POOL_CONNECTIONS
+        assert aws_helpers.configure_client_pool(16) == 32
+        aws_helpers.get_client("ec2", "us-east-1")
+        assert session.created[-1][3].max_pool_connections == 32
+
+        # Resizing drops cached clients so they are recreated with the new pool
+        monkeypatch.setenv("MAX_POOL_CONNECTIONS", "50")
+        assert aws_helpers.configure_client_pool(16) == 50
+        aws_helpers.get_client("ec2", "us-east-1")
+        assert session.created[-1][3].max_pool_connections == 50
+        assert len(session.created) == 2
+
+    def test_discover_regions(self):
+        """Test enabled regions are returned sorted."""
+        class FakeEC2:
+            def describe_regions(self, Filters=None):
+                assert Filters[0]["Name"] == "opt-in-status"
+                return {"Regions": [{"RegionName": "us-west-2"}, {"RegionName": "eu-west-1"}]}
+
+        assert aws_helpers.discover_regions(FakeEC2()) == ["eu-west-1", "us-west-2"]
+
+
+def _sts_response(key_id, expires_in):
+    return {
+        "Credentials": {
+            "AccessKeyId": key_id,
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": datetime.now(timezone.utc) + expires_in,
+        }
+    }
+
+
+class TestAssumeRoleCredentials:
+    """Test STS assume-role credential caching."""
+
+    @pytest.fixture
+    def sts(self, monkeypatch):
+        monkeypatch.setattr(aws_helpers, "_ASSUMED_CREDENTIALS", {})
+        client = boto3.client(
+            "sts",
+            region_name="us-east-1",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+        )
+        return client, Stubber(client)
+
+    def test_credentials_cached_until_expiry(self, sts):
+        """Test one AssumeRole call serves repeated lookups."""
+        client, stubber = sts
+        stubber.add_response(
+            "assume_role",
+            _sts_response("AKIA1111111111111111", timedelta(hours=1)),
+            {"RoleArn": "arn:aws:iam::111111111111:role/Scan", "RoleSessionName": "aws-waste-hunter"},
+        )
+
+        with stubber:
+            first = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            again = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            stubber.assert_no_pending_responses()
+
+        assert first is again
+        assert first["aws_access_key_id"] == "AKIA1111111111111111"
+        assert first["aws_session_token"] == "token"
+
+    def test_credentials_refreshed_near_expiry(self, sts):
+        """Test credentials inside the refresh margin are re-assumed."""
+        client, stubber = sts
+        stubber.add_response("assume_role", _sts_response("AKIAOLD0000000000000", timedelta(minutes=1)))
+        stubber.add_response("assume_role", _sts_response("AKIANEW0000000000000", timedelta(hours=1)))
+
+        with stubber:
+            stale = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            fresh = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            stubber.assert_no_pending_responses()
+
+        assert stale["aws_access_key_id"] == "AKIAOLD0000000000000"
+        assert fresh["aws_access_key_id"] == "AKIANEW0000000000000"
+
+    def test_clients_keyed_by_credentials(self, session):
+        """Test separate clients are created per set of credentials."""
+        a = aws_helpers.get_client("ec2", "us-east-1", {"aws_access_key_id": "A"})
+        b = aws_helpers.get_client("ec2", "us-east-1", {"aws_access_key_id": "B"})
+
+        assert a is not b
+        assert [c[2] for c in session.created] == ["A", "B"]
+
+    def test_refresh_drops_clients_of_replaced_credentials(self, sts, session):
+        """Test clients built with rotated assumed-role credentials are not kept around."""
+        client, stubber = sts
+        stubber.add_response("assume_role", _sts_response("AKIAOLD0000000000000", timedelta(minutes=1)))
+        stubber.add_response("assume_role", _sts_response("AKIANEW0000000000000", timedelta(hours=1)))
+
+        with stubber:
+            stale = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            aws_helpers.get_client("ec2", "us-east-1", stale)
+            aws_helpers.get_client("ec2", "eu-west-1", stale)
+            fresh = aws_helpers.assume_role_credentials("111111111111", "Scan", client)
+            aws_helpers.get_client("ec2", "us-east-1", fresh)
+
+        assert sorted(key[2] for key in aws_helpers._CLIENTS) == ["AKIANEW0000000000000"]
+
+
+def test_boto3_config_is_a_lazily_built_config():
+    """Test BOTO3_CONFIG is a botocore Config built once from the shared settings."""
+    from botocore.config import Config
+
+    assert isinstance(aws_helpers.BOTO3_CONFIG, Config)
+    assert aws_helpers.BOTO3_CONFIG is aws_helpers.BOTO3_CONFIG
+    assert aws_helpers.BOTO3_CONFIG.read_timeout == 60
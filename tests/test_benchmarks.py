@@ -0,0 +1,84 @@
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import run as bench
+from benchmarks import startup
+from benchmarks.backend import EstateBackend
+from benchmarks.estate import generate_estate
+from utils import aws_helpers
+
+
+@pytest.fixture
+def isolated(monkeypatch):
+    for key, value in bench.BENCHMARK_ENV.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(aws_helpers, "_SESSION", None)
+    monkeypatch.setattr(aws_helpers, "_CLIENTS", {})
+    level = logging.getLogger().level
+    yield
+    logging.getLogger().setLevel(level)
+
+
+def test_estate_is_deterministic():
+    """Test the same seed produces the same estate and a different seed does not."""
+    a = generate_estate(500, seed=7)
+    b = generate_estate(500, seed=7)
+    c = generate_estate(500, seed=8)
+
+    assert a.size == 500
+    assert a.volumes == b.volumes and a.cpu == b.cpu and a.rds_tags == b.rds_tags
+    assert a.volumes != c.volumes
+
+
+def test_handler_against_synthetic_estate(isolated):
+    """Test the backend serves every scanner and findings match the generated estate."""
+    result = bench.run_once(400, seed=3)
+
+    assert result["status"] == "ok"
+    assert result["found"] == sum(result["expected"].values())
+    assert result["api_calls"]["ec2.DescribeVolumes"] == 1
+    # Both scanners query CloudWatch; every call lands in exactly one of their stages
+    assert result["stages"]["scan_unused_elb"]["api_calls"] + result["stages"]["scan_idle_ec2"]["api_calls"] == sum(
+        count for call, count in result["api_calls"].items()
+        if call.startswith(("elb.", "elbv2.", "cloudwatch.GetMetricData", "ec2.DescribeInstances"))
+    )
+
+
+def test_partitioned_listing_matches_serial(isolated, monkeypatch):
+    """Test availability-zone partitioned listings report exactly what a serial listing does."""
+    from scanner.ebs_scanner import scan_unattached_ebs
+    from scanner.ec2_scanner import scan_idle_ec2
+
+    backend = EstateBackend(generate_estate(600, seed=5), page_size=25)
+    bench.install_backend(backend)
+
+    def scan():
+        key = lambda r: r["id"]
+        return sorted(scan_unattached_ebs(), key=key), sorted(scan_idle_ec2(), key=key)
+
+    monkeypatch.setenv("LIST_PARTITIONS", "1")
+    serial = scan()
+    monkeypatch.setenv("LIST_PARTITIONS", "2")
+    partitioned = scan()
+
+    assert serial == partitioned
+    assert all(serial)
+    assert backend.calls["ec2.DescribeAvailabilityZones"] == 2
+
+
+def test_handler_import_defers_heavy_modules():
+    """Test a cold import of the handler loads neither boto3, jinja2 nor the pipeline stages."""
+    code = (
+        "import sys, lambda_handler; "
+        f"print([m for m in {startup.DEFERRED_MODULES!r} if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+
+    assert output.strip() == "[]"
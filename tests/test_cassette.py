@@ -0,0 +1,134 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from benchmarks import run as bench
+from utils import aws_helpers, cassette
+
+
+def _session():
+    return boto3.session.Session(
+        aws_access_key_id="testing", aws_secret_access_key="testing", region_name="us-east-1",
+    )
+
+
+@pytest.fixture
+def isolated(monkeypatch):
+    for key, value in bench.BENCHMARK_ENV.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(aws_helpers, "_SESSION", None)
+    monkeypatch.setattr(aws_helpers, "_CLIENTS", {})
+    level = logging.getLogger().level
+    yield
+    logging.getLogger().setLevel(level)
+
+
+class TestRecordReplay:
+    """Test responses round-trip through a cassette file."""
+
+    def test_replay_matches_recorded_responses(self, tmp_path):
+        """Test datetimes, repeated calls and errors replay as recorded."""
+        path = str(tmp_path / "calls.jsonl.gz")
+        recorder = cassette.Recorder(path)
+        session = _session()
+        recorder.install(session)
+        ec2 = session.client("ec2")
+        created = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+        with Stubber(ec2) as stubber:
+            stubber.add_response("describe_volumes", {"Volumes": [{"VolumeId": "vol-1", "CreateTime": created}]})
+            stubber.add_response("describe_volumes", {"Volumes": [{"VolumeId": "vol-2", "CreateTime": created}]})
+            stubber.add_client_error("describe_instances", "UnauthorizedOperation", http_status_code=403)
+            ec2.describe_volumes()
+            ec2.describe_volumes()
+            with pytest.raises(ClientError):
+                ec2.describe_instances()
+        recorder.flush()
+
+        replayer = cassette.Replayer(path, latency_scale=0)
+        session = _session()
+        replayer.install(session)
+        ec2 = session.client("ec2")
+
+        volumes = [ec2.describe_volumes()["Volumes"][0] for _ in range(3)]
+        assert [v["VolumeId"] for v in volumes] == ["vol-1", "vol-2", "vol-2"]
+        assert volumes[0]["CreateTime"] == created
+        with pytest.raises(ClientError) as err:
+            ec2.describe_instances()
+        assert err.value.response["Error"]["Code"] == "UnauthorizedOperation"
+        with pytest.raises(cassette.CassetteMiss):
+            ec2.describe_volumes(Filters=[{"Name": "status", "Values": ["available"]}])
+        assert replayer.calls == {"ec2.DescribeVolumes": 3, "ec2.DescribeInstances": 1}
+
+    def test_credentials_redacted_and_segments_appended(self, tmp_path):
+        """Test STS secrets are not written and recording resumes after a flush."""
+        path = str(tmp_path / "calls.jsonl.gz")
+        recorder = cassette.Recorder(path)
+        session = _session()
+        recorder.install(session)
+        sts = session.client("sts")
+        response = {"Credentials": {
+            "AccessKeyId": "AKIAEXAMPLEEXAMPLE", "SecretAccessKey": "secret-key-value", "SessionToken": "token-value",
+            "Expiration": datetime(2030, 1, 1, tzinfo=timezone.utc),
+        }}
+
+        with Stubber(sts) as stubber:
+            stubber.add_response("assume_role", response)
+            stubber.add_response("assume_role", response)
+            arn = "arn:aws:iam::123456789012:role/Scan"
+            sts.assume_role(RoleArn=arn, RoleSessionName="scan")
+            recorder.flush()
+            sts.assume_role(RoleArn=arn, RoleSessionName="scan")
+            recorder.flush()
+
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            lines = handle.read().splitlines()
+        assert len(lines) == 3
+        assert "secret-key-value" not in lines[1] and "token-value" not in lines[2]
+        assert json.loads(lines[1])["response"]["Credentials"]["AccessKeyId"] == "AKIAEXAMPLEEXAMPLE"
+
+    def test_install_from_env(self, tmp_path, monkeypatch):
+        """Test the environment selects the cassette mode and unknown modes are ignored."""
+        path = str(tmp_path / "calls.jsonl.gz")
+        monkeypatch.setattr(cassette, "_ACTIVE", [])
+        monkeypatch.setenv("AWS_CASSETTE_PATH", path)
+
+        monkeypatch.setenv("AWS_CASSETTE_MODE", "record")
+        assert isinstance(cassette.install_from_env(_session()), cassette.Recorder)
+        monkeypatch.setenv("AWS_CASSETTE_MODE", "replay")
+        monkeypatch.setenv("AWS_CASSETTE_LATENCY_SCALE", "0.5")
+        replayer = cassette.install_from_env(_session())
+        assert replayer.latency_scale == 0.5
+        monkeypatch.setenv("AWS_CASSETTE_MODE", "rewind")
+        assert cassette.install_from_env(_session()) is None
+
+    def test_default_path_is_writable_on_lambda(self, tmp_path, monkeypatch):
+        """Test the cassette defaults to the temp directory rather than the read-only task root."""
+        assert os.path.dirname(cassette.DEFAULT_CASSETTE_PATH) == tempfile.gettempdir()
+        default = str(tmp_path / "default.jsonl.gz")
+        monkeypatch.setattr(cassette, "DEFAULT_CASSETTE_PATH", default)
+        monkeypatch.setattr(cassette, "_ACTIVE", [])
+        monkeypatch.delenv("AWS_CASSETTE_PATH", raising=False)
+        monkeypatch.setenv("AWS_CASSETTE_MODE", "record")
+
+        assert cassette.install_from_env(_session()).path == default
+
+
+def test_benchmark_replays_without_backend(isolated, tmp_path):
+    """Test a recorded handler run replays offline with identical findings and calls."""
+    path = str(tmp_path / "estate.jsonl.gz")
+
+    recorded = bench.run_once(300, seed=5, record=path)
+    replayed = bench.run_once(300, seed=5, replay=path, latency_scale=0)
+
+    assert replayed["status"] == recorded["status"] == "ok"
+    assert replayed["found"] == recorded["found"] == sum(recorded["expected"].values())
+    assert replayed["api_calls"] == recorded["api_calls"]
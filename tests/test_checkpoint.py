@@ -0,0 +1,434 @@
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import lambda_handler
+from utils import checkpoint as cp
+from utils.storage import LocalStore
+
+
+class FakeContext:
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:waste-hunter"
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def get_remaining_time_in_millis(self):
+        return self.budget()
+
+
+class FakeLambdaClient:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+def _volume(vid):
+    return {"VolumeId": vid, "Size": 10, "VolumeType": "gp3", "AvailabilityZone": "us-east-1a"}
+
+
+def test_resumable_pages_stop_and_resume_from_token(monkeypatch):
+    """Test a paused listing records its page token and the next run starts from it."""
+    monkeypatch.setattr(cp, "RESUME_CHUNK_ITEMS", 1)
+    ec2 = boto3.client("ec2", region_name="us-east-1", aws_access_key_id="testing", aws_secret_access_key="testing")
+    expired = []
+    deadline = cp.Deadline(FakeContext(lambda: 0 if expired else 60000), reserve_ms=1000)
+    seen = []
+
+    def scan(cursor):
+        with cp.resume(cursor):
+            for page in cp.resumable_pages("volumes", ec2.get_paginator("describe_volumes")):
+                for volume in page["Volumes"]:
+                    seen.append(volume["VolumeId"])
+                    cursor.records.append(volume["VolumeId"])
+                # The budget runs out while the first page is processed
+                expired.append(True)
+
+    store = {}
+    with Stubber(ec2) as stubber:
+        stubber.add_response("describe_volumes", {"Volumes": [_volume("vol-1")], "NextToken": "page-2"})
+        cursor = cp.Cursor(deadline)
+        try:
+            scan(cursor)
+        except cp.DeadlineReached:
+            store["state"] = cursor.as_dict()
+        stubber.assert_no_pending_responses()
+
+        expired.clear()
+        stubber.add_response("describe_volumes", {"Volumes": [_volume("vol-2")]}, {"NextToken": "page-2"})
+        cursor = cp.Cursor(cp.Deadline(None, 0), store["state"])
+        scan(cursor)
+        stubber.assert_no_pending_responses()
+
+    assert seen == ["vol-1", "vol-2"]
+    assert cursor.records == ["vol-1", "vol-2"]
+
+
+def test_resumable_pages_without_cursor_is_plain_pagination():
+    """Test scanners paginate exactly as before outside a checkpointed run."""
+    class Paginator:
+        def paginate(self, **kwargs):
+            assert kwargs == {"Filters": []}
+            return [{"Volumes": [1]}, {"Volumes": [2]}]
+
+    assert list(cp.resumable_pages("volumes", Paginator(), Filters=[])) == [{"Volumes": [1]}, {"Volumes": [2]}]
+
+
+def test_resumable_pages_under_a_plain_deadline_are_not_chunked():
+    """Test a cursor that is not resumable paginates as usual and stops at the next page."""
+    expired = []
+
+    class Paginator:
+        def paginate(self, **kwargs):
+            assert kwargs == {"Filters": []}
+            return [{"Volumes": [1]}, {"Volumes": [2]}, {"Volumes": [3]}]
+
+    cursor = cp.Cursor(cp.Deadline(FakeContext(lambda: 0 if expired else 60000), reserve_ms=1000), resumable=False)
+    seen = []
+
+    with cp.resume(cursor):
+        try:
+            for page in cp.resumable_pages("volumes", Paginator(), Filters=[]):
+                seen.extend(page["Volumes"])
+                expired.append(True)
+        except cp.DeadlineReached:
+            pass
+
+    assert seen == [1]
+    assert cursor.tokens == {}
+
+
+class ChunkedPaginator:
+    """Serves one item per page and one page per chunk, recording which pages were fetched."""
+
+    def __init__(self, count):
+        self.count = count
+        self.fetched = threading.Event()
+        self.requested = []
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        start = int((PaginationConfig or {}).get("StartingToken") or 0)
+        paginator = self
+
+        class Pages:
+            resume_token = None
+
+            def __iter__(self):
+                paginator.requested.append(start)
+                paginator.fetched.set()
+                yield {"Volumes": [start]}
+                self.resume_token = str(start + 1) if start + 1 < paginator.count else None
+
+        return Pages()
+
+
+def test_resumable_pages_prefetch_records_tokens_after_consumption(monkeypatch):
+    """Test prefetching fetches ahead but records a position only once its page is handled."""
+    monkeypatch.setattr(cp, "RESUME_CHUNK_ITEMS", 1)
+    paginator = ChunkedPaginator(3)
+    cursor = cp.Cursor(cp.Deadline(None, 0))
+    seen = []
+
+    with cp.resume(cursor):
+        pages = cp.resumable_pages("volumes", paginator, prefetch=True)
+        first = next(pages)
+        paginator.fetched.clear()
+        assert paginator.fetched.wait(5)  # the next page is fetched while this one is handled
+        assert paginator.requested == [0, 1]
+        assert cursor.tokens == {}
+        seen.append(first["Volumes"][0])
+        seen.extend(page["Volumes"][0] for page in pages)
+
+    assert seen == [0, 1, 2]
+    assert cursor.tokens == {"volumes": "__done__"}
+
+
+def test_resumable_pages_prefetch_stops_at_deadline(monkeypatch):
+    """Test a prefetched listing pauses at the chunk boundary of the last handled page."""
+    monkeypatch.setattr(cp, "RESUME_CHUNK_ITEMS", 1)
+    expired = []
+    cursor = cp.Cursor(cp.Deadline(FakeContext(lambda: 0 if expired else 60000), reserve_ms=1000))
+    seen = []
+
+    with cp.resume(cursor):
+        try:
+            for page in cp.resumable_pages("volumes", ChunkedPaginator(3), prefetch=True):
+                seen.extend(page["Volumes"])
+                expired.append(True)
+        except cp.DeadlineReached:
+            pass
+
+    assert seen == [0]
+    assert cursor.tokens == {"volumes": "1"}
+
+
+class ZonePaginator:
+    """Serves two single-item pages per availability-zone filter value."""
+
+    def paginate(self, PaginationConfig=None, Filters=None, **kwargs):
+        zone = Filters[0]["Values"][0]
+        start = int((PaginationConfig or {}).get("StartingToken") or 0)
+
+        class Pages:
+            resume_token = None
+
+            def __iter__(self):
+                yield {"Volumes": [f"{zone}-{start}"]}
+                if PaginationConfig is None:
+                    yield {"Volumes": [f"{zone}-1"]}
+                elif start == 0:
+                    self.resume_token = "1"
+
+        return Pages()
+
+
+def _zone_partitions(*zones):
+    return [(zone, {"Filters": [{"Name": "availability-zone", "Values": [zone]}]}) for zone in zones]
+
+
+def test_partitioned_pages_merges_partitions():
+    """Test partitions are listed concurrently and every page of each is yielded in order."""
+    pages = list(cp.partitioned_pages("volumes", ZonePaginator(), _zone_partitions("a", "b", "c")))
+    volumes = [v for page in pages for v in page["Volumes"]]
+
+    assert sorted(volumes) == ["a-0", "a-1", "b-0", "b-1", "c-0", "c-1"]
+    for zone in "abc":
+        assert volumes.index(f"{zone}-0") < volumes.index(f"{zone}-1")
+
+
+def test_partitioned_pages_resume_each_partition(monkeypatch):
+    """Test each partition records its own position and a resumed listing skips finished ones."""
+    monkeypatch.setattr(cp, "RESUME_CHUNK_ITEMS", 1)
+    cursor = cp.Cursor(cp.Deadline(None, 0), {"tokens": {"volumes:a": "__done__", "volumes:b": "1"}})
+
+    with cp.resume(cursor):
+        pages = list(cp.partitioned_pages("volumes", ZonePaginator(), _zone_partitions("a", "b")))
+
+    assert pages == [{"Volumes": ["b-1"]}]
+    assert cursor.tokens == {"volumes:a": "__done__", "volumes:b": "__done__"}
+
+
+def _patch_scanners(monkeypatch, ran):
+    def make_scan(name):
+        def scan():
+            ran.append(name)
+            yield {"type": "EBS", "id": f"vol-{name}", "size_gb": 10, "az": "us-east-1a", "tags": {}}
+        return scan
+
+    for name in lambda_handler.SCANNERS:
+        iter_name = name.replace("scan_", "iter_", 1)
+        monkeypatch.setattr(lambda_handler, iter_name, make_scan(iter_name))
+
+
+def test_handler_checkpoints_and_resumes(monkeypatch, tmp_path):
+    """Test work stops at the deadline, is checkpointed, and the next invocation finishes it."""
+    ran, reports = [], []
+    _patch_scanners(monkeypatch, ran)
+    fake_lambda = FakeLambdaClient()
+    monkeypatch.setattr(lambda_handler, "get_client", lambda *args: fake_lambda)
+    monkeypatch.setattr(lambda_handler, "send_report", reports.append)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+    monkeypatch.setenv("CHECKPOINT_LOCATION", str(tmp_path))
+    # A checkpoint location re-invokes the function by default
+    monkeypatch.delenv("CONTINUATION_MODE", raising=False)
+    monkeypatch.setenv("SCAN_CONCURRENCY", "1")
+    monkeypatch.setenv("TIME_RESERVE_MS", "1000")
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    # The budget runs out after two work items
+    first = lambda_handler.handler({}, FakeContext(lambda: 1000 if len(ran) >= 2 else 300000))
+
+    assert first["status"] == "incomplete"
+    assert (first["completed"], first["pending"], first["resources"]) == (2, 2, 2)
+    assert reports == []
+    assert LocalStore(str(tmp_path)).get("checkpoints/latest.json") is not None
+    assert fake_lambda.invocations[0]["InvocationType"] == "Event"
+    assert first["continuation"] == {"run_id": "latest"}
+
+    second = lambda_handler.handler(first["continuation"], FakeContext(lambda: 300000))
+
+    assert second["status"] == "ok"
+    assert second["resources"] == 4
+    assert ran == ["iter_unattached_ebs", "iter_idle_ec2", "iter_unused_elb", "iter_stopped_rds"]
+    assert len(reports) == 1
+    assert all(f"vol-{name}" in reports[0] for name in ran)
+    assert LocalStore(str(tmp_path)).get("checkpoints/latest.json") is None
+
+
+def test_handler_reports_partial_results_when_no_continuation_will_run(monkeypatch, tmp_path):
+    """Test CONTINUATION_MODE=none delivers what was found instead of leaving a checkpoint to expire."""
+    ran, reports = [], []
+    _patch_scanners(monkeypatch, ran)
+    monkeypatch.setattr(lambda_handler, "send_report", reports.append)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+    monkeypatch.setenv("CHECKPOINT_LOCATION", str(tmp_path))
+    monkeypatch.setenv("CONTINUATION_MODE", "none")
+    monkeypatch.setenv("SCAN_CONCURRENCY", "1")
+    monkeypatch.setenv("TIME_RESERVE_MS", "1000")
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    result = lambda_handler.handler({}, FakeContext(lambda: 1000 if len(ran) >= 2 else 300000))
+
+    assert result["status"] == "partial"
+    assert result["resources"] == 2
+    assert result["scan_errors"] == 2
+    assert len(reports) == 1 and "DeadlineReached" in reports[0]
+    assert LocalStore(str(tmp_path)).get("checkpoints/latest.json") is None
+
+
+def test_handler_reports_partial_results_without_checkpoint_location(monkeypatch):
+    """Test the handler still delivers what it found when it cannot checkpoint."""
+    ran, reports = [], []
+    _patch_scanners(monkeypatch, ran)
+    monkeypatch.setattr(lambda_handler, "send_report", reports.append)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+    monkeypatch.delenv("CHECKPOINT_LOCATION", raising=False)
+    monkeypatch.setenv("SCAN_CONCURRENCY", "1")
+    monkeypatch.setenv("TIME_RESERVE_MS", "1000")
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    result = lambda_handler.handler({}, FakeContext(lambda: 1000 if len(ran) >= 3 else 300000))
+
+    assert result["status"] == "partial"
+    assert result["resources"] == 3
+    assert result["scan_errors"] == 1
+    assert "DeadlineReached" in reports[0]
+
+
+def test_handler_streams_under_a_deadline_without_checkpoint_location(monkeypatch):
+    """Test a Lambda context alone keeps the streaming scan: records reach estimation while scanning."""
+    reports, estimated = [], threading.Event()
+    streamed_while_scanning = []
+
+    def scan():
+        yield {"type": "EBS", "id": "vol-1", "size_gb": 10, "az": "us-east-1a", "tags": {}}
+        streamed_while_scanning.append(estimated.wait(5))
+        yield {"type": "EBS", "id": "vol-2", "size_gb": 10, "az": "us-east-1a", "tags": {}}
+
+    def watch(records, totals):
+        from cost_engine.estimator import iter_monthly_waste
+
+        for record in iter_monthly_waste(records, totals):
+            estimated.set()
+            yield record
+
+    for name in lambda_handler.SCANNERS:
+        func = scan if name == "scan_unattached_ebs" else (lambda: iter(()))
+        monkeypatch.setattr(lambda_handler, name.replace("scan_", "iter_", 1), func)
+    monkeypatch.setattr(lambda_handler, "iter_monthly_waste", watch)
+    monkeypatch.setattr(lambda_handler, "_run_scanners_within_budget", None)
+    monkeypatch.setattr(lambda_handler, "send_report", reports.append)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+    monkeypatch.delenv("CHECKPOINT_LOCATION", raising=False)
+    monkeypatch.setenv("PIPELINE_MODE", "streaming")
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    result = lambda_handler.handler({}, FakeContext(lambda: 300000))
+
+    assert result["status"] == "ok"
+    assert result["resources"] == 2
+    assert streamed_while_scanning == [True]
+    assert "vol-2" in reports[0]
+
+
+class EndlessPaginator:
+    """Serves single-item pages forever, never reaching a chunk boundary."""
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        class Pages:
+            resume_token = None
+
+            def __iter__(self):
+                n = 0
+                while True:
+                    time.sleep(0.01)
+                    yield {"Volumes": [n]}
+                    n += 1
+
+        return Pages()
+
+
+def test_run_scanners_within_budget_stops_and_joins_work_items(monkeypatch):
+    """Test items still running at the deadline stop at a page boundary and are joined, not abandoned."""
+    monkeypatch.setattr(cp, "RESUME_CHUNK_ITEMS", 10 ** 6)
+    finished = []
+
+    def scan():
+        try:
+            for page in cp.resumable_pages("volumes", EndlessPaginator()):
+                yield from page["Volumes"]
+        finally:
+            finished.append(True)
+
+    checkpoint = cp.Checkpoint(None, "latest")
+    # 100 ms before the reserve, so the pool is waited on for 100 + 500 ms
+    deadline = cp.Deadline(FakeContext(lambda: 1100), reserve_ms=1000)
+
+    done = lambda_handler._run_scanners_within_budget([("scan", scan)], checkpoint, deadline, [], {})
+
+    assert not done
+    assert finished == [True]
+    # Records past the last recorded position are dropped: the resumed listing finds them again
+    assert checkpoint.partial["scan"] == {"records": [], "tokens": {}}
+
+
+def test_run_scanners_within_budget_does_not_wait_for_a_blocked_work_item():
+    """Test an item stuck in one call past the deadline is left behind so the checkpoint can still be saved."""
+    release = threading.Event()
+
+    def blocked():
+        # e.g. a long GetMetricData call that never reaches a page or batch boundary
+        release.wait(10)
+        yield {"type": "EBS", "id": "vol-late"}
+
+    def quick():
+        yield {"type": "EBS", "id": "vol-1"}
+
+    checkpoint = cp.Checkpoint(None, "latest", {"partial": {"blocked": {"records": ["vol-0"], "tokens": {"volumes": "1"}}}})
+    # 100 ms before the reserve: stop after 100 + 500 ms, give up after another 250 ms
+    deadline = cp.Deadline(FakeContext(lambda: 1100), reserve_ms=1000)
+    started = time.perf_counter()
+
+    try:
+        done = lambda_handler._run_scanners_within_budget(
+            [("quick", quick), ("blocked", blocked)], checkpoint, deadline, [], {}
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        release.set()
+
+    assert not done
+    assert elapsed < 2
+    assert checkpoint.completed == {"quick": [{"type": "EBS", "id": "vol-1"}]}
+    # The blocked item keeps its last saved position
+    assert checkpoint.partial["blocked"] == {"records": ["vol-0"], "tokens": {"volumes": "1"}}
+
+
+def test_metric_batches_end_once_the_work_item_is_stopped():
+    """Test a stopped work item ends between GetMetricData batches instead of finishing them."""
+    from utils.aws_helpers import get_metric_data_batched
+
+    stop = threading.Event()
+
+    class FakeCloudwatch:
+        def __init__(self):
+            self.calls = 0
+
+        def get_metric_data(self, MetricDataQueries=None, **kwargs):
+            self.calls += 1
+            stop.set()
+            return {"MetricDataResults": [{"Id": q["Id"], "Values": [1.0]} for q in MetricDataQueries]}
+
+    cloudwatch = FakeCloudwatch()
+    queries = [{"Id": f"q{n}"} for n in range(5)]
+
+    with cp.resume(cp.Cursor(cp.Deadline(None, 0), stop=stop)):
+        with pytest.raises(cp.DeadlineReached):
+            get_metric_data_batched(cloudwatch, queries, None, None, batch_size=2)
+
+    assert cloudwatch.calls == 1
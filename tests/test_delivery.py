@@ -14,3 +14,25 @@ def test_archive_report_requires_env(monkeypatch):
     monkeypatch.delenv("REPORT_BUCKET", raising=False)
     with pytest.raises(ValueError):
         archive_report("hi")
+
+
+def test_send_report_truncates_to_sns_limit(monkeypatch):
+    from delivery import sns_sender
+
+    published = {}
+
+    class FakeSNS:
+        def publish(self, **kwargs):
+            published.update(kwargs)
+
+    monkeypatch.setenv("SNS_TOPIC_ARN", "arn:aws:sns:us-east-1:123:topic")
+    monkeypatch.setattr(sns_sender, "_get_sns_client", lambda: FakeSNS())
+
+    send_report("é" * sns_sender.MAX_MESSAGE_BYTES)
+
+    message = published["Message"].encode("utf-8")
+    assert len(message) <= sns_sender.MAX_MESSAGE_BYTES
+    assert published["Message"].endswith(sns_sender.TRUNCATION_NOTE)
+
+    send_report("short")
+    assert published["Message"] == "short"
@@ -1,4 +1,8 @@
+import boto3
+from botocore.stub import Stubber
+
 import scanner.ebs_scanner as ebs_scanner
+import utils.aws_helpers as aws_helpers
 
 
 class FakeEC2Client:
@@ -33,7 +37,7 @@ def test_scan_unattached_ebs_basic(monkeypatch):
     }]
     
     fake_client = FakeEC2Client(volumes_data)
-    monkeypatch.setattr(ebs_scanner, "_ec2_client", fake_client)
+    monkeypatch.setattr(ebs_scanner, "_get_ec2_client", lambda *args: fake_client)
 
     results = ebs_scanner.scan_unattached_ebs()
 
@@ -74,7 +78,7 @@ def test_scan_unattached_ebs_multiple_pages(monkeypatch):
     ]
     
     fake_client = FakeEC2Client(volumes_data)
-    monkeypatch.setattr(ebs_scanner, "_ec2_client", fake_client)
+    monkeypatch.setattr(ebs_scanner, "_get_ec2_client", lambda *args: fake_client)
 
     results = ebs_scanner.scan_unattached_ebs()
 
@@ -100,7 +104,7 @@ def test_scan_unattached_ebs_local_zone(monkeypatch):
     }]
     
     fake_client = FakeEC2Client(volumes_data)
-    monkeypatch.setattr(ebs_scanner, "_ec2_client", fake_client)
+    monkeypatch.setattr(ebs_scanner, "_get_ec2_client", lambda *args: fake_client)
 
     results = ebs_scanner.scan_unattached_ebs()
 
@@ -124,7 +128,7 @@ def test_scan_unattached_ebs_no_tags(monkeypatch):
     }]
     
     fake_client = FakeEC2Client(volumes_data)
-    monkeypatch.setattr(ebs_scanner, "_ec2_client", fake_client)
+    monkeypatch.setattr(ebs_scanner, "_get_ec2_client", lambda *args: fake_client)
 
     results = ebs_scanner.scan_unattached_ebs()
 
@@ -137,8 +141,32 @@ def test_scan_unattached_ebs_empty_result(monkeypatch):
     volumes_data = [{"Volumes": []}]
     
     fake_client = FakeEC2Client(volumes_data)
-    monkeypatch.setattr(ebs_scanner, "_ec2_client", fake_client)
+    monkeypatch.setattr(ebs_scanner, "_get_ec2_client", lambda *args: fake_client)
 
     results = ebs_scanner.scan_unattached_ebs()
 
     assert len(results) == 0
+
+
+def test_scan_unattached_ebs_with_assumed_credentials(monkeypatch):
+    """Test scanning another account's region through a stubbed per-credentials client."""
+    credentials = {
+        "aws_access_key_id": "AKIAMEMBER",
+        "aws_secret_access_key": "secret",
+        "aws_session_token": "token",
+    }
+    client = boto3.client("ec2", region_name="eu-west-1", **credentials)
+    stubber = Stubber(client)
+    stubber.add_response(
+        "describe_volumes",
+        {"Volumes": [{"VolumeId": "vol-member", "Size": 8, "VolumeType": "gp3",
+                      "AvailabilityZone": "eu-west-1b"}]},
+        {"Filters": [{"Name": "status", "Values": ["available"]}]},
+    )
+    monkeypatch.setattr(aws_helpers, "_CLIENTS", {("ec2", "eu-west-1", "AKIAMEMBER"): client})
+
+    with stubber:
+        results = ebs_scanner.scan_unattached_ebs(region="eu-west-1", credentials=credentials)
+
+    assert [r["id"] for r in results] == ["vol-member"]
+    assert results[0]["region"] == "eu-west-1"
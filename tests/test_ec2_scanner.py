@@ -1,5 +1,10 @@
 import scanner.ec2_scanner as ec2_scanner
+from utils import metrics
 import os
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.stub import ANY, Stubber
 
 
 class FakeEC2Paginator:
@@ -24,18 +29,19 @@ class FakeCloudwatchClient:
         self.metrics_map = metrics_map
         self.calls = []
 
-    def get_metric_statistics(self, **kwargs):
-        iid = kwargs["Dimensions"][0]["Value"]
-        self.calls.append(iid)
-        
-        if iid not in self.metrics_map:
-            return {"Datapoints": []}
-        
-        datapoints = self.metrics_map[iid]
-        if datapoints is None:
-            return {"Datapoints": []}
-        
-        return {"Datapoints": [{"Average": avg} for avg in datapoints]}
+        self.batches = []
+
+    def get_metric_data(self, **kwargs):
+        queries = kwargs["MetricDataQueries"]
+        self.batches.append(len(queries))
+        results = []
+        for query in queries:
+            metric = query["MetricStat"]["Metric"]
+            iid = metric["Dimensions"][0]["Value"]
+            self.calls.append(iid)
+            values = self.metrics_map.get((iid, metric["MetricName"]), self.metrics_map.get(iid)) or []
+            results.append({"Id": query["Id"], "Values": values, "StatusCode": "Complete"})
+        return {"MetricDataResults": results}
 
 
 def test_scan_idle_ec2_basic(monkeypatch):
@@ -60,8 +66,8 @@ def test_scan_idle_ec2_basic(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-1": [1.0, 1.5]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "2")
     ec2_scanner.CPU_THRESHOLD = None  # Reset cached value
 
@@ -75,6 +81,29 @@ def test_scan_idle_ec2_basic(monkeypatch):
     assert results[0]["tags"]["owner"] == "sre"
 
 
+def test_project_page_keeps_reported_fields():
+    """Test pages are reduced to the fields the scan reports."""
+    page = {"Reservations": [{
+        "OwnerId": "111111111111",
+        "Instances": [{
+            "InstanceId": "i-1",
+            "InstanceType": "t3.micro",
+            "Placement": {"AvailabilityZone": "us-east-1a", "Tenancy": "default"},
+            "Tags": [{"Key": "owner", "Value": "sre"}],
+            "LaunchTime": datetime(2026, 1, 5, tzinfo=timezone.utc),
+            "StateTransitionReason": "",
+            "BlockDeviceMappings": [{"DeviceName": "/dev/xvda"}],
+            "NetworkInterfaces": [{"NetworkInterfaceId": "eni-1"}],
+        }],
+    }]}
+
+    assert ec2_scanner._project_page(page) == ("111111111111", [
+        {"id": "i-1", "instance_type": "t3.micro", "az": "us-east-1a", "tags": {"owner": "sre"},
+         "launch_time": datetime(2026, 1, 5, tzinfo=timezone.utc), "state_reason": ""},
+    ])
+    assert ec2_scanner._project_page({}) == (None, [])
+
+
 def test_scan_idle_ec2_pagination(monkeypatch):
     """Test pagination with multiple pages."""
     reservations_data = [
@@ -97,8 +126,8 @@ def test_scan_idle_ec2_pagination(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-1": [1.0], "i-2": [1.5]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "2")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -109,6 +138,22 @@ def test_scan_idle_ec2_pagination(monkeypatch):
     assert results[1]["region"] == "us-west-2"
 
 
+def test_scan_idle_ec2_dedupes_instances(monkeypatch):
+    """Test an instance listed twice (e.g. by overlapping partitions) is evaluated once."""
+    fake_ec2 = FakeEC2Client(_running_instances(2) + _running_instances(1))
+    fake_cw = FakeCloudwatchClient({"i-0": [1.0], "i-1": [1.0]})
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    results = ec2_scanner.scan_idle_ec2()
+
+    assert [r["id"] for r in results] == ["i-0", "i-1"]
+    assert fake_cw.calls == ["i-0", "i-1"]
+
+
 def test_scan_idle_ec2_filters_busy_instances(monkeypatch):
     """Test that busy instances are filtered out."""
     reservations_data = [
@@ -125,8 +170,8 @@ def test_scan_idle_ec2_filters_busy_instances(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-idle": [1.0], "i-busy": [95.0]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "2")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -151,8 +196,8 @@ def test_scan_idle_ec2_no_metrics(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-new": None})  # No metrics
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "2")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -176,8 +221,8 @@ def test_scan_idle_ec2_custom_threshold(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-1": [3.0]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "5")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -201,8 +246,8 @@ def test_scan_idle_ec2_invalid_threshold(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-1": [1.0]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "invalid")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -227,8 +272,8 @@ def test_scan_idle_ec2_local_zone(monkeypatch):
     fake_ec2 = FakeEC2Client(reservations_data)
     fake_cw = FakeCloudwatchClient({"i-1": [1.0]})
     
-    monkeypatch.setattr(ec2_scanner, "_ec2_client", fake_ec2)
-    monkeypatch.setattr(ec2_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
     monkeypatch.setenv("CPU_THRESHOLD", "2")
     ec2_scanner.CPU_THRESHOLD = None
 
@@ -237,3 +282,234 @@ def test_scan_idle_ec2_local_zone(monkeypatch):
     assert len(results) == 1
     assert results[0]["az"] == "us-east-1-bos-1a"
     assert results[0]["region"] == "us-east-1"
+
+
+def _running_instances(count):
+    return [{
+        "Reservations": [{
+            "Instances": [
+                {"InstanceId": f"i-{n}", "InstanceType": "t3.micro",
+                 "Placement": {"AvailabilityZone": "us-east-1a"}, "Tags": []}
+                for n in range(count)
+            ]
+        }]
+    }]
+
+
+def test_scan_idle_ec2_batches_metric_queries(monkeypatch):
+    """Test that CPU metrics are fetched in GetMetricData batches of 500."""
+    fake_ec2 = FakeEC2Client(_running_instances(1200))
+    fake_cw = FakeCloudwatchClient({f"i-{n}": [1.0] for n in range(1200)})
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    results = ec2_scanner.scan_idle_ec2()
+
+    assert fake_cw.batches == [500, 500, 200]
+    assert len(results) == 1200
+
+
+def test_scan_idle_ec2_multiple_metrics(monkeypatch):
+    """Test that all idle metrics are fetched in one batched pass and must all be below threshold."""
+    fake_ec2 = FakeEC2Client(_running_instances(4))
+    quiet = {"NetworkIn": [1e3], "NetworkOut": [2e3], "EBSReadOps": [10.0], "EBSWriteOps": [20.0]}
+    metrics = {}
+    for n in range(4):
+        metrics[(f"i-{n}", "CPUUtilization")] = [1.0]
+        for name, values in quiet.items():
+            metrics[(f"i-{n}", name)] = values
+    metrics[("i-1", "NetworkOut")] = [9e6]  # serving traffic despite low CPU
+    metrics[("i-2", "EBSWriteOps")] = [500.0]  # under the raised write threshold
+    metrics[("i-3", "EBSReadOps")] = []  # no datapoints does not block idleness
+    fake_cw = FakeCloudwatchClient(metrics)
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    monkeypatch.setenv("IDLE_METRICS", "network_in, network_out,ebs_read_ops,ebs_write_ops,bogus")
+    monkeypatch.setenv("IDLE_THRESHOLD_EBS_WRITE_OPS", "600")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    results = ec2_scanner.scan_idle_ec2()
+
+    assert fake_cw.batches == [20]
+    assert [r["id"] for r in results] == ["i-0", "i-2", "i-3"]
+    assert results[0]["idle_metrics"] == {
+        "cpu": 1.0, "network_in": 1e3, "network_out": 2e3, "ebs_read_ops": 10.0, "ebs_write_ops": 20.0,
+    }
+    assert results[2]["idle_metrics"]["ebs_read_ops"] is None
+
+
+def test_idle_metric_thresholds(monkeypatch):
+    """Test per-metric threshold parsing and the column-wise idle mask."""
+    monkeypatch.setenv("CPU_THRESHOLD", "3")
+    monkeypatch.setenv("IDLE_THRESHOLD_NETWORK_IN", "-1")
+    monkeypatch.setenv("IDLE_THRESHOLD_NETWORK_OUT", "100")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    thresholds = ec2_scanner._get_metric_thresholds(["cpu", "network_in", "network_out"])
+
+    assert thresholds == {"cpu": 3.0, "network_in": 5e6, "network_out": 100.0}
+    nan = float("nan")
+    columns = {
+        "cpu": [1.0, 1.0, 5.0, 1.0],
+        "network_in": [10.0, 10.0, 10.0, nan],
+        "network_out": [50.0, 150.0, 50.0, nan],
+    }
+    assert ec2_scanner._idle_mask(columns, thresholds) == [True, False, False, True]
+
+
+class FakeHourlyCloudwatchClient:
+    """Serves one datapoint per hour from a per-instance function of the hour of day."""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.batches = []
+
+    def get_metric_data(self, **kwargs):
+        queries = kwargs["MetricDataQueries"]
+        self.batches.append(len(queries))
+        hours = int((kwargs["EndTime"] - kwargs["StartTime"]).total_seconds() // 3600)
+        results = []
+        for query in queries:
+            assert query["MetricStat"]["Period"] == 3600
+            profile = self.profiles[query["MetricStat"]["Metric"]["Dimensions"][0]["Value"]]
+            stamps = [kwargs["StartTime"] + timedelta(hours=h) for h in range(hours)]
+            results.append({
+                "Id": query["Id"],
+                "Timestamps": stamps,
+                "Values": [profile(t.hour) for t in stamps],
+                "StatusCode": "Complete",
+            })
+        return {"MetricDataResults": results}
+
+
+def test_scan_idle_ec2_percentile_mode(monkeypatch):
+    """Test hourly percentile mode reports instances that are busy a few hours a day as active."""
+    fake_ec2 = FakeEC2Client(_running_instances(3))
+    fake_cw = FakeHourlyCloudwatchClient({
+        "i-0": lambda hour: 0.5,
+        "i-1": lambda hour: 90.0 if hour == 3 else 0.5,  # one busy hour a day: 4% of hours
+        "i-2": lambda hour: 90.0 if hour < 4 else 0.5,  # four busy hours a day
+    })
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    monkeypatch.setenv("IDLE_MODE", "percentile")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    results = ec2_scanner.scan_idle_ec2()
+
+    assert fake_cw.batches == [3]
+    assert [r["id"] for r in results] == ["i-0", "i-1"]
+    assert results[0]["cpu_hourly"] == {"p50": 0.5, "p95": 0.5, "max": 0.5}
+    assert results[1]["cpu_hourly"]["max"] == 90.0
+
+    monkeypatch.setenv("IDLE_PERCENTILE", "99")
+    assert [r["id"] for r in ec2_scanner.scan_idle_ec2()] == ["i-0"]
+
+
+def test_scan_idle_ec2_percentile_batches_under_datapoint_limit(monkeypatch):
+    """Test hourly queries are batched so one call stays under 100,800 datapoints."""
+    fake_ec2 = FakeEC2Client(_running_instances(300))
+    fake_cw = FakeHourlyCloudwatchClient({f"i-{n}": (lambda hour: 1.0) for n in range(300)})
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    monkeypatch.setenv("IDLE_MODE", "percentile")
+    monkeypatch.setenv("CPU_LOOKBACK_DAYS", "30")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    results = ec2_scanner.scan_idle_ec2()
+
+    assert fake_cw.batches == [140, 140, 20]  # 100,800 // 720 hourly points
+    assert len(results) == 300
+
+
+def test_scan_idle_ec2_skips_instances_before_metric_lookups(monkeypatch):
+    """Test exempt, recently launched and recently started instances are counted, not queried."""
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=60)
+    recent = now - timedelta(hours=2)
+    instances = [
+        {"InstanceId": "i-old", "LaunchTime": old},
+        {"InstanceId": "i-new", "LaunchTime": recent},
+        {"InstanceId": "i-restarted", "LaunchTime": old,
+         "StateTransitionReason": f"User initiated ({recent:%Y-%m-%d %H:%M:%S} GMT)"},
+        {"InstanceId": "i-restarted-long-ago", "LaunchTime": old,
+         "StateTransitionReason": f"User initiated ({old:%Y-%m-%d %H:%M:%S} GMT)"},
+        {"InstanceId": "i-exempt", "LaunchTime": old, "Tags": [{"Key": "waste-hunter:exempt", "Value": "true"}]},
+        {"InstanceId": "i-not-exempt", "LaunchTime": old, "Tags": [{"Key": "waste-hunter:exempt", "Value": "false"}]},
+    ]
+    for i in instances:
+        i.update({"InstanceType": "t3.micro", "Placement": {"AvailabilityZone": "us-east-1a"}})
+    fake_ec2 = FakeEC2Client([{"Reservations": [{"Instances": instances}]}])
+    fake_cw = FakeCloudwatchClient({i["InstanceId"]: [1.0] for i in instances})
+
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    ec2_scanner.CPU_THRESHOLD = None
+    run = metrics.start_run()
+
+    with metrics.stage("scan_idle_ec2"):
+        results = ec2_scanner.scan_idle_ec2()
+
+    assert [r["id"] for r in results] == ["i-old", "i-restarted-long-ago", "i-not-exempt"]
+    assert fake_cw.calls == ["i-old", "i-restarted-long-ago", "i-not-exempt"]
+    stage = run.as_dict()["stages"]["scan_idle_ec2"]
+    assert stage["skipped"] == 3
+    assert stage["skipped_by_reason"] == {"recently_launched": 1, "recently_started": 1, "exempt": 1}
+
+
+def test_scan_idle_ec2_metric_data_stubber(monkeypatch):
+    """Test NextToken pagination and error handling against a stubbed CloudWatch client."""
+    cloudwatch = boto3.client(
+        "cloudwatch",
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    stubber = Stubber(cloudwatch)
+    now = datetime.now(timezone.utc)
+
+    # i-0 is idle across two pages, i-1 has no data, i-2 is busy, i-3 errored
+    stubber.add_response("get_metric_data", {
+        "MetricDataResults": [
+            {"Id": "cpu0", "Timestamps": [now], "Values": [1.0], "StatusCode": "PartialData"},
+            {"Id": "cpu1", "Timestamps": [], "Values": [], "StatusCode": "Complete"},
+            {"Id": "cpu2", "Timestamps": [now], "Values": [80.0], "StatusCode": "Complete"},
+            {"Id": "cpu3", "Timestamps": [], "Values": [], "StatusCode": "InternalError"},
+        ],
+        "NextToken": "page-2",
+    })
+    stubber.add_response(
+        "get_metric_data",
+        {"MetricDataResults": [
+            {"Id": "cpu0", "Timestamps": [now], "Values": [0.5], "StatusCode": "Complete"},
+        ]},
+        expected_params={
+            "MetricDataQueries": [ec2_scanner._metric_query(f"cpu{n}", f"i-{n}", "cpu") for n in range(4)],
+            "StartTime": ANY,
+            "EndTime": ANY,
+            "NextToken": "page-2",
+        },
+    )
+
+    fake_ec2 = FakeEC2Client(_running_instances(4))
+    monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: fake_ec2)
+    monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: cloudwatch)
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    with stubber:
+        results = ec2_scanner.scan_idle_ec2()
+        stubber.assert_no_pending_responses()
+
+    assert [r["id"] for r in results] == ["i-0"]
+    assert results[0]["avg_cpu"] == 0.75
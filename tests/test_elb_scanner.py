@@ -1,23 +1,47 @@
+import math
 import scanner.elb_scanner as elb_scanner
 
 
 class FakeElbV2Paginator:
-    def __init__(self, lbs_data):
-        self.lbs_data = lbs_data
+    def __init__(self, pages):
+        self.pages = pages
 
-    def paginate(self):
-        return self.lbs_data
+    def paginate(self, **kwargs):
+        return self.pages(**kwargs) if callable(self.pages) else self.pages
 
 
 class FakeElbV2Client:
-    def __init__(self, lbs_data, tags_map=None):
+    def __init__(self, lbs_data, tags_map=None, listeners_map=None, target_groups=None, target_health=None):
         self.lbs_data = lbs_data
         self.tags_map = tags_map or {}
+        # Every load balancer has one listener and no target groups unless told otherwise,
+        # which leaves it to the metric check
+        self.listeners_map = listeners_map or {}
+        self.target_groups = target_groups or []
+        self.target_health = target_health or {}
         self.tag_calls = []
+        self.listener_calls = []
+        self.health_calls = []
 
     def get_paginator(self, name):
-        assert name == "describe_load_balancers"
-        return FakeElbV2Paginator(self.lbs_data)
+        if name == "describe_load_balancers":
+            return FakeElbV2Paginator(self.lbs_data)
+        if name == "describe_target_groups":
+            return FakeElbV2Paginator([{"TargetGroups": self.target_groups}])
+        if name == "describe_listeners":
+            return FakeElbV2Paginator(self._listener_pages)
+        raise ValueError(f"Unknown paginator: {name}")
+
+    def _listener_pages(self, LoadBalancerArn=None):
+        self.listener_calls.append(LoadBalancerArn)
+        listeners = self.listeners_map.get(LoadBalancerArn, [{"ListenerArn": f"{LoadBalancerArn}/listener"}])
+        if isinstance(listeners, Exception):
+            raise listeners
+        return [{"Listeners": listeners}]
+
+    def describe_target_health(self, TargetGroupArn=None):
+        self.health_calls.append(TargetGroupArn)
+        return {"TargetHealthDescriptions": self.target_health.get(TargetGroupArn, [])}
 
     def describe_tags(self, ResourceArns=None):
         self.tag_calls.append(ResourceArns)
@@ -37,37 +61,53 @@ class FakeClassicElbPaginator:
 
 
 class FakeClassicElbClient:
-    def __init__(self, lbs_data):
+    def __init__(self, lbs_data, tags_map=None):
         self.lbs_data = lbs_data
+        self.tags_map = tags_map or {}
+        self.tag_calls = []
 
     def get_paginator(self, name):
         assert name == "describe_load_balancers"
         return FakeClassicElbPaginator(self.lbs_data)
 
+    def describe_tags(self, LoadBalancerNames=None):
+        assert len(LoadBalancerNames) <= 20
+        self.tag_calls.append(LoadBalancerNames)
+        return {"TagDescriptions": [
+            {"LoadBalancerName": name, "Tags": self.tags_map.get(name, [])} for name in LoadBalancerNames
+        ]}
+
 
 class FakeCloudwatchClient:
-    def __init__(self, metrics_map):
+    def __init__(self, metrics_map, errors=()):
         self.metrics_map = metrics_map
+        self.errors = set(errors)  # dimension values whose query reports an error status
         self.calls = []
-
-    def get_metric_statistics(self, **kwargs):
-        namespace = kwargs["Namespace"]
-        metric_name = kwargs["MetricName"]
-        dimension_value = kwargs["Dimensions"][0]["Value"]
-        
-        self.calls.append({
-            "namespace": namespace,
-            "metric": metric_name,
-            "dimension": dimension_value
-        })
-        
-        key = f"{namespace}:{metric_name}:{dimension_value}"
-        datapoints = self.metrics_map.get(key, [])
-        
-        if not datapoints:
-            return {"Datapoints": []}
-        
-        return {"Datapoints": [{"Sum": val} for val in datapoints]}
+        self.batches = []
+
+    def get_metric_data(self, **kwargs):
+        queries = kwargs["MetricDataQueries"]
+        self.batches.append(len(queries))
+        results = []
+        for query in queries:
+            metric = query["MetricStat"]["Metric"]
+            namespace = metric["Namespace"]
+            metric_name = metric["MetricName"]
+            dimension_value = metric["Dimensions"][0]["Value"]
+
+            self.calls.append({
+                "namespace": namespace,
+                "metric": metric_name,
+                "dimension": dimension_value
+            })
+
+            if dimension_value in self.errors:
+                results.append({"Id": query["Id"], "Values": [], "StatusCode": "InternalError"})
+                continue
+            key = f"{namespace}:{metric_name}:{dimension_value}"
+            values = self.metrics_map.get(key, [])
+            results.append({"Id": query["Id"], "Values": list(values), "StatusCode": "Complete"})
+        return {"MetricDataResults": results}
 
 
 def test_scan_unused_elb_alb_with_tags(monkeypatch):
@@ -93,9 +133,9 @@ def test_scan_unused_elb_alb_with_tags(monkeypatch):
     fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
     fake_cw = FakeCloudwatchClient({})  # No metrics = unused
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -123,9 +163,9 @@ def test_scan_unused_elb_nlb(monkeypatch):
     fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
     fake_cw = FakeCloudwatchClient({})
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -148,12 +188,12 @@ def test_scan_unused_elb_classic(monkeypatch):
     }]
     
     fake_elbv2 = FakeElbV2Client([{"LoadBalancers": []}])
-    fake_elb = FakeClassicElbClient(classic_lbs_data)
+    fake_elb = FakeClassicElbClient(classic_lbs_data, {"my-classic-lb": [{"Key": "owner", "Value": "sre"}]})
     fake_cw = FakeCloudwatchClient({})
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -161,7 +201,7 @@ def test_scan_unused_elb_classic(monkeypatch):
     assert results[0]["id"] == "my-classic-lb"
     assert results[0]["lb_type"] == "CLASSIC"
     assert results[0]["region"] == "eu-west-1"
-    assert results[0]["tags"] == {}  # Classic doesn't support tags via API
+    assert results[0]["tags"] == {"owner": "sre"}
     assert fake_cw.calls[0]["namespace"] == "AWS/ELB"
 
 
@@ -195,9 +235,9 @@ def test_scan_unused_elb_filters_used(monkeypatch):
     fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
     fake_cw = FakeCloudwatchClient(metrics_map)
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -222,9 +262,9 @@ def test_scan_unused_elb_batch_tags(monkeypatch):
     fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
     fake_cw = FakeCloudwatchClient({})
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -250,9 +290,9 @@ def test_scan_unused_elb_empty_azs(monkeypatch):
     fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
     fake_cw = FakeCloudwatchClient({})
     
-    monkeypatch.setattr(elb_scanner, "_elbv2_client", fake_elbv2)
-    monkeypatch.setattr(elb_scanner, "_elb_client", fake_elb)
-    monkeypatch.setattr(elb_scanner, "_cloudwatch_client", fake_cw)
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
 
     results = elb_scanner.scan_unused_elb()
 
@@ -260,3 +300,199 @@ def test_scan_unused_elb_empty_azs(monkeypatch):
     assert len(results) == 1
     assert results[0]["az"] == ""
     assert results[0]["region"] is None
+
+
+def _albs(count):
+    return [
+        {"LoadBalancerName": f"alb-{i}",
+         "LoadBalancerArn": f"arn:aws:elasticloadbalancing:us-east-1:123:loadbalancer/app/alb-{i}/x{i}",
+         "Type": "application",
+         "Scheme": "internet-facing",
+         "AvailabilityZones": [{"ZoneName": "us-east-1a"}]}
+        for i in range(count)
+    ]
+
+
+def test_scan_unused_elb_batches_metric_queries(monkeypatch):
+    """Test usage for every LB on a page is fetched in GetMetricData batches of 500."""
+    lbs_data = [{"LoadBalancers": _albs(1200)}]
+    metrics_map = {f"AWS/ApplicationELB:RequestCount:app/alb-{i}/x{i}": [5.0] for i in range(0, 1200, 2)}
+
+    fake_elbv2 = FakeElbV2Client(lbs_data, {})
+    fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": [
+        {"LoadBalancerName": f"classic-{i}", "AvailabilityZones": ["us-east-1a"]} for i in range(3)
+    ]}])
+    fake_cw = FakeCloudwatchClient(metrics_map)
+
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert fake_cw.batches == [500, 500, 200, 3]
+    assert len(results) == 600 + 3
+    assert "alb-0" not in {r["id"] for r in results}
+
+
+def test_scan_unused_elb_metric_error_not_flagged(monkeypatch):
+    """Test an errored query is not flagged while zero traffic is."""
+    lbs_data = [{"LoadBalancers": _albs(3)}]
+    metrics_map = {"AWS/ApplicationELB:RequestCount:app/alb-1/x1": [0.0, 0.0]}
+
+    fake_elbv2 = FakeElbV2Client(lbs_data, {})
+    fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
+    fake_cw = FakeCloudwatchClient(metrics_map, errors={"app/alb-2/x2"})
+
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert [r["id"] for r in results] == ["alb-0", "alb-1"]
+
+
+def _health(*states):
+    return [{"Target": {"Id": f"i-{n}"}, "TargetHealth": {"State": state}} for n, state in enumerate(states)]
+
+
+def _prefilter_clients(monkeypatch):
+    lbs = _albs(5)
+    arns = [lb["LoadBalancerArn"] for lb in lbs]
+    target_groups = [
+        {"TargetGroupArn": "tg-empty", "LoadBalancerArns": [arns[1]]},
+        {"TargetGroupArn": "tg-unhealthy", "LoadBalancerArns": [arns[2]]},
+        {"TargetGroupArn": "tg-healthy", "LoadBalancerArns": [arns[3]]},
+        {"TargetGroupArn": "tg-draining", "LoadBalancerArns": [arns[3]]},
+    ]
+    target_health = {
+        "tg-unhealthy": _health("unhealthy", "draining"),
+        "tg-healthy": _health("healthy"),
+        "tg-draining": _health("draining"),
+    }
+    fake_elbv2 = FakeElbV2Client(
+        [{"LoadBalancers": lbs}], {}, {arns[0]: []}, target_groups, target_health
+    )
+    fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": [
+        {"LoadBalancerName": "classic-empty", "AvailabilityZones": ["us-east-1a"], "Instances": []},
+        {"LoadBalancerName": "classic-busy", "AvailabilityZones": ["us-east-1a"], "Instances": [{"InstanceId": "i-1"}]},
+    ]}])
+    fake_cw = FakeCloudwatchClient({
+        # All targets unhealthy, but the ALB fails open and keeps serving
+        "AWS/ApplicationELB:RequestCount:app/alb-2/x2": [4.0],
+        "AWS/ApplicationELB:RequestCount:app/alb-3/x3": [10.0],
+        "AWS/ELB:RequestCount:classic-busy": [3.0],
+    })
+
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+    return fake_elbv2, fake_cw
+
+
+def test_prefilter_classifies_structurally_unused_lbs(monkeypatch):
+    """Test LBs without listeners are flagged without metrics, describing only LBs without target groups."""
+    monkeypatch.delenv("ELB_TARGET_HEALTH_PREFILTER", raising=False)
+    fake_elbv2, fake_cw = _prefilter_clients(monkeypatch)
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert {r["id"]: r["unused_reason"] for r in results} == {
+        "alb-0": "no_listeners",
+        "alb-1": "no_traffic",
+        "alb-4": "no_traffic",
+        "classic-empty": "no_instances",
+    }
+    assert sorted(c.split("/")[-2] for c in fake_elbv2.listener_calls) == ["alb-0", "alb-4"]
+    assert fake_elbv2.health_calls == []
+    assert [c["dimension"] for c in fake_cw.calls] == [
+        "app/alb-1/x1", "app/alb-2/x2", "app/alb-3/x3", "app/alb-4/x4", "classic-busy",
+    ]
+
+
+def test_prefilter_target_health_flags_only_lbs_without_targets(monkeypatch):
+    """Test the opt-in health prefilter flags LBs with no registered targets, not unhealthy ones."""
+    monkeypatch.setenv("ELB_TARGET_HEALTH_PREFILTER", "true")
+    fake_elbv2, fake_cw = _prefilter_clients(monkeypatch)
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert {r["id"]: r["unused_reason"] for r in results} == {
+        "alb-0": "no_listeners",
+        "alb-1": "no_registered_targets",
+        "alb-4": "no_traffic",
+        "classic-empty": "no_instances",
+    }
+    assert sorted(fake_elbv2.health_calls) == ["tg-draining", "tg-empty", "tg-healthy", "tg-unhealthy"]
+    assert [c["dimension"] for c in fake_cw.calls] == ["app/alb-2/x2", "app/alb-3/x3", "app/alb-4/x4", "classic-busy"]
+
+
+def test_prefilter_errors_fall_back_to_metrics(monkeypatch):
+    """Test a failed listener lookup leaves the LB to the metric check."""
+    lbs = _albs(2)
+    fake_elbv2 = FakeElbV2Client(
+        [{"LoadBalancers": lbs}], {}, {lbs[0]["LoadBalancerArn"]: RuntimeError("throttled")}
+    )
+    fake_elb = FakeClassicElbClient([{"LoadBalancerDescriptions": []}])
+    fake_cw = FakeCloudwatchClient({"AWS/ApplicationELB:RequestCount:app/alb-0/x0": [1.0]})
+
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: fake_cw)
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert [(r["id"], r["unused_reason"]) for r in results] == [("alb-1", "no_traffic")]
+    assert len(fake_cw.calls) == 2
+
+
+def test_scan_unused_elb_classic_tags_batched(monkeypatch):
+    """Test Classic tags are fetched 20 names per call, with failed chunks left untagged."""
+    names = [f"classic-{i}" for i in range(45)]
+    fake_elbv2 = FakeElbV2Client([{"LoadBalancers": []}])
+    fake_elb = FakeClassicElbClient(
+        [{"LoadBalancerDescriptions": [
+            {"LoadBalancerName": name, "AvailabilityZones": ["us-east-1a"], "Instances": []} for name in names
+        ]}],
+        {name: [{"Key": "env", "Value": "dev"}] for name in names},
+    )
+    describe_tags = fake_elb.describe_tags
+
+    def flaky_describe_tags(LoadBalancerNames=None):
+        if "classic-20" in LoadBalancerNames:
+            raise RuntimeError("throttled")
+        return describe_tags(LoadBalancerNames=LoadBalancerNames)
+
+    fake_elb.describe_tags = flaky_describe_tags
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: FakeCloudwatchClient({}))
+
+    results = {r["id"]: r["tags"] for r in elb_scanner.scan_unused_elb()}
+
+    assert sorted(len(chunk) for chunk in fake_elb.tag_calls) == [5, 20]
+    assert results["classic-0"] == {"env": "dev"} and results["classic-44"] == {"env": "dev"}
+    assert results["classic-20"] == {}
+
+
+def test_scan_unused_elb_classic_tag_call_count(monkeypatch):
+    """Test more than 20 Classic LBs need ceil(n/20) tag calls of at most 20 names each."""
+    names = [f"classic-{i}" for i in range(47)]
+    fake_elbv2 = FakeElbV2Client([{"LoadBalancers": []}])
+    fake_elb = FakeClassicElbClient(
+        [{"LoadBalancerDescriptions": [
+            {"LoadBalancerName": name, "AvailabilityZones": ["us-east-1a"], "Instances": []} for name in names
+        ]}],
+        {name: [{"Key": "env", "Value": "dev"}] for name in names},
+    )
+    monkeypatch.setattr(elb_scanner, "_get_elbv2_client", lambda *args: fake_elbv2)
+    monkeypatch.setattr(elb_scanner, "_get_elb_client", lambda *args: fake_elb)
+    monkeypatch.setattr(elb_scanner, "_get_cloudwatch_client", lambda *args: FakeCloudwatchClient({}))
+
+    results = elb_scanner.scan_unused_elb()
+
+    assert len(fake_elb.tag_calls) == math.ceil(len(names) / 20)
+    assert all(len(chunk) <= 20 for chunk in fake_elb.tag_calls)
+    assert sorted(name for chunk in fake_elb.tag_calls for name in chunk) == sorted(names)
+    assert all(r["tags"] == {"env": "dev"} for r in results)
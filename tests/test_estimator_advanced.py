@@ -1,6 +1,9 @@
+import json
 import pytest
+import threading
 import time
 from cost_engine import estimator
+from utils import metrics
 
 
 class TestDeduplication:
@@ -41,6 +44,23 @@ class TestDeduplication:
         assert len(estimated) == 3
 
 
+    def test_keeps_same_id_in_different_regions(self, monkeypatch):
+        """Test that same-named resources in different regions are kept."""
+        monkeypatch.setenv("PRICING_MODE", "static")
+        estimator._PRICE_CACHE.clear()
+
+        resources = [
+            {"type": "ELB", "id": "my-lb", "region": "us-east-1"},
+            {"type": "ELB", "id": "my-lb", "region": "eu-west-1"},
+            {"type": "ELB", "id": "my-lb", "region": "eu-west-1"},  # Duplicate
+        ]
+
+        estimated, total = estimator.estimate_monthly_waste(resources)
+
+        assert len(estimated) == 2
+        assert {r["region"] for r in estimated} == {"us-east-1", "eu-west-1"}
+
+
 class TestNoMutation:
     """Test that estimator doesn't mutate input."""
 
@@ -140,6 +160,209 @@ class TestCacheTTL:
         assert len(estimator._PRICE_CACHE) <= estimator.MAX_CACHE_SIZE
 
 
+class TestPersistentCache:
+    """Test the persistent pricing cache tier."""
+
+    class FakePricingClient:
+        def __init__(self, price):
+            self.price = price
+            self.calls = 0
+
+        def get_products(self, **kwargs):
+            self.calls += 1
+            item = {"terms": {"OnDemand": {"o": {"priceDimensions": {"d": {"pricePerUnit": {"USD": str(self.price)}}}}}}}
+            return {"PriceList": [json.dumps(item)]}
+
+    @pytest.fixture(autouse=True)
+    def _live(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("PRICING_MODE", "live")
+        monkeypatch.setenv("PRICE_CACHE_LOCATION", str(tmp_path))
+        monkeypatch.setattr(estimator, "CACHE_TTL", 3600)
+        monkeypatch.setattr(estimator, "MAX_CACHE_SIZE", 1000)
+        estimator._PRICE_CACHE.clear()
+
+    def _seed(self, tmp_path, entries):
+        path = tmp_path / "pricing" / "price_cache.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"version": 1, "entries": entries}), encoding="utf-8")
+
+    def test_cold_start_served_from_persistent_tier(self, monkeypatch, tmp_path):
+        """Test entries persisted by a previous run avoid Pricing API calls."""
+        self._seed(tmp_path, [{"key": ["EC2", "t3.micro", "us-east-1"], "price": 0.01, "timestamp": time.time()}])
+        fake = self.FakePricingClient(99)
+        monkeypatch.setattr(estimator, "_get_pricing_client", lambda *args: fake)
+
+        estimated, total = estimator.estimate_monthly_waste(
+            [{"type": "EC2", "id": "i-1", "instance_type": "t3.micro", "region": "us-east-1"}]
+        )
+
+        assert fake.calls == 0
+        assert estimated[0]["monthly_cost"] == 7.3
+        assert estimator.get_cache_stats() == {"hits": 1, "misses": 0, "stored": 0}
+
+    def test_expired_entries_ignored(self, monkeypatch, tmp_path):
+        """Test the TTL applies to persisted entries."""
+        self._seed(tmp_path, [{"key": ["EC2", "t3.micro", "us-east-1"], "price": 0.01, "timestamp": time.time() - 7200}])
+        fake = self.FakePricingClient(0.02)
+        monkeypatch.setattr(estimator, "_get_pricing_client", lambda *args: fake)
+
+        estimated, total = estimator.estimate_monthly_waste(
+            [{"type": "EC2", "id": "i-1", "instance_type": "t3.micro", "region": "us-east-1"}]
+        )
+
+        assert fake.calls == 1
+        assert estimated[0]["monthly_cost"] == 14.6
+
+    def test_write_back_once_at_end(self, monkeypatch, tmp_path):
+        """Test new lookups are written back in one object at the end of the run."""
+        fake = self.FakePricingClient(0.02)
+        monkeypatch.setattr(estimator, "_get_pricing_client", lambda *args: fake)
+        writes = []
+        original_save = estimator.save_price_cache
+        monkeypatch.setattr(estimator, "save_price_cache", lambda: writes.append(1) or original_save())
+
+        estimator.estimate_monthly_waste([
+            {"type": "EC2", "id": "i-1", "instance_type": "t3.micro", "region": "us-east-1"},
+            {"type": "EC2", "id": "i-2", "instance_type": "t3.micro", "region": "us-east-1"},
+            {"type": "EC2", "id": "i-3", "instance_type": "t3.small", "region": "us-east-1"},
+        ])
+
+        assert writes == [1]
+        # The two t3.micro resources are coalesced into one lookup by prefetch
+        assert estimator.get_cache_stats() == {"hits": 0, "misses": 2, "stored": 2}
+        saved = json.loads((tmp_path / "pricing" / "price_cache.json").read_text(encoding="utf-8"))
+        assert sorted(e["key"][1] for e in saved["entries"]) == ["t3.micro", "t3.small"]
+
+    def test_no_location_is_memory_only(self, monkeypatch, tmp_path):
+        """Test nothing is persisted without PRICE_CACHE_LOCATION."""
+        monkeypatch.delenv("PRICE_CACHE_LOCATION")
+        monkeypatch.setattr(estimator, "_get_pricing_client", lambda *args: self.FakePricingClient(0.02))
+
+        estimator.estimate_monthly_waste(
+            [{"type": "EC2", "id": "i-1", "instance_type": "t3.micro", "region": "us-east-1"}]
+        )
+
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestPricePrefetch:
+    """Test concurrent bulk price prefetch."""
+
+    @pytest.fixture(autouse=True)
+    def _live(self, monkeypatch):
+        monkeypatch.setenv("PRICING_MODE", "live")
+        monkeypatch.delenv("PRICE_CACHE_LOCATION", raising=False)
+        estimator._PRICE_CACHE.clear()
+
+    def test_each_key_fetched_once(self, monkeypatch):
+        """Test resources sharing a key trigger a single lookup."""
+        calls = []
+
+        def fake_ec2_price(instance_type, region):
+            calls.append((instance_type, region))
+            return 0.01
+
+        monkeypatch.setattr(estimator, "_get_ec2_hourly_price", fake_ec2_price)
+        resources = [
+            {"type": "EC2", "id": f"i-{n}", "instance_type": "t3.micro", "region": "us-east-1"}
+            for n in range(50)
+        ]
+
+        estimated, total = estimator.estimate_monthly_waste(resources)
+
+        assert calls == [("t3.micro", "us-east-1")]
+        assert total == round(50 * 0.01 * estimator.HOURS_PER_MONTH, 2)
+
+    def test_keys_resolved_concurrently(self, monkeypatch):
+        """Test distinct keys are fetched in parallel."""
+        monkeypatch.setenv("PRICING_CONCURRENCY", "3")
+        barrier = threading.Barrier(3, timeout=5)
+
+        def fake_ebs_price(volume_type, region):
+            barrier.wait()
+            return 0.08
+
+        monkeypatch.setattr(estimator, "_get_ebs_gb_month_price", fake_ebs_price)
+        resources = [
+            {"type": "EBS", "id": f"vol-{t}", "size_gb": 10, "volume_type": t, "region": "us-east-1"}
+            for t in ("gp2", "gp3", "io1")
+        ]
+
+        prices = estimator.prefetch_prices(resources)
+
+        assert prices == {("EBS", t, "us-east-1"): 0.08 for t in ("gp2", "gp3", "io1")}
+
+    def test_prefetch_reports_time_and_key_count_separately(self, monkeypatch):
+        """Test prefetch gets its own stage, with the unique key count as its items."""
+        monkeypatch.setattr(estimator, "_get_ec2_hourly_price", lambda instance_type, region: 0.01)
+        run = metrics.start_run()
+        resources = [
+            {"type": "EC2", "id": f"i-{n}", "instance_type": t, "region": "us-east-1"}
+            for n, t in enumerate(["t3.micro", "t3.micro", "t3.small"])
+        ]
+
+        estimator.prefetch_prices(resources)
+
+        prefetch = run.as_dict()["stages"]["price_prefetch"]
+        assert prefetch["items"] == 2
+        assert prefetch["duration"] >= 0
+
+    def test_failed_prefetch_falls_back_to_static(self, monkeypatch):
+        """Test a failed lookup uses static pricing in the estimation loop."""
+        def failing_price(region):
+            raise RuntimeError("throttled")
+
+        monkeypatch.setattr(estimator, "_get_alb_hourly_price", failing_price)
+
+        estimated, total = estimator.estimate_monthly_waste(
+            [{"type": "ELB", "id": "lb-1", "region": "us-east-1"}]
+        )
+
+        assert estimated[0]["monthly_cost"] == estimator.DEFAULT_PRICING["ELB"]
+
+    def test_static_mode_skips_prefetch(self, monkeypatch):
+        """Test no lookups happen in static mode."""
+        monkeypatch.setenv("PRICING_MODE", "static")
+        monkeypatch.setattr(estimator, "prefetch_prices", lambda resources: pytest.fail("prefetched"))
+
+        estimator.estimate_monthly_waste([{"type": "EBS", "id": "vol-1", "size_gb": 1}])
+
+
+class TestStreamingEstimation:
+    """Test the generator-based estimation stage."""
+
+    @pytest.fixture(autouse=True)
+    def _live(self, monkeypatch):
+        monkeypatch.setenv("PRICING_MODE", "live")
+        monkeypatch.delenv("PRICE_CACHE_LOCATION", raising=False)
+        monkeypatch.setattr(estimator, "CACHE_TTL", 3600)
+        monkeypatch.setattr(estimator, "MAX_CACHE_SIZE", 1000)
+        estimator._PRICE_CACHE.clear()
+
+    def test_matches_list_estimation(self, monkeypatch):
+        """Test streaming yields the same annotations and total as estimate_monthly_waste."""
+        calls = []
+
+        def fake_ebs_price(volume_type, region):
+            calls.append((volume_type, region))
+            return 0.0813
+
+        monkeypatch.setattr(estimator, "_get_ebs_gb_month_price", fake_ebs_price)
+        resources = [
+            {"type": "EBS", "id": f"vol-{n}", "size_gb": n + 3, "volume_type": "gp3", "region": "us-east-1"}
+            for n in range(20)
+        ] + [{"type": "EBS", "id": "vol-0", "size_gb": 3, "volume_type": "gp3", "region": "us-east-1"}]
+
+        totals = {}
+        streamed = list(estimator.iter_monthly_waste(iter(resources), totals))
+        estimated, total = estimator.estimate_monthly_waste(resources)
+
+        assert streamed == estimated
+        assert totals == {"resources": 20, "total": total}
+        # Each run prices the shared key exactly once
+        assert calls == [("gp3", "us-east-1")] * 2
+
+
 class TestFailedLookups:
     """Test handling of failed pricing lookups."""
 
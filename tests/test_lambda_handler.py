@@ -1,3 +1,6 @@
+import threading
+import time
+
 import lambda_handler
 
 
@@ -41,3 +44,286 @@ def test_handler_partial_on_delivery_error(monkeypatch):
 
     assert result["status"] == "partial"
     assert result["delivery_errors"] == 1
+
+
+def _patch_delivery(monkeypatch):
+    monkeypatch.setattr(lambda_handler, "send_report", lambda report: None)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+
+
+def test_handler_runs_scanners_concurrently(monkeypatch):
+    barrier = threading.Barrier(4, timeout=5)
+
+    def make_scan(rid):
+        def scan():
+            # Every scanner blocks until all four are running at once
+            barrier.wait()
+            return [{"type": "EBS", "id": rid, "size_gb": 1, "az": "us-east-1a", "tags": {}}]
+        return scan
+
+    monkeypatch.setattr(lambda_handler, "scan_unattached_ebs", make_scan("vol-1"))
+    monkeypatch.setattr(lambda_handler, "scan_idle_ec2", make_scan("vol-2"))
+    monkeypatch.setattr(lambda_handler, "scan_unused_elb", make_scan("vol-3"))
+    monkeypatch.setattr(lambda_handler, "scan_stopped_rds", make_scan("vol-4"))
+    _patch_delivery(monkeypatch)
+    monkeypatch.setenv("SCAN_CONCURRENCY", "4")
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    result = lambda_handler.handler({}, {})
+
+    assert result["status"] == "ok"
+    assert result["resources"] == 4
+    assert set(result["scan_durations"]) == set(lambda_handler.SCANNERS)
+
+
+def test_run_scanners_preserves_order_and_isolates_errors(monkeypatch):
+    def slow_scan():
+        time.sleep(0.05)
+        return [{"id": "first"}]
+
+    def bad_scan():
+        raise RuntimeError("boom")
+
+    monkeypatch.setenv("SCAN_CONCURRENCY", "3")
+    errors = []
+    durations = {}
+
+    resources = lambda_handler._run_scanners(
+        [("slow", slow_scan), ("bad", bad_scan), ("fast", lambda: [{"id": "last"}])],
+        errors,
+        durations,
+    )
+
+    assert [r["id"] for r in resources] == ["first", "last"]
+    assert errors == [{"stage": "bad", "error": "boom", "type": "RuntimeError"}]
+    assert set(durations) == {"slow", "bad", "fast"}
+    assert durations["slow"] >= 0.05
+
+
+def test_scan_concurrency_env_validation(monkeypatch):
+    monkeypatch.setenv("SCAN_CONCURRENCY", "0")
+    assert lambda_handler._get_scan_concurrency() == lambda_handler.DEFAULT_SCAN_CONCURRENCY
+
+    monkeypatch.setenv("SCAN_CONCURRENCY", "many")
+    assert lambda_handler._get_scan_concurrency() == lambda_handler.DEFAULT_SCAN_CONCURRENCY
+
+    monkeypatch.setenv("SCAN_CONCURRENCY", "1")
+    assert lambda_handler._get_scan_concurrency() == 1
+
+
+def test_handler_fans_out_across_regions(monkeypatch):
+    calls = []
+
+    def elb_scan(region=None):
+        calls.append(region)
+        # Same LB name in every region; no AZ so region must come from the scan
+        return [{"type": "ELB", "id": "shared-name", "az": "", "region": None, "tags": {}}]
+
+    def empty_scan(region=None):
+        return []
+
+    monkeypatch.setattr(lambda_handler, "scan_unattached_ebs", empty_scan)
+    monkeypatch.setattr(lambda_handler, "scan_idle_ec2", empty_scan)
+    monkeypatch.setattr(lambda_handler, "scan_unused_elb", elb_scan)
+    monkeypatch.setattr(lambda_handler, "scan_stopped_rds", empty_scan)
+    _patch_delivery(monkeypatch)
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    result = lambda_handler.handler({"regions": ["us-east-1", "eu-west-1"]}, {})
+
+    assert sorted(calls) == ["eu-west-1", "us-east-1"]
+    assert result["status"] == "ok"
+    assert result["resources"] == 2
+    assert result["monthly_waste"] == 36.0
+    assert "scan_unused_elb[eu-west-1]" in result["scan_durations"]
+
+
+def test_scan_regions_discovery(monkeypatch):
+    monkeypatch.setenv("SCAN_REGIONS", "all")
+    monkeypatch.setattr(lambda_handler, "_discover_regions", lambda: ["eu-west-1", "us-east-1"])
+    errors = []
+
+    assert lambda_handler._get_scan_regions({}, errors) == ["eu-west-1", "us-east-1"]
+    assert errors == []
+
+
+def test_scan_regions_discovery_failure_falls_back(monkeypatch):
+    def fail():
+        raise RuntimeError("denied")
+
+    monkeypatch.setenv("SCAN_REGIONS", "all")
+    monkeypatch.setattr(lambda_handler, "_discover_regions", fail)
+    errors = []
+
+    assert lambda_handler._get_scan_regions({}, errors) is None
+    assert errors[0]["stage"] == "discover_regions"
+
+
+def test_scan_regions_from_env(monkeypatch):
+    monkeypatch.setenv("SCAN_REGIONS", "us-east-1, us-west-2,us-east-1")
+    assert lambda_handler._get_scan_regions({}, []) == ["us-east-1", "us-west-2"]
+
+    monkeypatch.delenv("SCAN_REGIONS")
+    assert lambda_handler._get_scan_regions({}, []) is None
+
+
+def test_handler_schedules_account_region_work_items(monkeypatch):
+    assumed = []
+    calls = []
+
+    def fake_assume(account_id, role_name):
+        assumed.append((account_id, role_name))
+        if account_id == "333333333333":
+            raise RuntimeError("AccessDenied")
+        return {"aws_access_key_id": f"key-{account_id}"}
+
+    def ebs_scan(region=None, credentials=None):
+        calls.append((credentials["aws_access_key_id"], region))
+        return [{"type": "EBS", "id": "vol-1", "size_gb": 1, "az": "", "tags": {}}]
+
+    def empty_scan(region=None, credentials=None):
+        return []
+
+    monkeypatch.setattr(lambda_handler, "assume_role_credentials", fake_assume)
+    monkeypatch.setattr(lambda_handler, "scan_unattached_ebs", ebs_scan)
+    monkeypatch.setattr(lambda_handler, "scan_idle_ec2", empty_scan)
+    monkeypatch.setattr(lambda_handler, "scan_unused_elb", empty_scan)
+    monkeypatch.setattr(lambda_handler, "scan_stopped_rds", empty_scan)
+    _patch_delivery(monkeypatch)
+    monkeypatch.setenv("PRICING_MODE", "static")
+
+    event = {
+        "accounts": ["111111111111", "222222222222", "333333333333"],
+        "role_name": "Scan",
+        "regions": ["us-east-1", "eu-west-1"],
+    }
+    result = lambda_handler.handler(event, {})
+
+    # Same volume id in two accounts x two regions is four distinct resources
+    assert sorted(calls) == [
+        ("key-111111111111", "eu-west-1"), ("key-111111111111", "us-east-1"),
+        ("key-222222222222", "eu-west-1"), ("key-222222222222", "us-east-1"),
+    ]
+    assert result["resources"] == 4
+    assert result["status"] == "partial"
+    # Every work item for the failing account is isolated and reported
+    assert result["scan_errors"] == 8
+    assert {role for _, role in assumed} == {"Scan"}
+
+
+def test_work_items_tag_account(monkeypatch):
+    monkeypatch.setattr(lambda_handler, "assume_role_credentials", lambda a, r: {"aws_access_key_id": a})
+    scan = lambda_handler._bind_work_item(
+        lambda region=None, credentials=None: [{"id": "x", "region": "us-west-2"}],
+        region="us-east-1",
+        account_id="111111111111",
+        role_name="Scan",
+    )
+
+    assert scan() == [{"id": "x", "region": "us-west-2", "account_id": "111111111111"}]
+
+
+def test_scan_accounts_from_env(monkeypatch):
+    monkeypatch.setenv("SCAN_ACCOUNTS", "111111111111, 222222222222")
+    monkeypatch.delenv("SCAN_ROLE_NAME", raising=False)
+
+    accounts, role_name = lambda_handler._get_scan_accounts({})
+
+    assert accounts == ["111111111111", "222222222222"]
+    assert role_name == lambda_handler.DEFAULT_SCAN_ROLE_NAME
+
+    monkeypatch.delenv("SCAN_ACCOUNTS")
+    assert lambda_handler._get_scan_accounts({}) == (None, None)
+
+
+def _pipeline_fixture():
+    return {
+        "scan_unattached_ebs": [
+            {"type": "EBS", "id": f"vol-{n}", "size_gb": n + 1, "az": "us-east-1a", "region": "us-east-1",
+             "tags": {"owner": "a"} if n % 2 else {}}
+            for n in range(50)
+        ],
+        "scan_idle_ec2": [
+            {"type": "EC2", "id": "i-1", "avg_cpu": 1.5, "instance_type": "t3.small", "az": "us-east-1b",
+             "region": "us-east-1", "tags": {"owner": "a", "env": "dev", "cost-center": "1"}},
+        ],
+        # Duplicate of the first volume is dropped by both pipelines
+        "scan_unused_elb": [
+            {"type": "EBS", "id": "vol-0", "size_gb": 1, "az": "us-east-1a", "region": "us-east-1", "tags": {}},
+            {"type": "ELB", "id": "lb-1", "lb_type": "ALB", "az": "us-east-1a", "region": "us-east-1", "tags": {}},
+        ],
+        "scan_stopped_rds": [
+            {"type": "RDS_INSTANCE", "id": "db-1", "az": "us-east-1a", "region": "us-east-1", "tags": {}},
+        ],
+    }
+
+
+def _run_pipeline(monkeypatch, mode, fail=None):
+    fixture = _pipeline_fixture()
+    delivered = {}
+
+    for name, records in fixture.items():
+        def scan(records=records, name=name):
+            if name == fail:
+                raise RuntimeError("boom")
+            return list(records)
+
+        def stream(records=records, name=name):
+            if name == fail:
+                raise RuntimeError("boom")
+            yield from records
+
+        monkeypatch.setattr(lambda_handler, name, scan)
+        monkeypatch.setattr(lambda_handler, name.replace("scan_", "iter_", 1), stream)
+
+    def archive(report):
+        delivered["archive"] = report if isinstance(report, str) else report.read().decode("utf-8")
+
+    monkeypatch.setattr(lambda_handler, "send_report", lambda report: delivered.update(sns=report))
+    monkeypatch.setattr(lambda_handler, "archive_report", archive)
+    monkeypatch.setenv("PRICING_MODE", "static")
+    monkeypatch.setenv("PIPELINE_MODE", mode)
+
+    result = lambda_handler.handler({}, {})
+    result.pop("scan_durations")
+    stages = result.pop("metrics")["stages"]
+    delivered["items"] = {name: values["items"] for name, values in stages.items()}
+    return result, delivered
+
+
+def test_streaming_pipeline_matches_list_pipeline(monkeypatch):
+    list_result, list_delivered = _run_pipeline(monkeypatch, "list")
+    stream_result, stream_delivered = _run_pipeline(monkeypatch, "streaming")
+
+    assert stream_result == list_result
+    assert stream_result["resources"] == 54
+    assert stream_delivered["sns"] == list_delivered["sns"]
+    assert stream_delivered["archive"] == list_delivered["archive"]
+    assert "**Tag Violations:** 52" in stream_delivered["archive"]
+    assert stream_delivered["items"] == list_delivered["items"]
+    assert stream_delivered["items"]["tag_compliance"] == 52
+
+
+def test_streaming_pipeline_isolates_scanner_errors(monkeypatch):
+    list_result, list_delivered = _run_pipeline(monkeypatch, "list", fail="scan_idle_ec2")
+    stream_result, stream_delivered = _run_pipeline(monkeypatch, "streaming", fail="scan_idle_ec2")
+
+    assert stream_result == list_result
+    assert stream_result["status"] == "partial"
+    assert stream_delivered["archive"] == list_delivered["archive"]
+
+
+def test_streaming_work_items_bounded_queue(monkeypatch):
+    monkeypatch.setattr(lambda_handler, "STREAM_QUEUE_SIZE", 2)
+    monkeypatch.setenv("SCAN_CONCURRENCY", "2")
+    scanners = [
+        (f"scan{n}", lambda n=n: ({"id": f"{n}-{i}"} for i in range(25)))
+        for n in range(3)
+    ]
+    counts = {"resources": 0}
+
+    records = list(lambda_handler._stream_work_items(scanners, [], {}, counts))
+
+    # Items drain in work-item order even though producers block on full queues
+    assert [r["id"] for r in records] == [f"{n}-{i}" for n in range(3) for i in range(25)]
+    assert counts["resources"] == 75
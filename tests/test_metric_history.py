@@ -0,0 +1,158 @@
+import math
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import scanner.ec2_scanner as ec2_scanner
+from utils.metric_history import DailyHistory, percentile, to_days
+from utils.storage import LocalStore
+
+
+class TestDailyHistory:
+    """Test the columnar daily history format."""
+
+    def test_round_trip_keeps_nan(self):
+        """Test series survive serialisation, with NaN for days without datapoints."""
+        history = DailyHistory(date(2026, 10, 1), 3)
+        history.set("i-1", [1.5, float("nan"), 3.0])
+        history.set("i-2", [0.0, 0.25, 80.0])
+
+        loaded = DailyHistory.from_bytes(history.to_bytes())
+
+        assert (loaded.first, loaded.days, len(loaded)) == (date(2026, 10, 1), 3, 2)
+        assert loaded.values("i-2", date(2026, 10, 1), date(2026, 10, 3)) == [0.0, 0.25, 80.0]
+        first, gap, last = loaded.values("i-1", date(2026, 10, 1), date(2026, 10, 3))
+        assert (first, last) == (1.5, 3.0) and math.isnan(gap)
+
+    def test_missing_ranges(self):
+        """Test only the days outside the stored range are reported missing."""
+        history = DailyHistory(date(2026, 10, 5), 7)  # 5th..11th
+
+        assert history.missing_ranges(date(2026, 10, 6), date(2026, 10, 12)) == [(date(2026, 10, 12), date(2026, 10, 12))]
+        assert history.missing_ranges(date(2026, 9, 13), date(2026, 10, 11)) == [(date(2026, 9, 13), date(2026, 10, 4))]
+        assert history.missing_ranges(date(2026, 10, 20), date(2026, 10, 26)) == [(date(2026, 10, 20), date(2026, 10, 26))]
+        assert DailyHistory().missing_ranges(date(2026, 10, 1), date(2026, 10, 7)) == [(date(2026, 10, 1), date(2026, 10, 7))]
+
+    def test_unreadable_history_starts_empty(self, tmp_path):
+        """Test a corrupt object is discarded rather than failing the scan."""
+        store = LocalStore(str(tmp_path))
+        store.put("history/x.f32.gz", b"not gzip")
+
+        assert len(DailyHistory.load(store, "history/x.f32.gz")) == 0
+
+    def test_to_days_places_points(self):
+        """Test datapoints land on their UTC day and out-of-range points are dropped."""
+        first = date(2026, 10, 1)
+        points = [
+            (datetime(2026, 10, 2, tzinfo=timezone.utc), 4.0),
+            (datetime(2026, 9, 30, tzinfo=timezone.utc), 9.0),
+        ]
+
+        days = to_days(points, first, 2)
+
+        assert math.isnan(days[0]) and days[1] == 4.0
+
+
+class FakeEC2Client:
+    def __init__(self, instance_ids):
+        self.instance_ids = instance_ids
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Filters=None):
+        return [{"Reservations": [{"OwnerId": "111111111111", "Instances": [
+            {"InstanceId": iid, "InstanceType": "t3.micro", "Placement": {"AvailabilityZone": "us-east-1a"}}
+            for iid in self.instance_ids
+        ]}]}]
+
+
+class FakeCloudwatchClient:
+    """Serve a constant daily CPU per instance for every day in the requested range."""
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.requests = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime):
+        days = (EndTime - StartTime).days
+        self.requests.append((StartTime.date(), days, len(MetricDataQueries)))
+        results = []
+        for query in MetricDataQueries:
+            iid = query["MetricStat"]["Metric"]["Dimensions"][0]["Value"]
+            stamps = [StartTime + timedelta(days=n) for n in range(days)]
+            results.append({"Id": query["Id"], "Timestamps": stamps, "Values": [self.cpu[iid]] * days,
+                            "StatusCode": "Complete"})
+        return {"MetricDataResults": results}
+
+
+@pytest.fixture
+def scan(monkeypatch, tmp_path):
+    monkeypatch.setenv("METRIC_HISTORY_LOCATION", str(tmp_path))
+    monkeypatch.setenv("CPU_THRESHOLD", "2")
+    ec2_scanner.CPU_THRESHOLD = None
+
+    def run(today, instance_ids, cloudwatch):
+        class Today(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime(today.year, today.month, today.day, 9, 30, tzinfo=timezone.utc)
+
+        monkeypatch.setattr(ec2_scanner, "datetime", Today)
+        monkeypatch.setattr(ec2_scanner, "_get_ec2_client", lambda *args: FakeEC2Client(instance_ids))
+        monkeypatch.setattr(ec2_scanner, "_get_cloudwatch_client", lambda *args: cloudwatch)
+        return ec2_scanner.scan_idle_ec2("us-east-1")
+
+    return run
+
+
+def test_scan_fetches_only_new_days(scan, tmp_path):
+    """Test a second run queries only the day since the last stored point, for known instances."""
+    cloudwatch = FakeCloudwatchClient({"i-idle": 1.0, "i-busy": 50.0, "i-new": 0.5})
+
+    first = scan(date(2026, 10, 10), ["i-idle", "i-busy"], cloudwatch)
+    second = scan(date(2026, 10, 11), ["i-idle", "i-busy", "i-new"], cloudwatch)
+
+    assert [r["id"] for r in first] == ["i-idle"]
+    assert [r["id"] for r in second] == ["i-idle", "i-new"]
+    assert cloudwatch.requests == [
+        (date(2026, 10, 3), 7, 2),  # full window for both instances
+        (date(2026, 10, 10), 1, 2),  # one new day for the known instances
+        (date(2026, 10, 4), 7, 1),  # full window for the new instance
+    ]
+    assert (tmp_path / "history" / "ec2-cpu" / "111111111111" / "us-east-1.f32.gz").exists()
+
+
+def test_longer_lookback_backfills_once(scan, monkeypatch):
+    """Test widening the window queries the older days once, then nothing more that day."""
+    cloudwatch = FakeCloudwatchClient({"i-idle": 1.0})
+    scan(date(2026, 10, 10), ["i-idle"], cloudwatch)
+
+    monkeypatch.setenv("CPU_LOOKBACK_DAYS", "30")
+    scan(date(2026, 10, 10), ["i-idle"], cloudwatch)
+    results = scan(date(2026, 10, 10), ["i-idle"], cloudwatch)
+
+    assert cloudwatch.requests[1:] == [(date(2026, 9, 10), 23, 1)]
+    assert results[0]["avg_cpu"] == 1.0
+
+
+def test_scan_stores_each_idle_metric(scan, monkeypatch, tmp_path):
+    """Test every scored metric gets its own history and is fetched in the same pass."""
+    monkeypatch.setenv("IDLE_METRICS", "network_in")
+    cloudwatch = FakeCloudwatchClient({"i-idle": 1.0})
+
+    scan(date(2026, 10, 10), ["i-idle"], cloudwatch)
+    scan(date(2026, 10, 11), ["i-idle"], cloudwatch)
+
+    assert cloudwatch.requests == [(date(2026, 10, 3), 7, 2), (date(2026, 10, 10), 1, 2)]
+    assert (tmp_path / "history" / "ec2-network_in" / "111111111111" / "us-east-1.f32.gz").exists()
+
+
+def test_percentile_interpolates_between_ranks():
+    """Test percentile matches linear interpolation between sorted values."""
+    ordered = [1.0, 2.0, 3.0, 4.0]
+
+    assert percentile(ordered, 0) == 1.0
+    assert percentile(ordered, 50) == 2.5
+    assert percentile(ordered, 100) == 4.0
+    assert percentile([], 95) is None
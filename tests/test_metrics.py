@@ -0,0 +1,127 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import lambda_handler
+from utils import metrics
+
+
+@pytest.fixture
+def run():
+    return metrics.start_run()
+
+
+class TestStages:
+    """Test stage timing and attribution."""
+
+    def test_stage_records_duration_and_items(self, run):
+        """Test a stage accumulates time and items across entries."""
+        with metrics.stage("scan") as record:
+            time.sleep(0.01)
+            record.add_items(3)
+        with metrics.stage("scan") as record:
+            record.add_items(2)
+
+        stage = run.as_dict()["stages"]["scan"]
+        assert stage["items"] == 5
+        assert stage["duration"] >= 0.01
+
+    def test_nested_stage_time_is_exclusive(self, run):
+        """Test time spent in an upstream stage is not charged to the consumer."""
+        def upstream():
+            for n in range(3):
+                time.sleep(0.02)
+                yield n
+
+        with metrics.stage("consumer"):
+            consumed = list(metrics.stage_iter("producer", upstream()))
+
+        stages = run.as_dict()["stages"]
+        assert consumed == [0, 1, 2]
+        assert stages["producer"]["items"] == 3
+        assert stages["producer"]["duration"] >= 0.06
+        assert stages["consumer"]["duration"] < 0.03
+
+    def test_api_calls_and_retries_counted(self, run):
+        """Test instrumented clients count calls and retry attempts per stage."""
+        client = metrics.instrument_client(boto3.client(
+            "sns", region_name="us-east-1", aws_access_key_id="testing", aws_secret_access_key="testing",
+        ))
+        stubber = Stubber(client)
+        stubber.add_response("publish", {"MessageId": "1", "ResponseMetadata": {"RetryAttempts": 2}})
+        stubber.add_response("publish", {"MessageId": "2"})
+        stubber.add_response("publish", {"MessageId": "3"})
+
+        with stubber:
+            with metrics.stage("send_report"):
+                client.publish(TopicArn="arn:aws:sns:us-east-1:123:t", Message="a")
+                client.publish(TopicArn="arn:aws:sns:us-east-1:123:t", Message="b")
+            # Calls outside any stage are not attributed
+            client.publish(TopicArn="arn:aws:sns:us-east-1:123:t", Message="c")
+
+        summary = run.as_dict()
+        assert summary["stages"]["send_report"]["api_calls"] == 2
+        assert summary["stages"]["send_report"]["retries"] == 2
+        assert summary["api_calls"] == 2
+
+    def test_propagate_to_worker_threads(self, run):
+        """Test pool workers inherit the submitting stage."""
+        def work(_):
+            metrics._CURRENT_STAGE.get().add_items()
+
+        with metrics.stage("cost_estimation"):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(metrics.propagate(work), range(8)))
+
+        assert run.as_dict()["stages"]["cost_estimation"]["items"] == 8
+
+
+class TestEmf:
+    """Test Embedded Metric Format output."""
+
+    def test_work_items_roll_up_per_stage(self):
+        """Test per-region work items are summed under their scanner name."""
+        summary = {
+            "duration": 1.5,
+            "api_calls": 5,
+            "retries": 1,
+            "stages": {
+                "scan_idle_ec2[us-east-1]": {"duration": 0.5, "items": 2, "api_calls": 3, "retries": 1},
+                "scan_idle_ec2[eu-west-1]": {"duration": 0.25, "items": 1, "api_calls": 2, "retries": 0},
+            },
+        }
+
+        doc = metrics.build_emf(summary, namespace="Test")
+
+        directive = doc["_aws"]["CloudWatchMetrics"][0]
+        assert directive["Namespace"] == "Test"
+        assert doc["scan_idle_ec2.Duration"] == 750.0
+        assert doc["scan_idle_ec2.Items"] == 3
+        assert doc["scan_idle_ec2.ApiCalls"] == 5
+        assert doc["RunDuration"] == 1500.0
+        # Every declared metric has a value in the document
+        assert all(m["Name"] in doc for m in directive["Metrics"])
+
+    def test_handler_emits_one_emf_line(self, monkeypatch, capsys):
+        """Test the handler prints one EMF document matching its return value."""
+        for name in lambda_handler.SCANNERS:
+            monkeypatch.setattr(lambda_handler, name, lambda: [])
+        monkeypatch.setattr(lambda_handler, "send_report", lambda report: None)
+        monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+        monkeypatch.setenv("PRICING_MODE", "static")
+
+        result = lambda_handler.handler({}, {})
+
+        lines = [line for line in capsys.readouterr().out.splitlines() if '"_aws"' in line]
+        assert len(lines) == 1
+        doc = json.loads(lines[0])
+        stages = result["metrics"]["stages"]
+        assert set(stages) == set(lambda_handler.SCANNERS) | {
+            "cost_estimation", "tag_compliance", "build_report", "send_report", "archive_report",
+        }
+        assert doc["send_report.Items"] == stages["send_report"]["items"] == 1
+        assert doc["RunDuration"] == round(result["metrics"]["duration"] * 1000, 1)
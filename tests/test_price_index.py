@@ -0,0 +1,166 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from cost_engine import estimator
+from cost_engine import price_index
+
+
+def _product(family, **attributes):
+    return {"productFamily": family, "attributes": attributes}
+
+
+def _on_demand(*dimensions):
+    return {
+        "OFFER.TERM": {
+            "priceDimensions": {
+                f"RATE.{n}": {"unit": unit, "beginRange": begin, "pricePerUnit": {"USD": usd}}
+                for n, (unit, begin, usd) in enumerate(dimensions)
+            }
+        }
+    }
+
+
+EC2_LINUX = dict(
+    instanceType="t3.micro", regionCode="us-east-1", operatingSystem="Linux", tenancy="Shared",
+    preInstalledSw="NA", capacitystatus="Used", licenseModel="No License required",
+    operation="RunInstances",
+)
+
+EC2_OFFER = {
+    "formatVersion": "v1.0",
+    "offerCode": "AmazonEC2",
+    "products": {
+        "SKU1": _product("Compute Instance", **EC2_LINUX),
+        "SKU2": _product("Compute Instance", **{**EC2_LINUX, "operatingSystem": "Windows"}),
+        "SKU3": _product("Storage", volumeApiName="gp3", location="EU (Ireland)"),
+        "SKU4": _product("Storage", volumeApiName="st1", regionCode="us-east-1"),
+    },
+    "terms": {
+        "OnDemand": {
+            "SKU1": _on_demand(("Hrs", "0", "0.0104")),
+            "SKU2": _on_demand(("Hrs", "0", "0.0196")),
+            "SKU3": _on_demand(("GB-Mo", "0", "0.0880")),
+            # Tiered pricing: only the first tier is indexed
+            "SKU4": _on_demand(("GB-Mo", "1024", "0.0300"), ("GB-Mo", "0", "0.0450")),
+        },
+        "Reserved": {
+            "SKU1": {"RES.TERM": {"priceDimensions": {"R": {"unit": "Hrs", "beginRange": "0", "pricePerUnit": {"USD": "0.0060"}}}}},
+        },
+    },
+}
+
+ELB_CSV = "\n".join([
+    '"FormatVersion","v1.0"',
+    '"Disclaimer","This pricing list is for informational purposes only."',
+    '"Publication Date","2024-01-01T00:00:00Z"',
+    '"Version","20240101000000"',
+    '"OfferCode","AWSELB"',
+    '"SKU","OfferTermCode","RateCode","TermType","PriceDescription","EffectiveDate","StartingRange",'
+    '"EndingRange","Unit","PricePerUnit","Currency","Product Family","serviceCode","Location",'
+    '"Location Type","usageType","operation","Region Code"',
+    '"ALB1","JRTCKXETXF","ALB1.1","OnDemand","per ALB-hour","2024-01-01","0","Inf","Hrs","0.0225",'
+    '"USD","Load Balancer-Application","AWSELB","US East (N. Virginia)","AWS Region",'
+    '"LoadBalancerUsage","LoadBalancing:Application","us-east-1"',
+    '"ALB2","JRTCKXETXF","ALB2.1","OnDemand","per LCU-hour","2024-01-01","0","Inf","LCU-Hrs","0.008",'
+    '"USD","Load Balancer-Application","AWSELB","US East (N. Virginia)","AWS Region",'
+    '"LCUUsage","LoadBalancing:Application","us-east-1"',
+]) + "\n"
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    ec2_path = tmp_path / "AmazonEC2.json"
+    ec2_path.write_text(json.dumps(EC2_OFFER, indent=1), encoding="utf-8")
+    elb_path = tmp_path / "AWSELB.csv"
+    elb_path.write_text(ELB_CSV, encoding="utf-8")
+    path = tmp_path / "pricing_index.sqlite"
+
+    # A tiny chunk size forces many buffer refills mid-token
+    count = price_index.build_index([str(ec2_path), str(elb_path)], str(path), chunk_size=7)
+
+    assert count == 4
+    return str(path)
+
+
+class TestBuildIndex:
+    """Test building the offline pricing index."""
+
+    def test_lookups(self, index_path):
+        """Test indexed prices for each service."""
+        with price_index.PriceIndex(index_path) as index:
+            assert index.lookup("EC2", "t3.micro", "us-east-1") == 0.0104
+            assert index.lookup("EBS", "gp3", "eu-west-1") == 0.088
+            assert index.lookup("EBS", "st1", "us-east-1") == 0.045
+            assert index.lookup("ELB", "application", "us-east-1") == 0.0225
+            assert index.lookup("EC2", "m5.large", "us-east-1") is None
+
+    def test_no_partial_file_on_failure(self, tmp_path):
+        """Test a malformed offer file leaves no index behind."""
+        bad = tmp_path / "bad.json"
+        bad.write_text('{"products": {"SKU1": ', encoding="utf-8")
+        out = tmp_path / "index.sqlite"
+
+        with pytest.raises(ValueError):
+            price_index.build_index([str(bad)], str(out))
+
+        assert list(tmp_path.iterdir()) == [bad]
+
+    def test_cli(self, tmp_path, capsys):
+        """Test the build entry point."""
+        offer = tmp_path / "AmazonEC2.json"
+        offer.write_text(json.dumps(EC2_OFFER), encoding="utf-8")
+        out = tmp_path / "index.sqlite"
+
+        assert price_index.main([str(offer), "--output", str(out)]) == 0
+        rows = sqlite3.connect(str(out)).execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        assert rows == 3
+
+
+class TestStreaming:
+    """Test the streaming offer readers."""
+
+    def test_json_events_in_document_order(self):
+        """Test Reserved terms are walked but not emitted."""
+        events = list(price_index.iter_json_offer(io.StringIO(json.dumps(EC2_OFFER)), chunk_size=3))
+
+        assert [(kind, sku) for kind, sku, _ in events] == [
+            ("product", "SKU1"), ("product", "SKU2"), ("product", "SKU3"), ("product", "SKU4"),
+            ("term", "SKU1"), ("term", "SKU2"), ("term", "SKU3"), ("term", "SKU4"),
+        ]
+
+    def test_select_price_prefers_first_tier(self):
+        """Test tier and empty-price handling."""
+        assert price_index.select_price([("GB-Mo", "100", "0.01"), ("GB-Mo", "0", "0.05")]) == ("GB-Mo", 0.05)
+        assert price_index.select_price([("Hrs", "0", "")]) is None
+
+
+class TestOfflinePricingMode:
+    """Test PRICING_MODE=offline in the estimator."""
+
+    def test_estimates_from_index(self, monkeypatch, index_path):
+        """Test prices come from the index and unknown keys fall back to static."""
+        monkeypatch.setenv("PRICING_MODE", "offline")
+        monkeypatch.setenv("PRICING_INDEX_PATH", index_path)
+        monkeypatch.setattr(estimator, "_get_pricing_client", lambda: pytest.fail("network call"))
+
+        estimated, total = estimator.estimate_monthly_waste([
+            {"type": "EC2", "id": "i-1", "instance_type": "t3.micro", "region": "us-east-1"},
+            {"type": "EC2", "id": "i-2", "instance_type": "t3.small", "region": "us-east-1"},
+            {"type": "EBS", "id": "vol-1", "size_gb": 100, "volume_type": "gp3", "region": "eu-west-1"},
+            {"type": "ELB", "id": "lb-1", "region": "us-east-1"},
+        ])
+
+        costs = {r["id"]: r["monthly_cost"] for r in estimated}
+        assert costs == {"i-1": 7.59, "i-2": 17.0, "vol-1": 8.8, "lb-1": 16.43}
+
+    def test_missing_index_uses_static(self, monkeypatch, tmp_path):
+        """Test a missing index degrades to static pricing."""
+        monkeypatch.setenv("PRICING_MODE", "offline")
+        monkeypatch.setenv("PRICING_INDEX_PATH", str(tmp_path / "missing.sqlite"))
+
+        estimated, total = estimator.estimate_monthly_waste([{"type": "EBS", "id": "vol-1", "size_gb": 10}])
+
+        assert total == 1.0
@@ -59,7 +59,7 @@ def test_scan_stopped_rds_cluster_with_tags(monkeypatch):
     }
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, tags_map)
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -94,7 +94,7 @@ def test_scan_stopped_rds_instance(monkeypatch):
     }
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, tags_map)
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -131,7 +131,7 @@ def test_scan_stopped_rds_both_cluster_and_instance(monkeypatch):
     }]
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, {})
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -186,7 +186,7 @@ def test_scan_stopped_rds_filters_running(monkeypatch):
     }]
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, {})
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -213,7 +213,7 @@ def test_scan_stopped_rds_empty_azs(monkeypatch):
     instances_data = [{"DBInstances": []}]
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, {})
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -262,7 +262,7 @@ def test_scan_stopped_rds_pagination(monkeypatch):
     ]
     
     fake_rds = FakeRDSClient(clusters_data, instances_data, {})
-    monkeypatch.setattr(rds_scanner, "_rds_client", fake_rds)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
 
     results = rds_scanner.scan_stopped_rds()
 
@@ -272,3 +272,66 @@ def test_scan_stopped_rds_pagination(monkeypatch):
     
     assert set(cluster_ids) == {"cluster-1", "cluster-2"}
     assert set(instance_ids) == {"instance-1", "instance-2"}
+
+
+def _stopped_instances(count, inline_tags=True):
+    instances = []
+    for n in range(count):
+        instance = {
+            "DBInstanceIdentifier": f"db-{n}",
+            "DBInstanceArn": f"arn:aws:rds:us-east-1:123:db:db-{n}",
+            "DBInstanceStatus": "stopped",
+            "Engine": "postgres",
+            "DBInstanceClass": "db.t3.micro",
+            "AvailabilityZone": "us-east-1a",
+        }
+        if inline_tags:
+            instance["TagList"] = [{"Key": "owner", "Value": f"team-{n}"}]
+        instances.append(instance)
+    # describe_db_instances returns at most 100 records per page
+    return [{"DBInstances": instances[i:i + 100]} for i in range(0, count, 100)]
+
+
+def test_inline_tags_avoid_per_arn_calls(monkeypatch):
+    """Test 500 stopped instances with inline TagList need no list_tags_for_resource calls."""
+    fake_rds = FakeRDSClient([{"DBClusters": []}], _stopped_instances(500))
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
+
+    results = rds_scanner.scan_stopped_rds()
+
+    assert len(results) == 500
+    assert fake_rds.tag_calls == []
+    assert results[499]["tags"] == {"owner": "team-499"}
+
+
+def test_missing_inline_tags_fall_back_per_arn(monkeypatch):
+    """Test only instances without a TagList are looked up, each exactly once."""
+    monkeypatch.setenv("RDS_TAG_RATE", "10000")
+    pages = _stopped_instances(500)
+    for instance in pages[2]["DBInstances"]:
+        del instance["TagList"]
+    tags_map = {i["DBInstanceArn"]: [{"Key": "owner", "Value": "sre"}] for i in pages[2]["DBInstances"]}
+    fake_rds = FakeRDSClient([{"DBClusters": []}], pages, tags_map)
+    monkeypatch.setattr(rds_scanner, "_get_rds_client", lambda *args: fake_rds)
+
+    results = rds_scanner.scan_stopped_rds()
+
+    assert len(results) == 500
+    assert sorted(fake_rds.tag_calls) == sorted(tags_map)
+    assert results[250]["tags"] == {"owner": "sre"}
+    assert results[0]["tags"] == {"owner": "team-0"}
+
+
+def test_rate_limiter_spaces_calls(monkeypatch):
+    """Test the fallback limiter spaces calls to the configured rate."""
+    from utils.aws_helpers import RateLimiter
+
+    sleeps = []
+    monkeypatch.setattr("utils.aws_helpers.time.sleep", sleeps.append)
+    limiter = RateLimiter(10)
+
+    for _ in range(3):
+        limiter.wait()
+
+    assert len(sleeps) == 2
+    assert sleeps[1] > sleeps[0] > 0
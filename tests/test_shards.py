@@ -0,0 +1,120 @@
+import gzip
+
+import pytest
+
+import lambda_handler
+from utils.shards import iter_shard, shard_key, write_shard
+from utils.storage import LocalStore
+
+
+def _ebs(vid, region="us-east-1", **extra):
+    return {"type": "EBS", "id": vid, "size_gb": 100, "az": f"{region}a", "region": region, "tags": {}, **extra}
+
+
+class TestShardFiles:
+    """Test the partial-results file format."""
+
+    def test_round_trip(self, tmp_path):
+        """Test records and trailer metadata survive a write and streaming read."""
+        store = LocalStore(str(tmp_path))
+        key = shard_key("run-1", "scan_idle_ec2[111111111111/eu-west-1]")
+
+        count = write_shard(store, key, iter([_ebs("vol-1"), _ebs("vol-2")]), {"errors": []})
+        meta = {}
+        records = list(iter_shard(store, key, meta))
+
+        assert key == "shards/run-1/scan_idle_ec2.111111111111.eu-west-1.jsonl.gz"
+        assert count == 2
+        assert [r["id"] for r in records] == ["vol-1", "vol-2"]
+        assert meta == {"errors": [], "resources": 2}
+
+    def test_truncated_shard_is_reported(self, tmp_path):
+        """Test a shard without its trailer raises after yielding what it holds."""
+        store = LocalStore(str(tmp_path))
+        store.put("shards/run-1/a.jsonl.gz", gzip.compress(b'{"type": "EBS", "id": "vol-1"}\n'))
+
+        records = iter_shard(store, "shards/run-1/a.jsonl.gz", {})
+
+        assert next(records)["id"] == "vol-1"
+        with pytest.raises(ValueError):
+            next(records)
+
+
+@pytest.fixture
+def sharded(monkeypatch, tmp_path):
+    reports = []
+    monkeypatch.setenv("SHARD_RESULTS_LOCATION", str(tmp_path))
+    monkeypatch.setenv("PRICING_MODE", "static")
+    monkeypatch.setattr(lambda_handler, "send_report", reports.append)
+    monkeypatch.setattr(lambda_handler, "archive_report", lambda report: None)
+    return reports
+
+
+def test_plan_expands_regions_and_scanners():
+    """Test one shard event is planned per region and scanner."""
+    plan = lambda_handler.plan_handler({"regions": ["us-east-1", "eu-west-1"], "run_id": "run-1"}, None)
+
+    assert len(plan["shards"]) == 2 * len(lambda_handler.SCANNERS)
+    assert plan["shards"][0] == {"run_id": "run-1", "shard": {"scanner": "scan_unattached_ebs", "region": "us-east-1"}}
+
+
+def test_shards_merge_into_one_report(monkeypatch, sharded):
+    """Test shard results are deduplicated, totalled and delivered once by the aggregator."""
+    def scan_ebs(region=None):
+        # Both regional shards report the same volume
+        return [_ebs("vol-1"), _ebs(f"vol-{region}", region)]
+
+    def scan_ec2(region=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(lambda_handler, "scan_unattached_ebs", scan_ebs)
+    monkeypatch.setattr(lambda_handler, "scan_idle_ec2", scan_ec2)
+    monkeypatch.setattr(lambda_handler, "scan_unused_elb", lambda region=None: [])
+    monkeypatch.setattr(lambda_handler, "scan_stopped_rds", lambda region=None: [])
+
+    plan = lambda_handler.plan_handler({"regions": ["us-east-1", "eu-west-1"], "run_id": "run-1"}, None)
+    results = [lambda_handler.handler(shard, None) for shard in plan["shards"]]
+
+    assert sharded == []
+    assert results[0]["resources"] == 2 and results[0]["monthly_waste"] == 20.0
+    assert results[1]["status"] == "partial"
+
+    merged = lambda_handler.aggregate_handler({"run_id": "run-1"}, None)
+
+    assert merged["status"] == "partial"
+    assert merged["resources"] == 3
+    assert merged["monthly_waste"] == 30.0
+    assert merged["scan_errors"] == 2
+    assert len(sharded) == 1
+    assert "vol-eu-west-1" in sharded[0] and "boom" in sharded[0]
+
+
+def test_aggregate_reports_failed_shards_from_map_output(sharded):
+    """Test shard results without a key are reported as errors."""
+    merged = lambda_handler.aggregate_handler(
+        {"run_id": "run-1", "shards": [{"status": "error", "error": "Unknown scanner in shard: scan_x"}]}, None
+    )
+
+    assert merged["status"] == "partial"
+    assert merged["resources"] == 0
+    assert "Unknown scanner" in sharded[0]
+
+
+def test_aggregate_without_shards_is_an_error(sharded):
+    """Test a run with no shard results is reported as partial rather than a clean estate."""
+    merged = lambda_handler.aggregate_handler({"run_id": "run-missing"}, None)
+
+    assert merged["status"] == "partial"
+    assert merged["scan_errors"] == 1
+    assert "No shards found for run run-missing" in sharded[0]
+
+
+def test_aggregate_without_store_location_is_an_error(monkeypatch, sharded):
+    """Test a missing SHARD_RESULTS_LOCATION is collected as a scan error."""
+    monkeypatch.delenv("SHARD_RESULTS_LOCATION")
+
+    merged = lambda_handler.aggregate_handler({"run_id": "run-1"}, None)
+
+    assert merged["status"] == "partial"
+    assert merged["resources"] == 0
+    assert "SHARD_RESULTS_LOCATION is required" in sharded[0]
@@ -0,0 +1,134 @@
+import io
+
+import boto3
+from botocore.stub import Stubber
+
+from utils.storage import LocalStore, S3Store, open_store
+
+
+class TestLocalStore:
+    """Test local directory blob store."""
+
+    def test_round_trip(self, tmp_path):
+        """Test put/get with nested keys."""
+        store = LocalStore(str(tmp_path))
+
+        store.put("pricing/cache.json", b"{}")
+
+        assert store.get("pricing/cache.json") == b"{}"
+        assert (tmp_path / "pricing" / "cache.json").exists()
+
+    def test_missing_key(self, tmp_path):
+        """Test missing objects return None."""
+        assert LocalStore(str(tmp_path)).get("nope.json") is None
+
+    def test_overwrite_leaves_no_temp_files(self, tmp_path):
+        """Test atomic overwrite."""
+        store = LocalStore(str(tmp_path))
+        store.put("a.json", b"1")
+        store.put("a.json", b"2")
+
+        assert store.get("a.json") == b"2"
+        assert [p.name for p in tmp_path.iterdir()] == ["a.json"]
+
+    def test_delete(self, tmp_path):
+        """Test delete removes the object and ignores missing keys."""
+        store = LocalStore(str(tmp_path))
+        store.put("checkpoints/run.json", b"{}")
+
+        store.delete("checkpoints/run.json")
+        store.delete("checkpoints/run.json")
+
+        assert store.get("checkpoints/run.json") is None
+
+    def test_put_streams_file_objects(self, tmp_path):
+        """Test a file object is copied from its current position."""
+        store = LocalStore(str(tmp_path))
+        body = io.BytesIO(b"skip|kept")
+        body.seek(5)
+
+        store.put("shards/run-1/a.jsonl.gz", body)
+
+        assert store.get("shards/run-1/a.jsonl.gz") == b"kept"
+
+    def test_iter_keys(self, tmp_path):
+        """Test keys under a prefix are listed in order, skipping temp files."""
+        store = LocalStore(str(tmp_path))
+        store.put("shards/run-1/b.jsonl.gz", b"")
+        store.put("shards/run-1/a.jsonl.gz", b"")
+        store.put("shards/run-2/a.jsonl.gz", b"")
+        (tmp_path / "shards" / "run-1" / "c.tmp").write_bytes(b"")
+
+        assert list(store.iter_keys("shards/run-1/")) == ["shards/run-1/a.jsonl.gz", "shards/run-1/b.jsonl.gz"]
+
+
+class TestS3Store:
+    """Test S3 blob store against a stubbed client."""
+
+    def _client(self):
+        return boto3.client(
+            "s3",
+            region_name="us-east-1",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+        )
+
+    def test_put_uses_prefix(self):
+        """Test keys are written under the prefix."""
+        client = self._client()
+        stubber = Stubber(client)
+        stubber.add_response(
+            "put_object", {}, {"Bucket": "bucket", "Key": "cache/pricing.json", "Body": b"{}"}
+        )
+
+        with stubber:
+            S3Store("bucket", "cache/", client).put("pricing.json", b"{}")
+            stubber.assert_no_pending_responses()
+
+    def test_put_uploads_file_objects(self):
+        """Test a file object is streamed with upload_fileobj instead of read into memory."""
+        class FakeS3:
+            def __init__(self):
+                self.uploads = []
+
+            def upload_fileobj(self, fileobj, bucket, key):
+                self.uploads.append((fileobj, bucket, key))
+
+        client = FakeS3()
+        body = io.BytesIO(b"data")
+
+        S3Store("bucket", "state", client).put("shards/run-1/a.jsonl.gz", body)
+
+        assert client.uploads == [(body, "bucket", "state/shards/run-1/a.jsonl.gz")]
+
+    def test_missing_key(self):
+        """Test NoSuchKey maps to None."""
+        client = self._client()
+        stubber = Stubber(client)
+        stubber.add_client_error("get_object", service_error_code="NoSuchKey", http_status_code=404)
+
+        with stubber:
+            assert S3Store("bucket", "", client).get("pricing.json") is None
+
+    def test_iter_keys_strips_prefix(self):
+        """Test listed keys are relative to the store prefix."""
+        client = self._client()
+        stubber = Stubber(client)
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": "state/shards/run-1/a.jsonl.gz"}]},
+            {"Bucket": "bucket", "Prefix": "state/shards/run-1/"},
+        )
+
+        with stubber:
+            keys = list(S3Store("bucket", "state", client).iter_keys("shards/run-1/"))
+
+        assert keys == ["shards/run-1/a.jsonl.gz"]
+
+
+def test_open_store():
+    """Test URI dispatch."""
+    s3 = open_store("s3://bucket/some/prefix")
+    assert isinstance(s3, S3Store)
+    assert (s3.bucket, s3.prefix) == ("bucket", "some/prefix")
+    assert isinstance(open_store("/tmp/waste-hunter"), LocalStore)
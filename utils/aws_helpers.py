@@ -1,17 +1,228 @@
 # utils/aws_helpers.py
-import boto3
 import logging
-from botocore.config import Config
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from utils.cassette import install_from_env
+from utils.checkpoint import partitioned_pages, raise_if_stopped, resumable_pages
+from utils.metrics import instrument_client
 
 logger = logging.getLogger(__name__)
 
-# Boto3 config with retries and timeouts
-BOTO3_CONFIG = Config(
+# Boto3 config with retries and timeouts; boto3 itself is imported on first client creation
+# so cold starts that never reach AWS (plan/aggregate events, config errors) skip its import.
+# The botocore Config is built from these on first use and exposed as BOTO3_CONFIG.
+_BOTO3_CONFIG_KWARGS = dict(
     retries={"max_attempts": 10, "mode": "adaptive"},
     connect_timeout=5,
     read_timeout=60,
 )
 
+DEFAULT_LIST_PARTITIONS = 1  # Concurrent availability-zone partitions per EC2 listing; 1 lists serially
+DEFAULT_MAX_POOL_CONNECTIONS = 10  # botocore default
+POOL_CONNECTIONS_PER_WORKER = 2  # Headroom for nested fan-out (paginators, tag and price lookups)
+
+# Shared client factory state; survives across warm Lambda invocations
+_SESSION = None
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+_CLIENT_STATS = {"created": 0, "reused": 0}
+_max_pool_connections = None
+_boto3_config = None
+
+# Refresh assumed-role credentials this long before they expire
+CREDENTIAL_REFRESH_MARGIN = timedelta(minutes=5)
+ROLE_SESSION_NAME = "aws-waste-hunter"
+
+_ASSUMED_CREDENTIALS = {}
+_ASSUMED_CREDENTIALS_LOCKS = {}
+_ASSUMED_CREDENTIALS_LOCK = threading.Lock()
+
+
+def __getattr__(name):
+    # BOTO3_CONFIG stays a botocore Config without importing botocore at module import
+    if name == "BOTO3_CONFIG":
+        global _boto3_config
+        if _boto3_config is None:
+            from botocore.config import Config
+
+            _boto3_config = Config(**_BOTO3_CONFIG_KWARGS)
+        return _boto3_config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def configure_client_pool(scan_concurrency):
+    """
+    Size the HTTP connection pool of new clients for scan_concurrency worker threads.
+    MAX_POOL_CONNECTIONS overrides the derived value. Cached clients are dropped when
+    the size changes so every client picks up the new pool.
+    """
+    global _max_pool_connections
+    try:
+        size = int(os.environ["MAX_POOL_CONNECTIONS"])
+    except (KeyError, ValueError):
+        size = scan_concurrency * POOL_CONNECTIONS_PER_WORKER
+    size = max(size, DEFAULT_MAX_POOL_CONNECTIONS)
+
+    with _CLIENTS_LOCK:
+        if size != _max_pool_connections:
+            if _CLIENTS:
+                logger.info(f"Connection pool size changed to {size}, recreating clients")
+            _CLIENTS.clear()
+            _max_pool_connections = size
+    return size
+
+
+def default_region():
+    """Region the function runs in, from the Lambda environment."""
+    return os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
+
+
+def get_client(service, region=None, credentials=None):
+    """
+    Return a shared boto3 client for service, optionally in region and with explicit credentials.
+    Clients are created once per (service, region, access key) from one session and reused
+    across threads and warm invocations; region None uses the function's own region.
+    Clients built with assumed-role credentials are dropped when those credentials are refreshed.
+    """
+    region = region or default_region()
+    access_key = credentials.get("aws_access_key_id") if credentials else None
+    key = (service, region, access_key)
+    # boto3 sessions are not safe for concurrent client creation, so creation is serialised
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is not None:
+            _CLIENT_STATS["reused"] += 1
+            return client
+
+        from botocore.config import Config
+
+        global _SESSION
+        if _SESSION is None:
+            import boto3
+
+            _SESSION = boto3.session.Session()
+            # AWS_CASSETTE_MODE=record|replay captures or serves every response this session sees
+            install_from_env(_SESSION)
+        config = Config(
+            **_BOTO3_CONFIG_KWARGS, max_pool_connections=_max_pool_connections or DEFAULT_MAX_POOL_CONNECTIONS
+        )
+        client = _SESSION.client(service, region_name=region, config=config, **(credentials or {}))
+        instrument_client(client)
+        _CLIENTS[key] = client
+        _CLIENT_STATS["created"] += 1
+    return client
+
+
+def _drop_clients(access_key):
+    """Forget cached clients built with access_key, e.g. once its credentials are replaced."""
+    with _CLIENTS_LOCK:
+        for key in [key for key in _CLIENTS if key[2] == access_key]:
+            del _CLIENTS[key]
+
+
+def get_client_stats():
+    """Return counts of clients created and reused by the shared factory."""
+    with _CLIENTS_LOCK:
+        return dict(_CLIENT_STATS)
+
+
+def reset_client_stats():
+    """Reset factory counters at the start of an invocation; cached clients are kept."""
+    with _CLIENTS_LOCK:
+        _CLIENT_STATS.update(created=0, reused=0)
+
+
+def assume_role_credentials(account_id, role_name, sts_client=None):
+    """
+    Assume role_name in account_id and return credentials as boto3 client kwargs.
+    Credentials are cached per (account, role) until shortly before they expire; clients
+    built with the credentials being replaced are dropped from the client cache.
+    """
+    key = (account_id, role_name)
+    with _ASSUMED_CREDENTIALS_LOCK:
+        lock = _ASSUMED_CREDENTIALS_LOCKS.setdefault(key, threading.Lock())
+
+    # Per-key lock: concurrent work items for one account share a single AssumeRole call
+    with lock:
+        cached = _ASSUMED_CREDENTIALS.get(key)
+        if cached and cached["expiration"] - CREDENTIAL_REFRESH_MARGIN > datetime.now(timezone.utc):
+            return cached["credentials"]
+
+        sts = sts_client or get_client("sts")
+        role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
+        logger.info(f"Assuming role {role_arn}")
+        response = sts.assume_role(RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME)
+
+        creds = response["Credentials"]
+        credentials = {
+            "aws_access_key_id": creds["AccessKeyId"],
+            "aws_secret_access_key": creds["SecretAccessKey"],
+            "aws_session_token": creds["SessionToken"],
+        }
+        _ASSUMED_CREDENTIALS[key] = {"credentials": credentials, "expiration": creds["Expiration"]}
+        if cached:
+            _drop_clients(cached["credentials"]["aws_access_key_id"])
+        return credentials
+
+
+def discover_regions(ec2_client):
+    """List regions enabled for the account (opted in or not requiring opt-in)."""
+    response = ec2_client.describe_regions(
+        Filters=[{"Name": "opt-in-status", "Values": ["opt-in-not-required", "opted-in"]}]
+    )
+    return sorted(r["RegionName"] for r in response.get("Regions", []))
+
+
+def get_list_partitions():
+    """Get the number of concurrent listings per EC2 describe_* scan (LIST_PARTITIONS) with validation."""
+    try:
+        partitions = int(os.getenv("LIST_PARTITIONS", str(DEFAULT_LIST_PARTITIONS)))
+        if partitions < 1:
+            logger.warning(f"Invalid LIST_PARTITIONS {partitions}, using default {DEFAULT_LIST_PARTITIONS}")
+            partitions = DEFAULT_LIST_PARTITIONS
+    except ValueError:
+        logger.warning(f"Invalid LIST_PARTITIONS format, using default {DEFAULT_LIST_PARTITIONS}")
+        partitions = DEFAULT_LIST_PARTITIONS
+    return partitions
+
+
+def availability_zone_partitions(ec2_client, count):
+    """Split the region's availability zones (Local and Wavelength Zones included) into up to count groups."""
+    response = ec2_client.describe_availability_zones(AllAvailabilityZones=True)
+    zones = sorted(z["ZoneName"] for z in response.get("AvailabilityZones", []))
+    count = min(count, len(zones))
+    return [zones[n::count] for n in range(count)]
+
+
+def ec2_listing_pages(ec2_client, label, operation, filters, prefetch=False):
+    """
+    Pages of an EC2 describe_* listing. With LIST_PARTITIONS above 1 the listing is split by
+    availability-zone filter into that many partitions, paginated concurrently; otherwise
+    (or when zones cannot be listed) it is resumable_pages as usual. Callers dedupe by ID.
+    """
+    paginator = ec2_client.get_paginator(operation)
+    count = get_list_partitions()
+    groups = []
+    if count > 1:
+        try:
+            groups = availability_zone_partitions(ec2_client, count)
+        except Exception as e:
+            logger.warning(f"Error listing availability zones, listing {label} serially: {e}")
+    if len(groups) < 2:
+        return resumable_pages(label, paginator, prefetch=prefetch, Filters=filters)
+
+    logger.debug(f"Listing {label} in {len(groups)} availability-zone partitions")
+    partitions = [
+        (
+            "+".join(zones),
+            {"Filters": filters + [{"Name": "availability-zone", "Values": zones}]},
+        )
+        for zones in groups
+    ]
+    return partitioned_pages(label, paginator, partitions)
+
 
 def get_region_from_az(az):
     """Extract region from availability zone, handling Local Zones and Wavelength."""
@@ -49,3 +260,79 @@ def chunk_list(items, size):
     """Split list into chunks of specified size."""
     for i in range(0, len(items), size):
         yield items[i : i + size]
+
+
+class RateLimiter:
+    """
+    Space calls at least 1/rate seconds apart across threads; rate None or 0 disables limiting.
+    Keeps per-resource fallbacks (tag lookups) under an API's request rate instead of
+    leaning on adaptive retries once the API starts throttling.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# GetMetricData accepts at most 500 MetricDataQuery entries per request
+METRIC_DATA_BATCH_SIZE = 500
+# ... and returns at most 100,800 datapoints per request (beyond that it pages with NextToken)
+METRIC_DATA_MAX_DATAPOINTS = 100800
+
+
+def get_metric_data_batched(cloudwatch, queries, start, end, batch_size=METRIC_DATA_BATCH_SIZE,
+                            timestamps=False):
+    """
+    Fetch many CloudWatch metric queries with batched GetMetricData calls.
+
+    Follows NextToken pagination within each batch and merges values per query Id.
+    Returns {query_id: [values]}; an empty list means no datapoints. With timestamps,
+    values are (timestamp, value) pairs. Queries from batches that failed, or that
+    CloudWatch reported as errored, are omitted. A work item told to stop ends between
+    batches with DeadlineReached.
+    """
+    results = {}
+
+    for chunk in chunk_list(queries, batch_size):
+        raise_if_stopped("GetMetricData")
+        values = {q["Id"]: [] for q in chunk}
+        failed = set()
+        request = {"MetricDataQueries": chunk, "StartTime": start, "EndTime": end}
+
+        try:
+            while True:
+                response = cloudwatch.get_metric_data(**request)
+                for result in response.get("MetricDataResults", []):
+                    qid = result.get("Id")
+                    if result.get("StatusCode") in ("InternalError", "Forbidden"):
+                        failed.add(qid)
+                    if timestamps:
+                        values.setdefault(qid, []).extend(zip(result.get("Timestamps", []), result.get("Values", [])))
+                    else:
+                        values.setdefault(qid, []).extend(result.get("Values", []))
+
+                token = response.get("NextToken")
+                if not token:
+                    break
+                request["NextToken"] = token
+        except Exception as e:
+            logger.warning(f"Error fetching metric data for batch of {len(chunk)} queries: {e}")
+            continue
+
+        for qid in failed:
+            logger.warning(f"Metric data query {qid} returned an error status")
+            values.pop(qid, None)
+        results.update(values)
+
+    return results
@@ -0,0 +1,240 @@
+# utils/cassette.py
+import atexit
+import base64
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+_CONTEXT_KEY = "cassette"
+# Under /tmp by default: the deployment package directory is read-only on Lambda
+DEFAULT_CASSETTE_PATH = os.path.join(tempfile.gettempdir(), "aws_cassette.jsonl.gz")
+
+# Parameters that change between otherwise identical runs and are ignored when matching.
+# The clock itself is not frozen: scanners still decide from datetime.now() which resources
+# are too new to judge, so a replay on a later day can query other resources and miss.
+VOLATILE_PARAMS = {"StartTime", "EndTime"}
+VOLATILE_OPERATION_PARAMS = {
+    ("s3", "PutObject"): {"Body", "Key"},
+    ("sns", "Publish"): {"Message"},
+}
+REDACTED_CREDENTIALS = ("SecretAccessKey", "SessionToken")
+
+_ACTIVE = []
+_ACTIVE_LOCK = threading.Lock()
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a call has no recorded response."""
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def request_key(region, service, operation, params):
+    """Match key for a call: volatile parameters such as metric time windows are dropped."""
+    ignored = VOLATILE_PARAMS | VOLATILE_OPERATION_PARAMS.get((service, operation), set())
+    stable = {k: v for k, v in (params or {}).items() if k not in ignored}
+    return f"{region}|{service}.{operation}|{json.dumps(_encode(stable), sort_keys=True)}"
+
+
+def _call_details(model, context):
+    service = model.service_model.service_name
+    return context.get("client_region"), service, model.name
+
+
+class Recorder:
+    """
+    Append every botocore response received through a session to a gzip JSON-lines cassette.
+    Each flush closes a gzip member and the next response opens another, so a warm Lambda
+    keeps recording into the same file and the cassette is readable after every invocation.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        with gzip.open(path, "wt", encoding="utf-8") as handle:
+            handle.write(json.dumps({"version": CASSETTE_VERSION, "recorded": datetime.now().isoformat()}) + "\n")
+        self._handle = None
+
+    def install(self, session):
+        session.events.register_first("before-parameter-build.*.*", self._before)
+        session.events.register("after-call.*.*", self._after)
+
+    def _before(self, params, context, **kwargs):
+        context[_CONTEXT_KEY] = {"params": dict(params), "started": time.perf_counter()}
+
+    def _after(self, http_response, parsed, model, context, **kwargs):
+        call = context.get(_CONTEXT_KEY)
+        if call is None:
+            return
+        latency = time.perf_counter() - call["started"]
+        region, service, operation = _call_details(model, context)
+
+        from botocore.response import StreamingBody
+
+        response = dict(parsed)
+        body = response.get("Body")
+        if isinstance(body, StreamingBody):
+            # Read the body once and hand the caller a fresh stream over the same bytes
+            data = body.read()
+            response["Body"] = data
+            parsed["Body"] = StreamingBody(io.BytesIO(data), len(data))
+        if isinstance(response.get("Credentials"), dict):
+            response["Credentials"] = {
+                k: ("REDACTED" if k in REDACTED_CREDENTIALS else v) for k, v in response["Credentials"].items()
+            }
+
+        entry = {
+            "key": request_key(region, service, operation, call["params"]),
+            "status": http_response.status_code,
+            "latency": round(latency, 6),
+            "response": _encode(response),
+        }
+        with self._lock:
+            if self._handle is None:
+                self._handle = gzip.open(self.path, "at", encoding="utf-8")
+            self._handle.write(json.dumps(entry) + "\n")
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+                logger.info(f"Recorded {self.count} AWS responses to {self.path}")
+
+
+class Replayer:
+    """
+    Serve recorded responses instead of calling AWS. Identical calls are answered in
+    recorded order; once exhausted the last response repeats. Latency is replayed
+    multiplied by latency_scale (0 disables sleeping).
+    """
+
+    def __init__(self, path, latency_scale=1.0):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.served = 0
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._responses = {}
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            header = json.loads(handle.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')} in {path}")
+            for line in handle:
+                entry = json.loads(line)
+                self._responses.setdefault(entry.pop("key"), deque()).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._responses.values())
+
+    def install(self, session):
+        session.events.register_first("before-parameter-build.*.*", self._before)
+        session.events.register_first("before-call.*.*", self._respond)
+
+    def _before(self, params, context, **kwargs):
+        context[_CONTEXT_KEY] = {"params": dict(params)}
+
+    def _respond(self, model, context, **kwargs):
+        call = context.get(_CONTEXT_KEY) or {}
+        region, service, operation = _call_details(model, context)
+        key = request_key(region, service, operation, call.get("params"))
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded response for {service}.{operation} in {region}")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+            self.served += 1
+            self.calls[f"{service}.{operation}"] = self.calls.get(f"{service}.{operation}", 0) + 1
+
+        if self.latency_scale:
+            time.sleep(entry["latency"] * self.latency_scale)
+
+        from botocore.awsrequest import AWSResponse
+        from botocore.response import StreamingBody
+
+        parsed = _decode(entry["response"])
+        if isinstance(parsed.get("Body"), bytes):
+            data = parsed["Body"]
+            parsed["Body"] = StreamingBody(io.BytesIO(data), len(data))
+        return AWSResponse(None, entry["status"], {}, None), parsed
+
+    def flush(self):
+        logger.info(f"Replayed {self.served} AWS responses from {self.path}")
+
+
+def install_from_env(session):
+    """
+    Attach a recorder or replayer to session when AWS_CASSETTE_MODE is "record" or "replay".
+    AWS_CASSETTE_PATH names the cassette (default under the temp directory);
+    AWS_CASSETTE_LATENCY_SCALE scales replayed latency.
+    """
+    mode = os.getenv("AWS_CASSETTE_MODE", "").lower()
+    if not mode:
+        return None
+    path = os.getenv("AWS_CASSETTE_PATH", DEFAULT_CASSETTE_PATH)
+
+    if mode == "record":
+        cassette = Recorder(path)
+    elif mode == "replay":
+        try:
+            scale = float(os.getenv("AWS_CASSETTE_LATENCY_SCALE", "1"))
+        except ValueError:
+            logger.warning("Invalid AWS_CASSETTE_LATENCY_SCALE, using 1")
+            scale = 1.0
+        cassette = Replayer(path, latency_scale=scale)
+    else:
+        logger.warning(f"Invalid AWS_CASSETTE_MODE '{mode}', ignoring")
+        return None
+
+    cassette.install(session)
+    with _ACTIVE_LOCK:
+        _ACTIVE.append(cassette)
+    logger.info(f"AWS cassette {mode} mode using {path}")
+    return cassette
+
+
+def flush_active():
+    """Flush every cassette opened by install_from_env; recording continues on the next call."""
+    with _ACTIVE_LOCK:
+        cassettes = list(_ACTIVE)
+    for cassette in cassettes:
+        cassette.flush()
+
+
+atexit.register(flush_active)
@@ -0,0 +1,347 @@
+# utils/checkpoint.py
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+
+from utils.metrics import propagate
+
+logger = logging.getLogger(__name__)
+
+RESUME_CHUNK_ITEMS = 1000  # Items per resumable chunk; the deadline is checked between chunks
+_DONE = "__done__"
+
+_CURSOR = contextvars.ContextVar("checkpoint_cursor", default=None)
+
+
+class DeadlineReached(Exception):
+    """Raised at a page boundary once the invocation's time budget is spent."""
+
+
+class Deadline:
+    """
+    Time budget of one invocation from the Lambda context, keeping reserve_ms back for
+    checkpointing and reporting. Without a context (local runs, tests) it never expires.
+    """
+
+    def __init__(self, context, reserve_ms):
+        self._remaining = getattr(context, "get_remaining_time_in_millis", None)
+        self.reserve_ms = reserve_ms
+
+    def remaining_ms(self):
+        """Milliseconds left before the reserve, or None when there is no deadline."""
+        if self._remaining is None:
+            return None
+        return self._remaining() - self.reserve_ms
+
+    def expired(self):
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining <= 0
+
+
+class Cursor:
+    """
+    Progress of one work item: records yielded so far and the next page token per listing.
+    stop, an optional threading.Event, ends the listing at the next page once set. A cursor
+    that is not resumable only enforces the deadline: listings are paginated as usual and
+    no page tokens are recorded.
+    """
+
+    def __init__(self, deadline, state=None, stop=None, resumable=True):
+        state = state or {}
+        self.deadline = deadline
+        self.stop = stop
+        self.resumable = resumable
+        self.records = list(state.get("records", []))
+        self.tokens = dict(state.get("tokens", {}))
+        self._committed = len(self.records)
+
+    def stopped(self):
+        return self.stop is not None and self.stop.is_set()
+
+    def check(self, label):
+        """Raise DeadlineReached once stop is set or the deadline has passed."""
+        if self.stopped():
+            raise DeadlineReached(f"Stopped during {label}")
+        if self.deadline.expired():
+            raise DeadlineReached(f"Time budget exhausted during {label}")
+
+    def commit(self, label, token):
+        """Record the position of label; every record before it has been reported."""
+        self.tokens[label] = token
+        self._committed = len(self.records)
+
+    def as_dict(self):
+        # Records found after the last recorded position are found again when the listing resumes
+        return {"records": self.records[:self._committed], "tokens": self.tokens}
+
+
+@contextmanager
+def resume(cursor):
+    """Make cursor the resume state for resumable_pages calls in this thread."""
+    token = _CURSOR.set(cursor)
+    try:
+        yield cursor
+    finally:
+        _CURSOR.reset(token)
+
+
+def raise_if_stopped(label):
+    """
+    End the work item with DeadlineReached once the active Cursor's stop signal is set, for
+    long runs of calls between page fetches (e.g. metric batches). A no-op without a cursor.
+    """
+    cursor = _CURSOR.get()
+    if cursor is not None and cursor.stopped():
+        raise DeadlineReached(f"Stopped during {label}")
+
+
+def resumable_pages(label, paginator, prefetch=False, **kwargs):
+    """
+    Iterate paginator.paginate(**kwargs), resuming from and recording the position under
+    label in the active Cursor. Callers must yield every record from a page before asking
+    for the next one, so a saved token never skips unreported resources. Without a cursor
+    this is plain pagination; with one that is not resumable, it is plain pagination that
+    checks the deadline and stop signal before every page.
+
+    With prefetch, the next page is fetched in a background thread while the caller works
+    on the current one; positions are still recorded only once the caller asks for more.
+    The deadline is checked between chunks and the cursor's stop signal before every page;
+    either ends the listing with DeadlineReached.
+    """
+    cursor = _CURSOR.get()
+    if cursor is None or not cursor.resumable:
+        if cursor is not None:
+            cursor.check(label)
+        pages = iter(paginator.paginate(**kwargs))
+        with closing(_prefetched(pages)) if prefetch else nullcontext(pages) as pages:
+            for page in pages:
+                if cursor is not None:
+                    cursor.check(label)
+                yield page
+        return
+
+    token = cursor.tokens.get(label)
+    if token == _DONE:
+        return
+    if cursor.deadline.expired():
+        raise DeadlineReached(f"Time budget exhausted before {label}")
+    chunks = _chunk_pages(paginator, token, kwargs)
+    with closing(_prefetched(_carry_tokens(chunks)) if prefetch else chunks) as chunks:
+        for page, token in chunks:
+            if token is not None:
+                # Every record up to the chunk boundary has been consumed
+                cursor.commit(label, token)
+                if token != _DONE and cursor.deadline.expired():
+                    raise DeadlineReached(f"Time budget exhausted before {label}")
+            if page is not None:
+                if cursor.stopped():
+                    raise DeadlineReached(f"Stopped during {label}")
+                yield page
+
+
+def partitioned_pages(label, paginator, partitions):
+    """
+    Iterate independent listings of paginator concurrently, one per (name, kwargs) partition,
+    yielding pages as they arrive. Each partition resumes from and records its position under
+    "label:name" in the active Cursor, with the same guarantee as resumable_pages.
+    """
+    cursor = _CURSOR.get()
+    labels = [f"{label}:{name}" for name, _ in partitions]
+    if cursor is None or not cursor.resumable:
+        if cursor is not None:
+            cursor.check(label)
+        streams = [((page, None) for page in paginator.paginate(**kwargs)) for _, kwargs in partitions]
+    else:
+        if cursor.deadline.expired():
+            raise DeadlineReached(f"Time budget exhausted before {label}")
+        streams = [
+            _carry_tokens(_chunk_pages(paginator, cursor.tokens.get(partition_label), kwargs))
+            for partition_label, (_, kwargs) in zip(labels, partitions)
+        ]
+
+    with closing(_merged(streams)) as items:
+        for idx, (page, token) in items:
+            if token is not None:
+                # Every record of this partition up to the chunk boundary has been consumed
+                cursor.commit(labels[idx], token)
+                if token != _DONE and cursor.deadline.expired():
+                    raise DeadlineReached(f"Time budget exhausted before {labels[idx]}")
+            if page is not None:
+                if cursor is not None and not cursor.resumable:
+                    cursor.check(labels[idx])
+                elif cursor is not None and cursor.stopped():
+                    raise DeadlineReached(f"Stopped during {labels[idx]}")
+                yield page
+
+
+def _chunk_pages(paginator, token, kwargs):
+    """Yield (page, None) for each page from token on, then (None, resume token) after each chunk."""
+    while token != _DONE:
+        config = {"MaxItems": RESUME_CHUNK_ITEMS}
+        if token:
+            config["StartingToken"] = token
+        pages = paginator.paginate(PaginationConfig=config, **kwargs)
+        for page in pages:
+            yield page, None
+        token = pages.resume_token or _DONE
+        yield None, token
+
+
+def _carry_tokens(chunks):
+    """Attach each chunk's resume token to the first page after it, so prefetching crosses chunks."""
+    pending = None
+    for page, token in chunks:
+        if page is None:
+            pending = token
+            continue
+        yield page, pending
+        pending = None
+    if pending is not None:
+        yield None, pending
+
+
+def _merged(streams):
+    """
+    Iterate streams concurrently, one thread each, yielding (index, item) as items arrive.
+    At most one item per stream waits unconsumed; the threads stop once the caller does.
+    """
+    items = queue.Queue(maxsize=len(streams))
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(idx, stream):
+        try:
+            for item in stream:
+                if not put((idx, item, None)):
+                    return
+        except Exception as e:
+            put((idx, _DONE, e))
+        else:
+            put((idx, _DONE, None))
+
+    with ThreadPoolExecutor(max_workers=len(streams) or 1) as pool:
+        for idx, stream in enumerate(streams):
+            pool.submit(propagate(drain), idx, stream)
+        try:
+            remaining = len(streams)
+            while remaining:
+                idx, item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                yield idx, item
+        finally:
+            stop.set()
+
+
+def _prefetched(items):
+    """Iterate items while a background thread fetches the next one."""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        fetch = propagate(lambda: next(items, _DONE))
+        future = pool.submit(fetch)
+        while True:
+            item = future.result()
+            if item is _DONE:
+                return
+            future = pool.submit(fetch)
+            yield item
+
+
+class Checkpoint:
+    """
+    Scan progress of one run, persisted as JSON in a blob store: finished work items with
+    their records, partial items with their cursors, and the errors seen so far.
+    """
+
+    def __init__(self, store, run_id, state=None):
+        state = state or {}
+        self.store = store
+        self.run_id = run_id
+        self.started = state.get("started") or datetime.now(timezone.utc).isoformat()
+        self.invocations = state.get("invocations", 0) + 1
+        self.completed = state.get("completed", {})
+        self.partial = state.get("partial", {})
+        self.errors = state.get("errors", [])
+        self.durations = state.get("durations", {})
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return f"checkpoints/{self.run_id}.json"
+
+    @classmethod
+    def load(cls, store, run_id, max_age_hours):
+        """Load the run's checkpoint, starting afresh when there is none or it is too old."""
+        checkpoint = cls(store, run_id)
+        body = store.get(checkpoint.key)
+        if body is None:
+            return checkpoint
+        state = json.loads(body)
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(state["started"])
+        if age > timedelta(hours=max_age_hours):
+            logger.warning(f"Discarding checkpoint {run_id} started {state['started']}")
+            return checkpoint
+        checkpoint = cls(store, run_id, state)
+        logger.info(
+            f"Resuming run {run_id}: {len(checkpoint.completed)} work items done, "
+            f"{len(checkpoint.partial)} partial, invocation {checkpoint.invocations}"
+        )
+        return checkpoint
+
+    def cursor(self, name, deadline, stop=None):
+        return Cursor(deadline, self.partial.get(name), stop)
+
+    def complete(self, name, records):
+        with self._lock:
+            self.completed[name] = records
+            self.partial.pop(name, None)
+
+    def pause(self, name, cursor):
+        with self._lock:
+            self.partial[name] = cursor.as_dict()
+
+    def records(self, names):
+        """Records of the named work items, in order; partial items contribute what they found."""
+        resources = []
+        for name in names:
+            if name in self.completed:
+                resources += self.completed[name]
+            else:
+                resources += self.partial.get(name, {}).get("records", [])
+        return resources
+
+    def save(self):
+        state = {
+            "run_id": self.run_id,
+            "started": self.started,
+            "updated": datetime.now(timezone.utc).isoformat(),
+            "invocations": self.invocations,
+            "completed": self.completed,
+            "partial": self.partial,
+            "errors": self.errors,
+            "durations": self.durations,
+        }
+        started = time.perf_counter()
+        with self._lock:
+            body = json.dumps(state).encode("utf-8")
+        self.store.put(self.key, body)
+        logger.info(f"Saved checkpoint {self.key} in {time.perf_counter() - started:.2f}s")
+
+    def delete(self):
+        self.store.delete(self.key)
@@ -0,0 +1,38 @@
+# utils/lazy.py
+import importlib
+import threading
+
+_IMPORT_LOCK = threading.Lock()
+
+
+class LazyAttr:
+    """
+    Stand-in for module.attr that imports module on first call and forwards to it.
+    Keeps heavy pipeline stages (scanners, jinja2 report templates) out of the cold-start
+    import while leaving the name patchable and resolvable through module globals.
+    """
+
+    def __init__(self, module, attr):
+        self._module = module
+        self._attr = attr
+        self._target = None
+
+    def resolve(self):
+        if self._target is None:
+            # Worker threads may hit the same stage at once; import under one lock
+            with _IMPORT_LOCK:
+                if self._target is None:
+                    self._target = getattr(importlib.import_module(self._module), self._attr)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<lazy {self._module}.{self._attr}>"
+
+
+def lazy(module, *attrs):
+    """Return one LazyAttr per attr of module, or a single LazyAttr when only one is named."""
+    stand_ins = tuple(LazyAttr(module, attr) for attr in attrs)
+    return stand_ins[0] if len(stand_ins) == 1 else stand_ins
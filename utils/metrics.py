@@ -0,0 +1,240 @@
+# utils/metrics.py
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = "AWSWasteHunter"
+EMF_MAX_METRICS = 100  # CloudWatch limit per EMF document
+
+# Stage the current thread/context is attributed to; botocore hooks read it
+_CURRENT_STAGE = contextvars.ContextVar("waste_hunter_stage", default=None)
+_LOCK = threading.Lock()
+_RUN = None
+
+
+class StageMetrics:
+    """Duration, item, skipped item, API call and retry counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0.0
+        self.items = 0
+        self.skipped = 0
+        self.skipped_by_reason = {}
+        self.api_calls = 0
+        self.retries = 0
+        self._started = None
+
+    def _resume(self):
+        self._started = time.perf_counter()
+
+    def _pause(self):
+        if self._started is not None:
+            self.duration += time.perf_counter() - self._started
+            self._started = None
+
+    def add_items(self, count=1):
+        with _LOCK:
+            self.items += count
+
+    def add_skipped(self, reason, count=1):
+        with _LOCK:
+            self.skipped += count
+            self.skipped_by_reason[reason] = self.skipped_by_reason.get(reason, 0) + count
+
+    def as_dict(self):
+        return {
+            "duration": round(self.duration, 3),
+            "items": self.items,
+            "skipped": self.skipped,
+            "skipped_by_reason": dict(self.skipped_by_reason),
+            "api_calls": self.api_calls,
+            "retries": self.retries,
+        }
+
+
+class RunMetrics:
+    """Stage metrics collected over one handler invocation."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, name):
+        with _LOCK:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageMetrics(name)
+            return stage
+
+    def as_dict(self):
+        stages = {name: stage.as_dict() for name, stage in self.stages.items()}
+        return {
+            "duration": round(time.perf_counter() - self.started, 3),
+            "api_calls": sum(s["api_calls"] for s in stages.values()),
+            "retries": sum(s["retries"] for s in stages.values()),
+            "stages": stages,
+        }
+
+
+def start_run():
+    """Begin collecting metrics for a new invocation."""
+    global _RUN
+    _RUN = RunMetrics()
+    return _RUN
+
+
+def current_run():
+    global _RUN
+    if _RUN is None:
+        _RUN = RunMetrics()
+    return _RUN
+
+
+def _activate(stage):
+    """Make stage the current one, pausing the enclosing stage so durations stay exclusive."""
+    parent = _CURRENT_STAGE.get()
+    if parent is not None:
+        parent._pause()
+    token = _CURRENT_STAGE.set(stage)
+    stage._resume()
+    return parent, token
+
+
+def _deactivate(stage, parent, token):
+    stage._pause()
+    _CURRENT_STAGE.reset(token)
+    if parent is not None:
+        parent._resume()
+
+
+@contextmanager
+def stage(name):
+    """Time a block as stage name and attribute its AWS API calls to it."""
+    record = current_run().record(name)
+    parent, token = _activate(record)
+    try:
+        yield record
+    finally:
+        _deactivate(record, parent, token)
+
+
+def stage_iter(name, items):
+    """
+    Attribute the work done producing each item of a lazy stream to stage name.
+    Time spent in nested stages pulled from upstream is excluded.
+    """
+    record = current_run().record(name)
+    iterator = iter(items)
+    while True:
+        parent, token = _activate(record)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _deactivate(record, parent, token)
+        record.add_items()
+        yield item
+
+
+def propagate(func):
+    """Wrap func so calls made from worker threads count against the caller's stage."""
+    record = _CURRENT_STAGE.get()
+
+    def run(*args, **kwargs):
+        token = _CURRENT_STAGE.set(record)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CURRENT_STAGE.reset(token)
+    return run
+
+
+def count_skipped(reason, count=1):
+    """Count resources the active stage left out of evaluation on purpose, by reason (e.g. exempt)."""
+    record = _CURRENT_STAGE.get()
+    if record is not None:
+        record.add_skipped(reason, count)
+
+
+def _on_after_call(parsed=None, **kwargs):
+    record = _CURRENT_STAGE.get()
+    if record is None:
+        return
+    retries = ((parsed or {}).get("ResponseMetadata") or {}).get("RetryAttempts", 0)
+    with _LOCK:
+        record.api_calls += 1
+        record.retries += retries
+
+
+def instrument_client(client):
+    """Count API calls and retries made through client against the active stage."""
+    client.meta.events.register("after-call.*.*", _on_after_call)
+    return client
+
+
+def _base_stage(name):
+    # Work items such as scan_idle_ec2[111111111111/us-east-1] roll up to scan_idle_ec2
+    return name.split("[", 1)[0]
+
+
+def build_emf(summary, namespace=None, service="aws-waste-hunter"):
+    """
+    Build one CloudWatch Embedded Metric Format document from a RunMetrics.as_dict() summary.
+    Per-work-item stages are summed per base stage to stay within the EMF metric limit.
+    """
+    namespace = namespace or os.getenv("METRICS_NAMESPACE", DEFAULT_NAMESPACE)
+
+    totals = {}
+    for name, values in summary["stages"].items():
+        base = totals.setdefault(
+            _base_stage(name), {"duration": 0.0, "items": 0, "skipped": 0, "api_calls": 0, "retries": 0}
+        )
+        for key in base:
+            base[key] += values.get(key, 0)
+
+    doc = {"Service": service}
+    definitions = []
+    units = (("duration", "Duration", "Milliseconds"), ("items", "Items", "Count"),
+             ("skipped", "Skipped", "Count"), ("api_calls", "ApiCalls", "Count"),
+             ("retries", "Retries", "Count"))
+
+    def add(metric, value, unit):
+        if len(definitions) < EMF_MAX_METRICS:
+            doc[metric] = value
+            definitions.append({"Name": metric, "Unit": unit})
+
+    add("RunDuration", round(summary["duration"] * 1000, 1), "Milliseconds")
+    add("ApiCalls", summary["api_calls"], "Count")
+    add("Retries", summary["retries"], "Count")
+    for name, values in totals.items():
+        for key, suffix, unit in units:
+            value = round(values[key] * 1000, 1) if key == "duration" else values[key]
+            add(f"{name}.{suffix}", value, unit)
+
+    doc["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace,
+            "Dimensions": [["Service"]],
+            "Metrics": definitions,
+        }],
+    }
+    return doc
+
+
+def emit_emf(summary, stream=None):
+    """Write the run's EMF document as a single JSON line; CloudWatch Logs extracts the metrics."""
+    doc = build_emf(summary)
+    stream = stream or sys.stdout
+    stream.write(json.dumps(doc, default=str) + "\n")
+    stream.flush()
+    return doc
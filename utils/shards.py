@@ -0,0 +1,62 @@
+# utils/shards.py
+import gzip
+import io
+import json
+import logging
+import re
+import tempfile
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = "shards"
+_TRAILER = "__shard__"
+
+
+def shard_prefix(run_id):
+    return f"{SHARD_PREFIX}/{run_id}/"
+
+
+def shard_key(run_id, name):
+    """Store key for one shard's partial results, e.g. shards/<run>/scan_idle_ec2.111.eu-west-1.jsonl.gz."""
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", ".", name).strip(".")
+    return f"{shard_prefix(run_id)}{safe}.jsonl.gz"
+
+
+def write_shard(store, key, records, meta):
+    """
+    Write records as gzip JSON lines followed by a trailer line holding meta and the record
+    count; a shard without its trailer was not written completely. Returns the record count.
+    """
+    count = 0
+    with tempfile.TemporaryFile() as handle:
+        with gzip.GzipFile(fileobj=handle, mode="wb") as compressed:
+            text = io.TextIOWrapper(compressed, encoding="utf-8")
+            for record in records:
+                text.write(json.dumps(record) + "\n")
+                count += 1
+            text.write(json.dumps({_TRAILER: {**meta, "resources": count}}) + "\n")
+            text.flush()
+            text.detach()
+        handle.seek(0)
+        store.put(key, handle)
+    logger.info(f"Wrote {count} resources to shard {key}")
+    return count
+
+
+def iter_shard(store, key, meta):
+    """
+    Stream one shard's records, filling meta from its trailer once they are all read.
+    Raises ValueError after the last record if the trailer is missing.
+    """
+    with closing(store.open(key)) as raw, gzip.open(raw, "rt", encoding="utf-8") as lines:
+        trailer = None
+        for line in lines:
+            record = json.loads(line)
+            if _TRAILER in record:
+                trailer = record[_TRAILER]
+                continue
+            yield record
+    if trailer is None:
+        raise ValueError(f"Shard {key} is incomplete")
+    meta.update(trailer)
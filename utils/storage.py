@@ -0,0 +1,136 @@
+# utils/storage.py
+import logging
+import os
+import shutil
+import tempfile
+from utils.aws_helpers import get_client
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """Blob store backed by a local directory (also the test stand-in for S3)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return f"LocalStore({self.root!r})"
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def get(self, key):
+        """Return the object body as bytes, or None if it does not exist."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as handle:
+            return handle.read()
+
+    def put(self, key, data):
+        """
+        Write the object atomically so readers never see a partial file.
+        data is bytes or a binary file object, which is copied from its current position.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                if hasattr(data, "read"):
+                    shutil.copyfileobj(data, handle)
+                else:
+                    handle.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        """Remove the object if it exists."""
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def open(self, key):
+        """Open the object for streaming binary reads."""
+        return open(self._path(key), "rb")
+
+    def iter_keys(self, prefix=""):
+        """Yield keys under prefix in sorted order."""
+        base = self._path(prefix) if prefix else self.root
+        for directory, dirs, files in os.walk(base):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".tmp"):
+                    continue
+                relative = os.path.relpath(os.path.join(directory, name), self.root)
+                yield "/".join(relative.split(os.sep))
+
+
+class S3Store:
+    """Blob store backed by an S3 bucket and key prefix."""
+
+    def __init__(self, bucket, prefix="", client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = client
+
+    def __repr__(self):
+        return f"S3Store('s3://{self.bucket}/{self.prefix}')"
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client("s3")
+        return self._client
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key):
+        """Return the object body as bytes, or None if it does not exist."""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"].read()
+
+    def put(self, key, data):
+        """
+        Write the object body from bytes, or stream it from a binary file object
+        (multipart for large bodies) without reading it into memory.
+        """
+        if hasattr(data, "read"):
+            self.client.upload_fileobj(data, self.bucket, self._key(key))
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def delete(self, key):
+        """Remove the object; deleting a missing key is not an error in S3."""
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def open(self, key):
+        """Open the object for streaming binary reads."""
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def iter_keys(self, prefix=""):
+        """Yield keys under prefix (relative to the store prefix) in sorted order."""
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][strip:]
+
+
+def open_store(location):
+    """Open a blob store for an 's3://bucket/prefix' URI or a local directory path."""
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://"):].partition("/")
+        return S3Store(bucket, prefix)
+    return LocalStore(location)